@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Module to benchmark how many bytes per pixel fragments take up on the wire.
+
+Fragments are generated the way peers generate them today, with generate_pixels for pixel
+sets and generate_pixel_arrays for compact fragments, over a range of subcanvas sizes and
+palette limits. Each one is reported as pickled, as encoded by the codec, and as packed by each
+scheme of pixel_encoding.
+"""
+
+import pickle
+import random
+import sys
+import numpy as np
+from codec import codec, pixel_encoding
+from commission.artfragment import ArtFragment, CompactArtFragment
+from commission.artfragmentgenerator import (
+    Subcanvas,
+    generate_pixel_arrays,
+    generate_pixels,
+)
+from drawing.drawing import Constraint, Coordinates
+
+SUBCANVAS_SIZES = ((16, 16), (64, 64), (128, 96), (256, 256))
+PALETTE_LIMITS = (None, 2, 5, 16, 64)
+SCHEMES = ("delta", "runs", "bitmap")
+
+
+def generate_fragments(seed: int):
+    """
+    Generate one pixel set fragment and one compact fragment per size and palette limit.
+
+    Yields:
+        tuple: a description of the fragment and the fragment.
+    """
+    rng = random.Random(seed)
+    for width, height in SUBCANVAS_SIZES:
+        subcanvas = Subcanvas(Coordinates(100, 100), (width, height))
+        for palette_limit in PALETTE_LIMITS:
+            constraint = (
+                None if palette_limit is None else Constraint(palette_limit, "any")
+            )
+            name = f"{width}x{height} palette {palette_limit or 1}"
+            originator_id, contributor_id = rng.getrandbits(160), rng.getrandbits(160)
+            pixels = generate_pixels(
+                originator_id, contributor_id, subcanvas, constraint, rng=rng
+            )
+            yield f"{name} pixels", ArtFragment("artwork", "contributor", pixels)
+            arrays = generate_pixel_arrays(
+                originator_id,
+                contributor_id,
+                subcanvas,
+                constraint,
+                rng=np.random.default_rng(rng.getrandbits(64)),
+            )
+            yield (
+                f"{name} compact",
+                CompactArtFragment(
+                    "artwork",
+                    "contributor",
+                    arrays.xs,
+                    arrays.ys,
+                    tuple(arrays.palette),
+                    arrays.palette_indices,
+                ),
+            )
+
+
+def get_scheme_sizes(fragment) -> dict:
+    """Get the smallest packed size of each scheme, with or without zlib, for a fragment."""
+    body = codec.ENCODERS[type(fragment)][1](fragment)
+    _, _, palette, *packed = body
+    xs, ys, palette_indices = pixel_encoding.unpack_pixels(
+        pixel_encoding.PackedPixels(*packed), len(palette)
+    )
+    sizes = {}
+    for packing in pixel_encoding.generate_packings(
+        xs, ys, palette_indices, len(palette)
+    ):
+        scheme = pixel_encoding.get_scheme_name(packing.flags).split("+")[0]
+        size = pixel_encoding.get_packed_size(packing)
+        sizes[scheme] = min(size, sizes.get(scheme, size))
+    return sizes
+
+
+def main():
+    """Main function
+
+    Run the file with the following:
+    python3 -m codec.benchmark [seed]
+    """
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    columns = ("pickle", "codec", *SCHEMES)
+    print(f"{'fragment':<32}{'pixels':>8}" + "".join(f"{c:>9}" for c in columns))
+    print(f"{'':<32}{'':>8}{'bytes per pixel':>{9 * len(columns)}}")
+    for name, fragment in generate_fragments(seed):
+        if isinstance(fragment, CompactArtFragment):
+            num_pixels = len(fragment)
+        else:
+            num_pixels = len(fragment.pixels)
+        if num_pixels == 0:
+            continue
+        sizes = {
+            "pickle": len(pickle.dumps(fragment)),
+            "codec": len(codec.encode(fragment)),
+            **get_scheme_sizes(fragment),
+        }
+        print(
+            f"{name:<32}{num_pixels:>8}"
+            + "".join(
+                f"{sizes[c] / num_pixels:>9.3f}" if c in sizes else f"{'-':>9}"
+                for c in columns
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
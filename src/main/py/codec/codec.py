@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+"""
+Module to encode and decode the messages peers store on the network.
+
+Every message starts with a fixed size header holding the version, the message type, the id of
+the artwork the message is about, the time after which the message is of no use, and the size of
+the body. read_header reads it without touching the body, so peers can drop messages they have
+no use for before decoding them. The body is msgpack that lists the fields of the message in the
+order of its schema. Fragment pixels are packed with
+whichever encoding in pixel_encoding is smallest for them. Decoding only ever builds the
+message types below, so payloads from other peers cannot run code like pickle payloads can.
+"""
+
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+import struct
+import numpy as np
+import umsgpack
+from commission.artfragment import ArtFragment, CompactArtFragment, PrimitiveArtFragment
+from commission.artwork import Artwork
+from drawing.drawing import (
+    Color,
+    Constraint,
+    Coordinates,
+    Ellipse,
+    Line,
+    Pixel,
+    Polyline,
+    Rectangle,
+)
+from codec.pixel_encoding import PackedPixels, pack_pixels, unpack_pixels
+from exchange.offer_announcement import OfferAnnouncement
+from exchange.offer_response import OfferResponse
+from peer.ledger import Ledger
+
+VERSION = 3
+
+HEADER = struct.Struct("!BB20sdI")
+
+Header = namedtuple(
+    "Header", ["version", "message_type", "artwork_id", "deadline", "size"]
+)
+Header.__annotations__ = {
+    "version": int,
+    "message_type": int,
+    "artwork_id": bytes,
+    "deadline": datetime,
+    "size": int,
+}
+
+ARTWORK = 1
+ART_FRAGMENT = 2
+COMPACT_ART_FRAGMENT = 3
+PRIMITIVE_ART_FRAGMENT = 4
+OFFER_ANNOUNCEMENT = 5
+OFFER_RESPONSE = 6
+FRAGMENT_MESSAGE_TYPES = (ART_FRAGMENT, COMPACT_ART_FRAGMENT, PRIMITIVE_ART_FRAGMENT)
+
+ARTWORK_ID_LENGTH = 20
+NO_ARTWORK_ID = bytes(ARTWORK_ID_LENGTH)
+NO_DEADLINE = 0.0
+
+NODE_ID_LENGTH = 20
+
+# Canvases are at most this many pixels wide and high, and lines at most this many thick.
+MAX_COORDINATE = 1 << 16
+MAX_LINE_WIDTH = 1024
+
+PRIMITIVE_TAGS = {Rectangle: 0, Ellipse: 1, Line: 2, Polyline: 3}
+PRIMITIVE_TYPES = {
+    tag: primitive_type for primitive_type, tag in PRIMITIVE_TAGS.items()
+}
+
+
+def encode(message, deadline: datetime = None) -> bytes:
+    """
+    Encode a message for storing on the network.
+
+    Args:
+        message: an Artwork, ArtFragment, CompactArtFragment, PrimitiveArtFragment,
+            OfferAnnouncement or OfferResponse.
+        deadline: the time after which the message is of no use to anyone. Defaults to the
+            end time of an artwork that is not complete yet, and to no deadline otherwise.
+
+    Returns:
+        bytes: the encoded message.
+
+    Raises:
+        TypeError: if the message is not of a type that can be encoded.
+    """
+    try:
+        message_type, encode_body = ENCODERS[type(message)]
+    except KeyError as exc:
+        raise TypeError(f"Cannot encode message of type {type(message)}") from exc
+    try:
+        body = umsgpack.packb(encode_body(message))
+    except umsgpack.PackException as exc:
+        raise TypeError(f"Cannot encode fields of {type(message)}") from exc
+    if (
+        deadline is None
+        and isinstance(message, Artwork)
+        and not message.commission_complete
+    ):
+        deadline = message.end_time
+    return (
+        HEADER.pack(
+            VERSION,
+            message_type,
+            encode_artwork_id(get_artwork_id(message)),
+            NO_DEADLINE if deadline is None else deadline.timestamp(),
+            len(body),
+        )
+        + body
+    )
+
+
+def read_header(data: bytes) -> Header:
+    """
+    Read the header of an encoded message, without decoding its body.
+
+    Args:
+        data: the encoded message.
+
+    Returns:
+        Header: the header, with artwork_id and deadline set to None if the message has none.
+
+    Raises:
+        ValueError: if data does not start with a valid header.
+    """
+    if not isinstance(data, bytes) or len(data) < HEADER.size:
+        raise ValueError("Message is too short to hold a header")
+    version, message_type, artwork_id, deadline, size = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported message version {version}")
+    if message_type not in DECODERS:
+        raise ValueError(f"Unknown message type {message_type}")
+    if size != len(data) - HEADER.size:
+        raise ValueError("Message size does not match its header")
+    return Header(
+        version,
+        message_type,
+        None if artwork_id == NO_ARTWORK_ID else artwork_id,
+        None if deadline == NO_DEADLINE else decode_timestamp(deadline),
+        size,
+    )
+
+
+def decode_timestamp(seconds) -> datetime:
+    """
+    Decode a timestamp received from the network.
+
+    Raises:
+        ValueError: if the timestamp is not a number that datetime can represent.
+    """
+    try:
+        return datetime.fromtimestamp(seconds)
+    except (OverflowError, OSError, TypeError) as exc:
+        raise ValueError(f"Invalid timestamp {seconds!r}") from exc
+
+
+def get_message_type(data: bytes):
+    """
+    Get the type tag of an encoded message from its header.
+
+    Returns:
+        int: the type tag, or None if data does not start with a valid header.
+    """
+    try:
+        return read_header(data).message_type
+    except ValueError:
+        return None
+
+
+def decode(data: bytes):
+    """
+    Decode a message that was encoded with encode.
+
+    Args:
+        data: the encoded message.
+
+    Returns:
+        the decoded message.
+
+    Raises:
+        ValueError: if data is not a valid encoded message.
+    """
+    message_type = read_header(data).message_type
+    try:
+        body = umsgpack.unpackb(data[HEADER.size :])
+        return DECODERS[message_type](body)
+    except (
+        umsgpack.UnpackException,
+        TypeError,
+        IndexError,
+        KeyError,
+        OverflowError,
+    ) as exc:
+        raise ValueError(f"Malformed message of type {message_type}") from exc
+
+
+def get_artwork_id(message) -> bytes:
+    """Get the id of the artwork a message is about, or None if it is about none."""
+    if isinstance(message, Artwork):
+        return message.key
+    if isinstance(message, (OfferAnnouncement, OfferResponse)):
+        return None if message.artwork is None else message.artwork.key
+    return message.artwork_id
+
+
+def encode_artwork_id(artwork_id) -> bytes:
+    """
+    Encode an artwork id for the header.
+
+    Artwork keys are SHA-1 hashes, anything that is not one is left out of the header.
+    """
+    if isinstance(artwork_id, bytes) and len(artwork_id) == ARTWORK_ID_LENGTH:
+        return artwork_id
+    return NO_ARTWORK_ID
+
+
+def encode_long_id(long_id: int) -> bytes:
+    """Encode a node's long id, which does not fit a msgpack integer, as bytes."""
+    return None if long_id is None else long_id.to_bytes(NODE_ID_LENGTH, "big")
+
+
+def decode_long_id(data: bytes) -> int:
+    """Decode a node's long id encoded with encode_long_id."""
+    return None if data is None else int.from_bytes(data, "big")
+
+
+def restore(cls, **attributes):
+    """
+    Create an instance of cls with the given attributes, without calling its __init__.
+
+    Used for classes whose __init__ draws fresh keys or timestamps.
+    """
+    instance = cls.__new__(cls)
+    instance.__dict__.update(attributes)
+    return instance
+
+
+def encode_ledger(ledger: Ledger) -> list:
+    """Encode the body of a Ledger."""
+    return [[list(entry) for entry in ledger.queue], ledger.top]
+
+
+def decode_ledger(body: list) -> Ledger:
+    """Decode the body of a Ledger."""
+    queue, top = body
+    return restore(
+        Ledger,
+        queue=deque((str(owner), bytes(digest)) for owner, digest in queue),
+        top=top,
+    )
+
+
+def encode_artwork(artwork: Artwork) -> list:
+    """Encode the body of an Artwork."""
+    constraint = artwork.constraint
+    return [
+        artwork.width,
+        artwork.height,
+        artwork.wait_time.total_seconds(),
+        artwork.commission_complete,
+        None
+        if constraint is None
+        else [constraint.palette_limit, constraint.line_type],
+        artwork.key,
+        artwork.end_time.timestamp(),
+        artwork.originator_public_key,
+        encode_long_id(artwork.originator_long_id),
+        None if artwork.ledger is None else encode_ledger(artwork.ledger),
+    ]
+
+
+def decode_artwork(body: list) -> Artwork:
+    """Decode the body of an Artwork."""
+    (
+        width,
+        height,
+        wait_time,
+        commission_complete,
+        constraint,
+        key,
+        end_time,
+        originator_public_key,
+        originator_long_id,
+        ledger,
+    ) = body
+    return restore(
+        Artwork,
+        width=decode_dimension(width),
+        height=decode_dimension(height),
+        wait_time=timedelta(seconds=wait_time),
+        commission_complete=bool(commission_complete),
+        constraint=None if constraint is None else Constraint(*constraint),
+        key=key,
+        end_time=decode_timestamp(end_time),
+        originator_public_key=originator_public_key,
+        originator_long_id=decode_long_id(originator_long_id),
+        ledger=None if ledger is None else decode_ledger(ledger),
+    )
+
+
+def encode_fragment_pixels(
+    fragment, xs: np.ndarray, ys: np.ndarray, palette: list, palette_indices: np.ndarray
+) -> list:
+    """Encode the body of a pixel fragment, with its pixels packed by pack_pixels."""
+    packed = pack_pixels(xs, ys, palette_indices, len(palette))
+    return [
+        fragment.artwork_id,
+        fragment.contributor_id,
+        [list(color) for color in palette],
+        *packed,
+    ]
+
+
+def decode_fragment_pixels(body: list) -> tuple:
+    """Decode the body of a pixel fragment into its ids, coordinates, palette and indices."""
+    artwork_id, contributor_id, palette, *packed = body
+    palette = tuple(decode_color(color) for color in palette)
+    packed = PackedPixels(*packed)
+    if max(packed.left + packed.width, packed.top + packed.height) > MAX_COORDINATE:
+        raise ValueError("Pixel coordinates out of range")
+    xs, ys, palette_indices = unpack_pixels(packed, len(palette))
+    return artwork_id, contributor_id, xs, ys, palette, palette_indices
+
+
+def decode_color(body: list) -> Color:
+    """
+    Decode a color, checking that it has four channels from 0 to 255.
+
+    Raises:
+        ValueError: if it does not.
+    """
+    if len(body) != len(Color._fields) or not all(
+        isinstance(channel, int) and 0 <= channel <= 255 for channel in body
+    ):
+        raise ValueError(f"Invalid color {body!r}")
+    return Color(*body)
+
+
+def decode_coordinates(body: list) -> Coordinates:
+    """
+    Decode the coordinates of a drawing primitive, checking that they are numbers in range.
+
+    Raises:
+        ValueError: if they are not.
+    """
+    if len(body) != len(Coordinates._fields) or not all(
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and -MAX_COORDINATE <= value <= MAX_COORDINATE
+        for value in body
+    ):
+        raise ValueError(f"Invalid coordinates {body!r}")
+    return Coordinates(*body)
+
+
+def decode_line_width(width) -> int:
+    """
+    Decode the width of a line, checking that it is a positive int of at most MAX_LINE_WIDTH.
+
+    Raises:
+        ValueError: if it is not.
+    """
+    if (
+        not isinstance(width, int)
+        or isinstance(width, bool)
+        or not 0 < width <= MAX_LINE_WIDTH
+    ):
+        raise ValueError(f"Invalid line width {width!r}")
+    return width
+
+
+def decode_dimension(size) -> int:
+    """
+    Decode the width or height of a canvas, checking that it is a positive int of at most
+    MAX_COORDINATE.
+
+    Raises:
+        ValueError: if it is not.
+    """
+    if (
+        not isinstance(size, int)
+        or isinstance(size, bool)
+        or not 0 < size <= MAX_COORDINATE
+    ):
+        raise ValueError(f"Invalid canvas dimension {size!r}")
+    return size
+
+
+def decode_price(price) -> int:
+    """
+    Decode the price of an exchange, checking that it is an int of at least 0.
+
+    Raises:
+        ValueError: if it is not.
+    """
+    if not isinstance(price, int) or isinstance(price, bool) or price < 0:
+        raise ValueError(f"Invalid price {price!r}")
+    return price
+
+
+def check_canvas_bounds(fragment, width: int, height: int) -> None:
+    """
+    Check that the pixels of a fragment lie on a canvas of width by height pixels.
+
+    Primitives are clipped to the canvas as they are drawn, so they are not checked.
+
+    Raises:
+        ValueError: if a pixel lies outside the canvas.
+    """
+    if isinstance(fragment, CompactArtFragment):
+        xs, ys = fragment.xs, fragment.ys
+    elif isinstance(fragment, ArtFragment):
+        xs = [pixel.coordinates.x for pixel in fragment.pixels]
+        ys = [pixel.coordinates.y for pixel in fragment.pixels]
+    else:
+        return
+    if len(xs) > 0 and (max(xs) >= width or max(ys) >= height):
+        raise ValueError("Fragment does not fit the canvas")
+
+
+def encode_art_fragment(fragment: ArtFragment) -> list:
+    """Encode the body of an ArtFragment, indexing its colors into a palette."""
+    pixels = list(fragment.pixels)
+    palette = list(dict.fromkeys(pixel.color for pixel in pixels))
+    palette_positions = {color: position for position, color in enumerate(palette)}
+    return encode_fragment_pixels(
+        fragment,
+        np.fromiter((pixel.coordinates.x for pixel in pixels), np.int64, len(pixels)),
+        np.fromiter((pixel.coordinates.y for pixel in pixels), np.int64, len(pixels)),
+        palette,
+        np.fromiter(
+            (palette_positions[pixel.color] for pixel in pixels),
+            np.int64,
+            len(pixels),
+        ),
+    )
+
+
+def decode_art_fragment(body: list) -> ArtFragment:
+    """Decode the body of an ArtFragment."""
+    (
+        artwork_id,
+        contributor_id,
+        xs,
+        ys,
+        palette,
+        palette_indices,
+    ) = decode_fragment_pixels(body)
+    return ArtFragment(
+        artwork_id,
+        contributor_id,
+        frozenset(
+            Pixel(Coordinates(x, y), palette[index])
+            for x, y, index in zip(xs.tolist(), ys.tolist(), palette_indices.tolist())
+        ),
+    )
+
+
+def encode_compact_art_fragment(fragment: CompactArtFragment) -> list:
+    """Encode the body of a CompactArtFragment."""
+    return encode_fragment_pixels(
+        fragment, fragment.xs, fragment.ys, fragment.palette, fragment.palette_indices
+    )
+
+
+def decode_compact_art_fragment(body: list) -> CompactArtFragment:
+    """Decode the body of a CompactArtFragment."""
+    (
+        artwork_id,
+        contributor_id,
+        xs,
+        ys,
+        palette,
+        palette_indices,
+    ) = decode_fragment_pixels(body)
+    if palette_indices.dtype != np.uint8:
+        raise ValueError("Compact fragment palette is too large")
+    return CompactArtFragment(
+        artwork_id, contributor_id, xs, ys, palette, palette_indices
+    )
+
+
+def encode_primitive(primitive) -> list:
+    """Encode a drawing primitive as its tag followed by its fields."""
+    if isinstance(primitive, Polyline):
+        fields = [[list(point) for point in primitive.points], *primitive[1:]]
+    else:
+        fields = [
+            list(field) if isinstance(field, tuple) else field for field in primitive
+        ]
+    return [PRIMITIVE_TAGS[type(primitive)], *fields]
+
+
+def decode_primitive(body: list):
+    """Decode a drawing primitive encoded with encode_primitive."""
+    tag, *fields = body
+    if tag not in PRIMITIVE_TYPES:
+        raise ValueError(f"Unknown primitive tag {tag}")
+    primitive_type = PRIMITIVE_TYPES[tag]
+    if primitive_type is Polyline:
+        points, color, width = fields
+        return Polyline(
+            tuple(decode_coordinates(point) for point in points),
+            decode_color(color),
+            decode_line_width(width),
+        )
+    if primitive_type is Line:
+        start, end, color, width = fields
+        return Line(
+            decode_coordinates(start),
+            decode_coordinates(end),
+            decode_color(color),
+            decode_line_width(width),
+        )
+    top_left, bottom_right, color = fields
+    return primitive_type(
+        decode_coordinates(top_left),
+        decode_coordinates(bottom_right),
+        decode_color(color),
+    )
+
+
+def encode_primitive_art_fragment(fragment: PrimitiveArtFragment) -> list:
+    """Encode the body of a PrimitiveArtFragment."""
+    return [
+        fragment.artwork_id,
+        fragment.contributor_id,
+        [encode_primitive(primitive) for primitive in fragment.primitives],
+    ]
+
+
+def decode_primitive_art_fragment(body: list) -> PrimitiveArtFragment:
+    """Decode the body of a PrimitiveArtFragment."""
+    artwork_id, contributor_id, primitives = body
+    return PrimitiveArtFragment(
+        artwork_id,
+        contributor_id,
+        tuple(decode_primitive(primitive) for primitive in primitives),
+    )
+
+
+def encode_offer_announcement(announcement: OfferAnnouncement) -> list:
+    """Encode the body of an OfferAnnouncement."""
+    return [
+        encode_artwork(announcement.artwork),
+        announcement.price,
+        announcement.exchange_type,
+        announcement.originator_public_key,
+        announcement.deadline_reached,
+    ]
+
+
+def decode_offer_announcement(body: list) -> OfferAnnouncement:
+    """Decode the body of an OfferAnnouncement."""
+    artwork, price, exchange_type, originator_public_key, deadline_reached = body
+    return restore(
+        OfferAnnouncement,
+        artwork=decode_artwork(artwork),
+        price=decode_price(price),
+        exchange_type=exchange_type,
+        originator_public_key=originator_public_key,
+        deadline_reached=bool(deadline_reached),
+    )
+
+
+def encode_offer_response(response: OfferResponse) -> list:
+    """Encode the body of an OfferResponse."""
+    return [
+        response.exchange_id,
+        None if response.artwork is None else encode_artwork(response.artwork),
+        response.price,
+        response.exchange_type,
+        response.public_key,
+    ]
+
+
+def decode_offer_response(body: list) -> OfferResponse:
+    """Decode the body of an OfferResponse."""
+    exchange_id, artwork, price, exchange_type, public_key = body
+    return restore(
+        OfferResponse,
+        exchange_id=exchange_id,
+        artwork=None if artwork is None else decode_artwork(artwork),
+        price=decode_price(price),
+        exchange_type=exchange_type,
+        public_key=public_key,
+    )
+
+
+ENCODERS = {
+    Artwork: (ARTWORK, encode_artwork),
+    ArtFragment: (ART_FRAGMENT, encode_art_fragment),
+    CompactArtFragment: (COMPACT_ART_FRAGMENT, encode_compact_art_fragment),
+    PrimitiveArtFragment: (PRIMITIVE_ART_FRAGMENT, encode_primitive_art_fragment),
+    OfferAnnouncement: (OFFER_ANNOUNCEMENT, encode_offer_announcement),
+    OfferResponse: (OFFER_RESPONSE, encode_offer_response),
+}
+
+DECODERS = {
+    ARTWORK: decode_artwork,
+    ART_FRAGMENT: decode_art_fragment,
+    COMPACT_ART_FRAGMENT: decode_compact_art_fragment,
+    PRIMITIVE_ART_FRAGMENT: decode_primitive_art_fragment,
+    OFFER_ANNOUNCEMENT: decode_offer_announcement,
+    OFFER_RESPONSE: decode_offer_response,
+}
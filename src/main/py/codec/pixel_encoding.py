@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Module to pack the pixels of a fragment into as few bytes as possible.
+
+Pixels are turned into linear indices within their bounding box and sorted. The linear indices
+are then stored in one of three ways, as deltas between neighbours, as runs of consecutive
+indices, or as a bitmap over the bounding box. Palette indices are bit packed in the same
+order. Each candidate is tried with and without zlib, and the smallest one wins. Which one won
+is recorded in a flags byte so the pixels can be unpacked again.
+"""
+
+from collections import namedtuple
+import math
+import zlib
+import numpy as np
+
+DELTA = 0
+RUNS = 1
+BITMAP = 2
+SCHEME_NAMES = {DELTA: "delta", RUNS: "runs", BITMAP: "bitmap"}
+
+SCHEME_MASK = 0b11
+LINEAR_TYPE_SHIFT = 2
+LINEAR_TYPE_MASK = 0b11
+INDEX_BITS_SHIFT = 4
+INDEX_BITS_MASK = 0b111
+ZLIB = 0b10000000
+
+LINEAR_TYPES = (np.dtype("<u1"), np.dtype("<u2"), np.dtype("<u4"), np.dtype("<u8"))
+INDEX_BITS = (1, 2, 4, 8, 16, 32)
+INDEX_TYPES = {8: np.dtype("u1"), 16: np.dtype("<u2"), 32: np.dtype("<u4")}
+
+MAX_BITMAP_BITS_PER_PIXEL = 64
+
+PackedPixels = namedtuple(
+    "PackedPixels",
+    [
+        "flags",
+        "left",
+        "top",
+        "width",
+        "height",
+        "count",
+        "coordinates",
+        "palette_indices",
+    ],
+)
+PackedPixels.__annotations__ = {
+    "flags": int,
+    "left": int,
+    "top": int,
+    "width": int,
+    "height": int,
+    "count": int,
+    "coordinates": bytes,
+    "palette_indices": bytes,
+}
+
+
+def pack_pixels(
+    xs: np.ndarray, ys: np.ndarray, palette_indices: np.ndarray, palette_size: int
+) -> PackedPixels:
+    """
+    Pack pixels with whichever encoding turns out smallest.
+
+    Args:
+        xs: x coordinates of the pixels.
+        ys: y coordinates of the pixels.
+        palette_indices: palette index of each pixel.
+        palette_size: number of colors in the palette the indices point into.
+
+    Returns:
+        PackedPixels: the smallest packing of the pixels.
+    """
+    return min(
+        generate_packings(xs, ys, palette_indices, palette_size), key=get_packed_size
+    )
+
+
+def generate_packings(
+    xs: np.ndarray, ys: np.ndarray, palette_indices: np.ndarray, palette_size: int
+):
+    """
+    Generate every packing that can represent the given pixels.
+
+    Args:
+        xs: x coordinates of the pixels.
+        ys: y coordinates of the pixels.
+        palette_indices: palette index of each pixel.
+        palette_size: number of colors in the palette the indices point into.
+
+    Yields:
+        PackedPixels: each candidate packing, with and without zlib.
+    """
+    bounds, linear, order = get_sorted_linear(xs, ys)
+
+    index_bits = get_index_bits(palette_size)
+    indices = pack_indices(np.asarray(palette_indices)[order], index_bits)
+    compressed_indices = zlib.compress(indices)
+
+    for scheme, linear_type, coordinates in encode_linear(
+        linear, bounds[2] * bounds[3]
+    ):
+        flags = (
+            scheme
+            | linear_type << LINEAR_TYPE_SHIFT
+            | INDEX_BITS.index(index_bits) << INDEX_BITS_SHIFT
+        )
+        yield PackedPixels(flags, *bounds, len(linear), coordinates, indices)
+        yield PackedPixels(
+            flags | ZLIB,
+            *bounds,
+            len(linear),
+            zlib.compress(coordinates),
+            compressed_indices,
+        )
+
+
+def unpack_pixels(packed: PackedPixels, palette_size: int) -> tuple:
+    """
+    Unpack pixels packed with pack_pixels.
+
+    Args:
+        packed: the packed pixels.
+        palette_size: number of colors in the palette the indices point into.
+
+    Returns:
+        tuple: x coordinates, y coordinates and palette indices of the pixels.
+
+    Raises:
+        ValueError: if the packed pixels are inconsistent.
+    """
+    flags, left, top, width, height, count, coordinates, indices = packed
+    index_bits_code = flags >> INDEX_BITS_SHIFT & INDEX_BITS_MASK
+    if flags & SCHEME_MASK not in SCHEME_NAMES or index_bits_code >= len(INDEX_BITS):
+        raise ValueError(f"Unsupported pixel packing flags {flags}")
+    if min(left, top, width, height, count) < 0:
+        raise ValueError("Negative pixel bounds")
+    index_bits = INDEX_BITS[index_bits_code]
+
+    if flags & ZLIB:
+        indices = inflate(indices, math.ceil(count * index_bits / 8))
+    palette_indices = unpack_indices(indices, index_bits, count)
+    if count > 0 and palette_indices.max() >= palette_size:
+        raise ValueError("Pixel palette index out of range")
+
+    linear = decode_linear(flags, coordinates, count, width * height)
+    coordinate_type = np.min_scalar_type(max(left + width, top + height))
+    return (
+        (linear % max(width, 1) + left).astype(coordinate_type),
+        (linear // max(width, 1) + top).astype(coordinate_type),
+        palette_indices,
+    )
+
+
+def get_sorted_linear(xs: np.ndarray, ys: np.ndarray) -> tuple:
+    """
+    Turn coordinates into sorted linear indices within their bounding box.
+
+    Returns:
+        tuple: the left, top, width and height of the bounding box, the sorted linear indices
+            and the order that sorts the coordinates.
+    """
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    if len(xs) == 0:
+        return (0, 0, 0, 0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    left, top = int(xs.min()), int(ys.min())
+    width = int(xs.max()) - left + 1
+    linear = (ys - top) * width + (xs - left)
+    order = np.argsort(linear, kind="stable")
+    return (left, top, width, int(ys.max()) - top + 1), linear[order], order
+
+
+def encode_linear(linear: np.ndarray, area: int) -> list:
+    """
+    Encode sorted linear indices in every scheme that can represent them.
+
+    Bitmaps and runs cannot hold an index twice, so only deltas are offered for duplicates.
+
+    Returns:
+        list: (scheme, position in LINEAR_TYPES, encoded bytes) for each scheme.
+    """
+    encodings = [(DELTA, *encode_deltas(linear))]
+    if len(linear) > 0 and np.all(np.diff(linear) > 0):
+        encodings.append((RUNS, *encode_runs(linear)))
+        if area <= MAX_BITMAP_BITS_PER_PIXEL * len(linear):
+            encodings.append((BITMAP, 0, encode_bitmap(linear, area)))
+    return encodings
+
+
+def decode_linear(flags: int, data: bytes, count: int, area: int) -> np.ndarray:
+    """
+    Decode linear indices encoded by encode_linear in the scheme recorded in flags.
+
+    Raises:
+        ValueError: if the encoded indices do not match count and area.
+    """
+    scheme = flags & SCHEME_MASK
+    linear_type = LINEAR_TYPES[flags >> LINEAR_TYPE_SHIFT & LINEAR_TYPE_MASK]
+    if scheme == BITMAP:
+        if area > MAX_BITMAP_BITS_PER_PIXEL * count:
+            raise ValueError("Bitmap is too sparse for its pixel count")
+        if flags & ZLIB:
+            data = inflate(data, math.ceil(area / 8))
+        linear = decode_bitmap(data, area)
+    elif scheme == RUNS:
+        if flags & ZLIB:
+            data = inflate(data, 2 * count * linear_type.itemsize)
+        linear = decode_runs(np.frombuffer(data, dtype=linear_type), count)
+    else:
+        if flags & ZLIB:
+            data = inflate(data, count * linear_type.itemsize)
+        linear = np.cumsum(np.frombuffer(data, dtype=linear_type), dtype=np.int64)
+    if len(linear) != count:
+        raise ValueError("Pixel count does not match coordinates")
+    if count > 0 and (linear.min() < 0 or linear.max() >= area):
+        raise ValueError("Pixel coordinates out of bounds")
+    return linear
+
+
+def get_packed_size(packed: PackedPixels) -> int:
+    """Get the number of bytes the variable parts of packed pixels take up."""
+    return len(packed.coordinates) + len(packed.palette_indices)
+
+
+def get_scheme_name(flags: int) -> str:
+    """Get a readable name for the packing recorded in flags."""
+    name = SCHEME_NAMES.get(flags & SCHEME_MASK, "unknown")
+    return f"{name}+zlib" if flags & ZLIB else name
+
+
+def get_index_bits(palette_size: int) -> int:
+    """Get the fewest bits, out of INDEX_BITS, that hold any index into the palette."""
+    for bits in INDEX_BITS:
+        if palette_size <= 1 << bits:
+            return bits
+    raise ValueError(f"Palette of {palette_size} colors is too large")
+
+
+def get_linear_type(max_value: int) -> int:
+    """Get the position in LINEAR_TYPES of the smallest type that holds max_value."""
+    for position, linear_type in enumerate(LINEAR_TYPES):
+        if max_value <= np.iinfo(linear_type).max:
+            return position
+    raise ValueError(f"Linear index {max_value} is too large")
+
+
+def encode_deltas(linear: np.ndarray) -> tuple:
+    """Encode sorted linear indices as differences to their predecessors."""
+    deltas = np.diff(linear, prepend=0)
+    linear_type = get_linear_type(int(deltas.max()) if len(deltas) > 0 else 0)
+    return linear_type, deltas.astype(LINEAR_TYPES[linear_type]).tobytes()
+
+
+def encode_runs(linear: np.ndarray) -> tuple:
+    """Encode sorted, distinct linear indices as (gap, length) pairs of consecutive runs."""
+    boundaries = np.flatnonzero(np.diff(linear) != 1) + 1
+    starts = linear[np.r_[0, boundaries]]
+    ends = linear[np.r_[boundaries - 1, len(linear) - 1]] + 1
+    gaps = starts - np.r_[0, ends[:-1]]
+    values = np.column_stack([gaps, ends - starts]).ravel()
+    linear_type = get_linear_type(int(values.max()))
+    return linear_type, values.astype(LINEAR_TYPES[linear_type]).tobytes()
+
+
+def decode_runs(values: np.ndarray, count: int) -> np.ndarray:
+    """Decode linear indices encoded with encode_runs."""
+    if len(values) % 2 != 0:
+        raise ValueError("Runs are not made of pairs")
+    gaps, lengths = values.reshape(-1, 2).astype(np.int64).T
+    if lengths.sum() != count:
+        raise ValueError("Pixel count does not match runs")
+    ends = np.cumsum(gaps + lengths)
+    starts = ends - lengths
+    preceding = np.cumsum(lengths) - lengths
+    return np.arange(count, dtype=np.int64) + np.repeat(starts - preceding, lengths)
+
+
+def encode_bitmap(linear: np.ndarray, area: int) -> bytes:
+    """Encode distinct linear indices as a bitmap over the whole bounding box."""
+    mask = np.zeros(area, dtype=bool)
+    mask[linear] = True
+    return np.packbits(mask, bitorder="little").tobytes()
+
+
+def decode_bitmap(data: bytes, area: int) -> np.ndarray:
+    """Decode linear indices encoded with encode_bitmap."""
+    if len(data) != math.ceil(area / 8):
+        raise ValueError("Bitmap does not match its bounding box")
+    bits = np.unpackbits(
+        np.frombuffer(data, dtype=np.uint8), count=area, bitorder="little"
+    )
+    return np.flatnonzero(bits)
+
+
+def pack_indices(indices: np.ndarray, bits: int) -> bytes:
+    """Pack palette indices into bits bits each, several to a byte below 8 bits."""
+    if bits >= 8:
+        return indices.astype(INDEX_TYPES[bits]).tobytes()
+    per_byte = 8 // bits
+    padded = np.zeros(math.ceil(len(indices) / per_byte) * per_byte, dtype=np.uint8)
+    padded[: len(indices)] = indices
+    shifts = np.arange(per_byte, dtype=np.uint8) * bits
+    grouped = padded.reshape(-1, per_byte) << shifts
+    return np.bitwise_or.reduce(grouped, axis=1).astype(np.uint8).tobytes()
+
+
+def unpack_indices(data: bytes, bits: int, count: int) -> np.ndarray:
+    """Unpack count palette indices packed with pack_indices."""
+    if len(data) != math.ceil(count * bits / 8):
+        raise ValueError("Palette indices do not match pixel count")
+    if bits >= 8:
+        return np.frombuffer(data, dtype=INDEX_TYPES[bits])
+    per_byte = 8 // bits
+    shifts = np.arange(per_byte, dtype=np.uint8) * bits
+    packed = np.frombuffer(data, dtype=np.uint8)
+    unpacked = packed[:, np.newaxis] >> shifts & ((1 << bits) - 1)
+    return unpacked.ravel()[:count].astype(np.uint8)
+
+
+def inflate(data: bytes, max_length: int) -> bytes:
+    """Decompress zlib data that must not inflate beyond max_length bytes."""
+    decompressor = zlib.decompressobj()
+    try:
+        inflated = decompressor.decompress(data, max_length)
+    except zlib.error as exc:
+        raise ValueError("Invalid compressed pixels") from exc
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("Compressed pixels inflate beyond their expected size")
+    return inflated
@@ -6,8 +6,10 @@ ArtFragment class allows us to instantiate a fragment for an Artwork instance
 """
 
 import logging
+from collections.abc import Iterator
 from dataclasses import dataclass
-from drawing.drawing import Pixel
+import numpy as np
+from drawing.drawing import Color, Coordinates, Pixel
 
 
 @dataclass(frozen=True)
@@ -24,3 +26,70 @@ class ArtFragment:
     pixels: frozenset[Pixel]
 
     logger = logging.getLogger("ArtFragment")
+
+
+@dataclass(frozen=True, eq=False)
+class CompactArtFragment:
+    """
+    Class to create a columnar ArtFragment backed by packed arrays
+    - artwork_id: ID of Artwork that fragment is contributing to.
+    - contributor_id: signing key of the peer that is contributing to the artwork.
+    - xs: x coordinate of every pixel.
+    - ys: y coordinate of every pixel.
+    - palette: colors that the fragment draws with.
+    - palette_indices: index into palette of every pixel's color.
+    """
+
+    artwork_id: str
+    contributor_id: str
+    xs: np.ndarray
+    ys: np.ndarray
+    palette: tuple[Color, ...]
+    palette_indices: np.ndarray
+
+    logger = logging.getLogger("CompactArtFragment")
+
+    def __post_init__(self):
+        """Make the backing arrays read-only, as the fragment itself is frozen."""
+        for array in (self.xs, self.ys, self.palette_indices):
+            array.setflags(write=False)
+
+    def __len__(self) -> int:
+        """Returns the number of pixels in the fragment."""
+        return len(self.xs)
+
+    @property
+    def pixels(self) -> Iterator[Pixel]:
+        """
+        Iterates over the fragment as pixels, for consumers of ArtFragment.pixels.
+        """
+        palette = [Color(*color) for color in self.palette]
+        for x, y, index in zip(
+            self.xs.tolist(), self.ys.tolist(), self.palette_indices.tolist()
+        ):
+            yield Pixel(Coordinates(x, y), palette[index])
+
+    def colors(self) -> np.ndarray:
+        """
+        Returns the RGBA color of every pixel as an array of shape (len(self), 4).
+        """
+        return np.asarray(self.palette, dtype=np.uint8)[self.palette_indices]
+
+
+@dataclass(frozen=True)
+class PrimitiveArtFragment:
+    """
+    Class to create an ArtFragment made of drawing primitives
+    - artwork_id: ID of Artwork that fragment is contributing to.
+    - contributor_id: signing key of the peer that is contributing to the artwork.
+    - primitives: Rectangle, Ellipse, Line and Polyline instances, drawn in order.
+    """
+
+    artwork_id: str
+    contributor_id: str
+    primitives: tuple
+
+    logger = logging.getLogger("PrimitiveArtFragment")
+
+
+FRAGMENT_TYPES = (ArtFragment, CompactArtFragment, PrimitiveArtFragment)
@@ -5,26 +5,71 @@ Module to manage ArtFragmentGenerator
 ArtFragmentGenerator class allows us to create an instance of ArtFragment
 """
 
+import functools
 import logging
+import math
 import random
-from random import randrange
 from collections import namedtuple
+from collections.abc import Iterator
+import numpy as np
 from commission.artwork import Artwork
-from commission.artfragment import ArtFragment
-from drawing.drawing import Coordinates, Pixel, Constraint, Color
+from commission.artfragment import (
+    ArtFragment,
+    CompactArtFragment,
+    PrimitiveArtFragment,
+)
+from drawing.drawing import (
+    Color,
+    Constraint,
+    Coordinates,
+    Ellipse,
+    Line,
+    Pixel,
+    Polyline,
+    Rectangle,
+)
 
 Subcanvas = namedtuple("SubCanvas", ["coordinates", "dimensions"])
 Subcanvas.__annotations__ = {"coordinates": Coordinates, "dimensions": tuple[int, int]}
 
+PixelArrays = namedtuple("PixelArrays", ["xs", "ys", "palette_indices", "palette"])
+PixelArrays.__annotations__ = {
+    "xs": np.ndarray,
+    "ys": np.ndarray,
+    "palette_indices": np.ndarray,
+    "palette": list[Color],
+}
+
+FragmentTile = namedtuple("FragmentTile", ["subcanvas", "num_pixels", "seed"])
+FragmentTile.__annotations__ = {"subcanvas": Subcanvas, "num_pixels": int, "seed": int}
+
+PALETTE_CACHE_SIZE = 256
+
+DEFAULT_TILE_SIZE = 128
+
+MAX_PRIMITIVES = 8
+MAX_POLYLINE_POINTS = 8
+MAX_LINE_WIDTH = 3
+
+LINE_TYPE_PRIMITIVES = {
+    "straight": (Rectangle, Line, Polyline),
+    "curved": (Ellipse,),
+    "any": (Rectangle, Ellipse, Line, Polyline),
+}
+
 logger = logging.getLogger("ArtFragmentGenerator")
 
 
+# pylint: disable=too-many-arguments
 def generate_fragment(
     artwork: Artwork,
     originator_id: int,
     contributor_signing_key: str,
     contributor_id: int,
-) -> ArtFragment:
+    batched: bool = False,
+    rng: random.Random = None,
+    max_pixels: int = None,
+) -> ArtFragment | CompactArtFragment:
     """Generates an ArtFragment instance
 
     Args:
@@ -32,18 +77,74 @@ def generate_fragment(
         originator_id: ID of the peer that commissioned the artwork.
         contributor_signing_key: signing key of the peer that is contributing to the artwork.
         contributor_id: ID of the peer that is contributing to the artwork.
+        batched: draw all pixels in one batch with generate_pixel_arrays and return a
+            CompactArtFragment. Defaults to False.
+        rng: random number generator that all random draws of this fragment come from.
+            Defaults to a freshly seeded one, so concurrent calls never share state.
+        max_pixels: the largest subcanvas area to draw pixels in, to bound the time spent
+            generating. Defaults to None for no limit.
 
     Returns:
-        ArtFragment: art fragment that adheres to artwork's constraint.
+        ArtFragment | CompactArtFragment: art fragment that adheres to artwork's constraint.
     """
+    if rng is None:
+        rng = random.Random()
     constraint = artwork.constraint
-    subcanvas = generate_subcanvas(artwork.width, artwork.height)
+    subcanvas = generate_subcanvas(artwork.width, artwork.height, rng, max_pixels)
+
+    if batched:
+        pixel_arrays = generate_pixel_arrays(
+            originator_id,
+            contributor_id,
+            subcanvas,
+            constraint,
+            np.random.default_rng(rng.getrandbits(64)),
+        )
+        return CompactArtFragment(
+            artwork.get_key(),
+            contributor_signing_key,
+            pixel_arrays.xs,
+            pixel_arrays.ys,
+            tuple(pixel_arrays.palette),
+            pixel_arrays.palette_indices,
+        )
 
-    pixels = generate_pixels(originator_id, contributor_id, subcanvas, constraint)
+    pixels = generate_pixels(originator_id, contributor_id, subcanvas, constraint, rng)
     fragment = ArtFragment(artwork.get_key(), contributor_signing_key, pixels)
     return fragment
 
 
+def generate_primitive_fragment(
+    artwork: Artwork,
+    originator_id: int,
+    contributor_signing_key: str,
+    contributor_id: int,
+    rng: random.Random = None,
+) -> PrimitiveArtFragment:
+    """Generates a PrimitiveArtFragment instance
+
+    Args:
+        artwork: Artwork that the ArtFragment is intended for.
+        originator_id: ID of the peer that commissioned the artwork.
+        contributor_signing_key: signing key of the peer that is contributing to the artwork.
+        contributor_id: ID of the peer that is contributing to the artwork.
+        rng: random number generator that all random draws of this fragment come from.
+            Defaults to a freshly seeded one.
+
+    Returns:
+        PrimitiveArtFragment: art fragment that adheres to artwork's constraint.
+    """
+    if rng is None:
+        rng = random.Random()
+    subcanvas = generate_subcanvas(artwork.width, artwork.height, rng)
+    primitives = generate_primitives(
+        originator_id, contributor_id, subcanvas, artwork.constraint, rng
+    )
+    return PrimitiveArtFragment(
+        artwork.get_key(), contributor_signing_key, tuple(primitives)
+    )
+
+
 def get_bounds(coordinates: Coordinates, width: int, height: int) -> tuple[int, int]:
     """Get bounds of how big a subcanvas can be.
 
@@ -56,23 +157,35 @@ def get_bounds(coordinates: Coordinates, width: int, height: int) -> tuple[int,
     return bounds
 
 
-def generate_subcanvas(width: int, height: int) -> Subcanvas:
+def generate_subcanvas(
+    width: int, height: int, rng: random.Random = None, max_area: int = None
+) -> Subcanvas:
     """Generates starting (x,y) coordinates with width and height within bounds of the artwork.
 
     Args:
         width: artwork's width.
         height: artwork's height.
+        rng: random number generator to draw from. Defaults to a freshly seeded one.
+        max_area: the largest number of pixels the subcanvas may cover. A larger subcanvas
+            is scaled down, keeping its aspect ratio. Defaults to None for no limit.
 
     Returns:
         Subcanvas: a subcanvas that is within the artwork's width and height.
     """
-    x_coordinate = randrange(0, width)
-    y_coordinate = randrange(0, height)
+    if rng is None:
+        rng = random.Random()
+    x_coordinate = rng.randrange(0, width)
+    y_coordinate = rng.randrange(0, height)
     coordinates = Coordinates(x_coordinate, y_coordinate)
 
     bounds = get_bounds(coordinates, width, height)
-    subcanvas_width = randrange(1, bounds[0] + 1)
-    subcanvas_height = randrange(1, bounds[1] + 1)
+    subcanvas_width = rng.randrange(1, bounds[0] + 1)
+    subcanvas_height = rng.randrange(1, bounds[1] + 1)
+
+    if max_area is not None and subcanvas_width * subcanvas_height > max_area:
+        scale = math.sqrt(max_area / (subcanvas_width * subcanvas_height))
+        subcanvas_width = max(1, math.floor(subcanvas_width * scale))
+        subcanvas_height = max(1, math.floor(subcanvas_height * scale))
 
     subcanvas = Subcanvas(
         coordinates=coordinates, dimensions=(subcanvas_width, subcanvas_height)
@@ -80,34 +193,38 @@ def generate_subcanvas(width: int, height: int) -> Subcanvas:
     return subcanvas
 
 
+# pylint: disable=too-many-locals
 def generate_pixels(
     originator_id: int,
     contributor_id: int,
     subcanvas: Subcanvas,
     constraint: Constraint = None,
+    rng: random.Random = None,
 ) -> set:
     """Generate a list of pixel info that adheres to subcanvas and artwork's constraints.
 
-    TODO:
-    - implement line type adherence
+    Pixels do not follow the constraint's line type, generate_primitives does.
 
     Args:
         originator_id : ID of the peer that commissioned the artwork.
         contributor_id: ID of the peer that is contributing to the artwork.
         subcanvas: the subcanvas that the contributor will draw on.
         constraint: Constraint of subcanvas. Defaults to None.
+        rng: random number generator to draw from. Defaults to a freshly seeded one.
 
     Returns:
         set: a set of pixels with coordinates and colors adhering to subcanvas and constraints.
     """
+    if rng is None:
+        rng = random.Random()
     if constraint is not None:
         palette = get_palette(originator_id, contributor_id, constraint.palette_limit)
     else:
         palette = [
             Color(
-                random.randint(0, 255),
-                random.randint(0, 255),
-                random.randint(0, 255),
+                rng.randint(0, 255),
+                rng.randint(0, 255),
+                rng.randint(0, 255),
             )
         ]
 
@@ -117,22 +234,306 @@ def generate_pixels(
     width = subcanvas.dimensions[0]
     height = subcanvas.dimensions[1]
 
-    num_pixels = randrange(0, width * height)
+    num_pixels = rng.randrange(0, width * height)
     x_bound = x_coordinate + width
     y_bound = y_coordinate + height
     set_pixels = set()
 
     while num_pixels > 0:
         coordinates = Coordinates(
-            randrange(x_coordinate, x_bound), randrange(y_coordinate, y_bound)
+            rng.randrange(x_coordinate, x_bound), rng.randrange(y_coordinate, y_bound)
         )
-        pixel = Pixel(coordinates, random.choice(palette))
+        pixel = Pixel(coordinates, rng.choice(palette))
         set_pixels.add(pixel)
         num_pixels -= 1
 
     return set_pixels
 
 
+def generate_pixel_arrays(
+    originator_id: int,
+    contributor_id: int,
+    subcanvas: Subcanvas,
+    constraint: Constraint = None,
+    rng: np.random.Generator = None,
+) -> PixelArrays:
+    """Generate all pixels of a subcanvas at once as coordinate and palette index arrays.
+
+    Unlike generate_pixels, each coordinate of the subcanvas is sampled at most once, so the
+    fragment holds exactly the number of pixels that was drawn.
+
+    Args:
+        originator_id : ID of the peer that commissioned the artwork.
+        contributor_id: ID of the peer that is contributing to the artwork.
+        subcanvas: the subcanvas that the contributor will draw on.
+        constraint: Constraint of subcanvas. Defaults to None.
+        rng: random number generator to draw from. Defaults to a freshly seeded one.
+
+    Returns:
+        PixelArrays: x and y coordinates, palette indices and the palette they index into.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if constraint is not None:
+        palette = get_palette(originator_id, contributor_id, constraint.palette_limit)
+    else:
+        palette = [Color(*rng.integers(0, 256, size=3).tolist())]
+
+    width, height = subcanvas.dimensions
+    num_pixels = int(rng.integers(0, int(width) * int(height)))
+    return sample_pixel_arrays(subcanvas, num_pixels, palette, rng)
+
+
+def sample_pixel_arrays(
+    subcanvas: Subcanvas,
+    num_pixels: int,
+    palette: list[Color],
+    rng: np.random.Generator,
+) -> PixelArrays:
+    """Sample exactly num_pixels distinct coordinates of a subcanvas and their colors.
+
+    Args:
+        subcanvas: the subcanvas that the contributor will draw on.
+        num_pixels: the number of pixels to sample, at most the area of the subcanvas.
+        palette: the colors to draw from.
+        rng: random number generator to draw from.
+
+    Returns:
+        PixelArrays: x and y coordinates, palette indices and the palette they index into.
+    """
+    x_coordinate, y_coordinate = (int(value) for value in subcanvas.coordinates)
+    width, height = (int(value) for value in subcanvas.dimensions)
+
+    linear_indices = rng.choice(width * height, size=num_pixels, replace=False)
+
+    coordinate_type = np.min_scalar_type(
+        max(x_coordinate + width, y_coordinate + height)
+    )
+    return PixelArrays(
+        xs=(linear_indices % width + x_coordinate).astype(coordinate_type),
+        ys=(linear_indices // width + y_coordinate).astype(coordinate_type),
+        palette_indices=rng.integers(0, len(palette), size=num_pixels, dtype=np.uint8),
+        palette=palette,
+    )
+
+
+def generate_fragment_tiles(
+    artwork: Artwork,
+    originator_id: int,
+    contributor_signing_key: str,
+    contributor_id: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    max_pixels: int = None,
+) -> Iterator[CompactArtFragment]:
+    """Generates a fragment as a stream of CompactArtFragments, one per tile.
+
+    Only one tile's pixels are held in memory at a time, and every tile is a fragment of its
+    own that can be sent and merged before the next one is generated.
+
+    Args:
+        artwork: Artwork that the fragment is intended for.
+        originator_id: ID of the peer that commissioned the artwork.
+        contributor_signing_key: signing key of the peer that is contributing to the artwork.
+        contributor_id: ID of the peer that is contributing to the artwork.
+        tile_size: the width and height of a tile in pixels. Defaults to DEFAULT_TILE_SIZE.
+        max_pixels: the largest subcanvas area to draw pixels in. Defaults to None.
+
+    Yields:
+        CompactArtFragment: the pixels of the fragment that lie within one tile.
+    """
+    palette, tiles = plan_fragment_tiles(
+        artwork, originator_id, contributor_id, tile_size, max_pixels=max_pixels
+    )
+    for tile in tiles:
+        yield generate_tile(artwork.get_key(), contributor_signing_key, tile, palette)
+
+
+def plan_fragment_tiles(
+    artwork: Artwork,
+    originator_id: int,
+    contributor_id: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    rng: random.Random = None,
+    max_pixels: int = None,
+) -> tuple[list[Color], list[FragmentTile]]:
+    """Plans the tiles of a fragment without generating any pixels.
+
+    The number of pixels of the whole fragment is drawn like generate_pixel_arrays does,
+    then split over the tiles in proportion to their area.
+
+    Args:
+        artwork: Artwork that the fragment is intended for.
+        originator_id: ID of the peer that commissioned the artwork.
+        contributor_id: ID of the peer that is contributing to the artwork.
+        tile_size: the width and height of a tile in pixels. Defaults to DEFAULT_TILE_SIZE.
+        rng: random number generator to draw from. Defaults to a freshly seeded one.
+        max_pixels: the largest subcanvas area to draw pixels in. Defaults to None.
+
+    Returns:
+        tuple: the palette of the fragment and the tiles that hold at least one pixel.
+    """
+    if rng is None:
+        rng = random.Random()
+    subcanvas = generate_subcanvas(artwork.width, artwork.height, rng, max_pixels)
+    if artwork.constraint is not None:
+        palette = get_palette(
+            originator_id, contributor_id, artwork.constraint.palette_limit
+        )
+    else:
+        palette = [Color(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))]
+
+    tile_subcanvases = split_subcanvas(subcanvas, tile_size)
+    areas = [width * height for _, (width, height) in tile_subcanvases]
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    num_pixels = int(np_rng.integers(0, sum(areas)))
+    tile_pixels = np_rng.multivariate_hypergeometric(areas, num_pixels)
+
+    tiles = [
+        FragmentTile(tile_subcanvas, int(count), rng.getrandbits(64))
+        for tile_subcanvas, count in zip(tile_subcanvases, tile_pixels)
+        if count > 0
+    ]
+    return palette, tiles
+
+
+def generate_tile(
+    artwork_id: bytes,
+    contributor_signing_key: str,
+    tile: FragmentTile,
+    palette: list[Color],
+) -> CompactArtFragment:
+    """Generates the CompactArtFragment of a single planned tile.
+
+    Args:
+        artwork_id: ID of Artwork that the tile is contributing to.
+        contributor_signing_key: signing key of the peer that is contributing to the artwork.
+        tile: a tile planned by plan_fragment_tiles.
+        palette: the palette planned by plan_fragment_tiles.
+
+    Returns:
+        CompactArtFragment: the pixels of the tile.
+    """
+    pixel_arrays = sample_pixel_arrays(
+        tile.subcanvas, tile.num_pixels, palette, np.random.default_rng(tile.seed)
+    )
+    return CompactArtFragment(
+        artwork_id,
+        contributor_signing_key,
+        pixel_arrays.xs,
+        pixel_arrays.ys,
+        tuple(palette),
+        pixel_arrays.palette_indices,
+    )
+
+
+def split_subcanvas(subcanvas: Subcanvas, tile_size: int) -> list[Subcanvas]:
+    """Splits a subcanvas into tiles of at most tile_size by tile_size pixels.
+
+    Args:
+        subcanvas: the subcanvas to split.
+        tile_size: the width and height of a tile in pixels.
+
+    Returns:
+        list: the tiles, row by row.
+    """
+    x_coordinate, y_coordinate = (int(value) for value in subcanvas.coordinates)
+    width, height = (int(value) for value in subcanvas.dimensions)
+    return [
+        Subcanvas(
+            coordinates=Coordinates(tile_x, tile_y),
+            dimensions=(
+                min(tile_size, x_coordinate + width - tile_x),
+                min(tile_size, y_coordinate + height - tile_y),
+            ),
+        )
+        for tile_y in range(y_coordinate, y_coordinate + height, tile_size)
+        for tile_x in range(x_coordinate, x_coordinate + width, tile_size)
+    ]
+
+
+def generate_primitives(
+    originator_id: int,
+    contributor_id: int,
+    subcanvas: Subcanvas,
+    constraint: Constraint = None,
+    rng: random.Random = None,
+) -> list:
+    """Generate drawing primitives that adhere to subcanvas and artwork's constraints.
+
+    The constraint's line_type selects the primitives that may be drawn: "straight" for
+    rectangles, lines and polylines, "curved" for ellipses and "any" for all of them.
+
+    Args:
+        originator_id : ID of the peer that commissioned the artwork.
+        contributor_id: ID of the peer that is contributing to the artwork.
+        subcanvas: the subcanvas that the contributor will draw on.
+        constraint: Constraint of subcanvas. Defaults to None.
+        rng: random number generator to draw from. Defaults to a freshly seeded one.
+
+    Returns:
+        list: Rectangle, Ellipse, Line and Polyline instances within the subcanvas.
+    """
+    if rng is None:
+        rng = random.Random()
+    if constraint is not None:
+        palette = get_palette(originator_id, contributor_id, constraint.palette_limit)
+        line_type = constraint.line_type
+    else:
+        palette = [Color(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))]
+        line_type = "any"
+
+    if line_type not in LINE_TYPE_PRIMITIVES:
+        logger.warning("Unknown line type %s, drawing any primitive", line_type)
+        line_type = "any"
+    primitive_types = LINE_TYPE_PRIMITIVES[line_type]
+
+    primitives = []
+    for _ in range(rng.randint(1, MAX_PRIMITIVES)):
+        primitive_type = rng.choice(primitive_types)
+        color = rng.choice(palette)
+        if primitive_type is Polyline:
+            points = tuple(
+                generate_coordinates(subcanvas, rng)
+                for _ in range(rng.randint(3, MAX_POLYLINE_POINTS))
+            )
+            primitives.append(Polyline(points, color, rng.randint(1, MAX_LINE_WIDTH)))
+        elif primitive_type is Line:
+            start = generate_coordinates(subcanvas, rng)
+            end = generate_coordinates(subcanvas, rng)
+            primitives.append(Line(start, end, color, rng.randint(1, MAX_LINE_WIDTH)))
+        else:
+            corner = generate_coordinates(subcanvas, rng)
+            other_corner = generate_coordinates(subcanvas, rng)
+            top_left = Coordinates(
+                min(corner.x, other_corner.x), min(corner.y, other_corner.y)
+            )
+            bottom_right = Coordinates(
+                max(corner.x, other_corner.x), max(corner.y, other_corner.y)
+            )
+            primitives.append(primitive_type(top_left, bottom_right, color))
+
+    return primitives
+
+
+def generate_coordinates(subcanvas: Subcanvas, rng: random.Random) -> Coordinates:
+    """Generate random coordinates within a subcanvas.
+
+    Args:
+        subcanvas: the subcanvas that the coordinates must lie in.
+        rng: random number generator to draw from.
+
+    Returns:
+        Coordinates: coordinates within the subcanvas.
+    """
+    x_coordinate, y_coordinate = subcanvas.coordinates
+    width, height = subcanvas.dimensions
+    return Coordinates(
+        rng.randrange(x_coordinate, x_coordinate + width),
+        rng.randrange(y_coordinate, y_coordinate + height),
+    )
+
+
 def get_palette(originator_id: int, contributor_id: int, palette_limit: int) -> list:
     """
     Get palette corresponding to palette_limit and distance from originator to contributor
@@ -146,11 +547,31 @@ def get_palette(originator_id: int, contributor_id: int, palette_limit: int) ->
         list: a list of colors in the palette
     """
 
-    distance = originator_id ^ contributor_id
-    random.seed(distance)
+    return list(
+        get_distance_palette(originator_id ^ contributor_id, int(palette_limit))
+    )
+
+
+@functools.lru_cache(maxsize=PALETTE_CACHE_SIZE)
+def get_distance_palette(distance: int, palette_limit: int) -> tuple[Color, ...]:
+    """
+    Get palette corresponding to palette_limit and the XOR distance between two peers.
+
+    Palettes are memoized, as a contributor serving many commissions from the same
+    originator keeps asking for the same one.
+
+    Args:
+        distance: XOR distance from the originator to the contributor.
+        palette_limit: the number of colors in palette
+
+    Returns:
+        tuple: the colors in the palette
+    """
+
+    rng = random.Random(distance)
 
     # Create an array of palette_limit*3 color channels
-    channels = random.sample(range(0, 256), palette_limit * 3)
+    channels = rng.sample(range(0, 256), palette_limit * 3)
 
     # create a palette array of colors, each color being a 3-element tuple
     start = 0
@@ -164,4 +585,4 @@ def get_palette(originator_id: int, contributor_id: int, palette_limit: int) ->
         end += 3
         palette.append(color)
 
-    return palette
+    return tuple(palette)
@@ -16,3 +16,32 @@ Pixel.__annotations__ = {"coordinates": Coordinates, "color": Color}
 
 Constraint = namedtuple("Constraint", ["palette_limit", "line_type"])
 Constraint.__annotations__ = {"palette_limit": int, "line_type": str}
+
+Rectangle = namedtuple("Rectangle", ["top_left", "bottom_right", "color"])
+Rectangle.__annotations__ = {
+    "top_left": Coordinates,
+    "bottom_right": Coordinates,
+    "color": Color,
+}
+
+Ellipse = namedtuple("Ellipse", ["top_left", "bottom_right", "color"])
+Ellipse.__annotations__ = {
+    "top_left": Coordinates,
+    "bottom_right": Coordinates,
+    "color": Color,
+}
+
+Line = namedtuple("Line", ["start", "end", "color", "width"])
+Line.__annotations__ = {
+    "start": Coordinates,
+    "end": Coordinates,
+    "color": Color,
+    "width": int,
+}
+
+Polyline = namedtuple("Polyline", ["points", "color", "width"])
+Polyline.__annotations__ = {
+    "points": tuple[Coordinates, ...],
+    "color": Color,
+    "width": int,
+}
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Module to rasterize drawing primitives
+
+Draws the Rectangle, Ellipse, Line and Polyline primitives of a fragment onto a canvas
+"""
+
+from collections.abc import Iterable
+from PIL import Image, ImageDraw
+from drawing.drawing import Ellipse, Line, Polyline, Rectangle
+
+
+def draw_rectangle(draw: ImageDraw.ImageDraw, rectangle: Rectangle) -> None:
+    """Draw a filled rectangle."""
+    draw.rectangle(
+        [tuple(rectangle.top_left), tuple(rectangle.bottom_right)],
+        fill=tuple(rectangle.color),
+    )
+
+
+def draw_ellipse(draw: ImageDraw.ImageDraw, ellipse: Ellipse) -> None:
+    """Draw a filled ellipse inscribed in its bounding box."""
+    draw.ellipse(
+        [tuple(ellipse.top_left), tuple(ellipse.bottom_right)],
+        fill=tuple(ellipse.color),
+    )
+
+
+def draw_line(draw: ImageDraw.ImageDraw, line: Line) -> None:
+    """Draw a straight line segment."""
+    draw.line(
+        [tuple(line.start), tuple(line.end)], fill=tuple(line.color), width=line.width
+    )
+
+
+def draw_polyline(draw: ImageDraw.ImageDraw, polyline: Polyline) -> None:
+    """Draw connected straight line segments through the points of a polyline."""
+    draw.line(
+        [tuple(point) for point in polyline.points],
+        fill=tuple(polyline.color),
+        width=polyline.width,
+    )
+
+
+PRIMITIVE_DRAWERS = {
+    Rectangle: draw_rectangle,
+    Ellipse: draw_ellipse,
+    Line: draw_line,
+    Polyline: draw_polyline,
+}
+
+
+def draw_primitives(canvas: Image.Image, primitives: Iterable) -> Image.Image:
+    """
+    Draw primitives onto a canvas in order, later primitives painting over earlier ones.
+
+    Args:
+        canvas: the canvas to draw on.
+        primitives: Rectangle, Ellipse, Line and Polyline instances.
+
+    Returns:
+        Image: the canvas that was drawn on.
+    """
+    draw = ImageDraw.Draw(canvas)
+    for primitive in primitives:
+        try:
+            drawer = PRIMITIVE_DRAWERS[type(primitive)]
+        except KeyError as exc:
+            raise TypeError(f"Cannot draw primitive of type {type(primitive)}") from exc
+        drawer(draw, primitive)
+    return canvas
@@ -29,7 +29,7 @@ class OfferResponse:
         self.exchange_id = exchange_id
         self.artwork = artwork
         self.price = price
-        self.exchange_type: exchange_type
+        self.exchange_type = exchange_type
         self.public_key = exchanger_public_key
 
     def get_exchange_id(self):
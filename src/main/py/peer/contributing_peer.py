@@ -16,7 +16,7 @@ async def main():
     """Main function
 
     Run the file with the following:
-    python3 peer.py <port_num> <key_filename> <address>
+    python3 peer.py <port_num> <key_filename> <address> [storage_path]
     """
 
     logging.basicConfig(
@@ -28,11 +28,23 @@ async def main():
         address = sys.argv[3]
     else:
         address = None
-    peer = Peer(port_num, key_filename, address, kademlia)
-    await peer.connect_to_network()
-    while True:
-        await asyncio.sleep(1)
-        peer.node.refresh_table()
+    storage_path = sys.argv[4] if len(sys.argv) > 4 else None
+    peer = Peer(
+        port_num,
+        key_filename,
+        address,
+        kademlia,
+        generation_executor="process",
+        storage_path=storage_path,
+        contacts_path=f"{key_filename}.contacts",
+    )
+    try:
+        await peer.connect_to_network()
+        while True:
+            await asyncio.sleep(1)
+            peer.node.refresh_table()
+    finally:
+        peer.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""
+Module to manage fragment generation budgets.
+
+GenerationBudget class allows us to size fragments so that they are generated and sent before
+the deadline of the commission they contribute to.
+"""
+
+import logging
+from commission.artwork import Artwork
+
+
+class GenerationBudget:
+    """
+    Class to track a peer's generation throughput and derive pixel budgets from it
+    """
+
+    logger = logging.getLogger("GenerationBudget")
+
+    def __init__(
+        self,
+        pixels_per_second: float = 1_000_000,
+        safety_factor: float = 0.5,
+        network_allowance: float = 1.0,
+        smoothing: float = 0.3,
+    ) -> None:
+        """
+        Initializes an instance of the GenerationBudget class.
+        - pixels_per_second: The throughput assumed until a generation has been measured.
+        - safety_factor: The share of the time left that generation may spend.
+        - network_allowance: The seconds kept aside to send the fragment.
+        - smoothing: The weight of the latest measurement in the throughput average.
+        """
+        self.pixels_per_second = pixels_per_second
+        self.safety_factor = safety_factor
+        self.network_allowance = network_allowance
+        self.smoothing = smoothing
+
+    def record(self, pixels: int, seconds: float) -> None:
+        """
+        Records that generating pixels took seconds, updating the measured throughput.
+        """
+        if pixels <= 0 or seconds <= 0:
+            return
+        measured = pixels / seconds
+        self.pixels_per_second = (
+            self.smoothing * measured + (1 - self.smoothing) * self.pixels_per_second
+        )
+
+    def get_time_budget(self, artwork: Artwork) -> float:
+        """
+        Returns the seconds that may be spent generating a fragment for the artwork.
+        """
+        time_left = artwork.get_remaining_time() - self.network_allowance
+        return max(0.0, time_left * self.safety_factor)
+
+    def get_max_pixels(self, artwork: Artwork) -> int:
+        """
+        Returns the number of pixels that can be generated within the artwork's time budget.
+        """
+        return int(self.get_time_budget(artwork) * self.pixels_per_second)
@@ -19,6 +19,7 @@ class Inventory:
         self.artworks_pending_exchange = set()
         self.completed_exchanges = set()
         self.commission_canvases = {}
+        self.commission_contributors = {}
 
     def add_commission(self, artwork: Artwork):
         """
@@ -63,6 +64,18 @@ class Inventory:
 
         if artwork.key in self.commissions:
             del self.commissions[artwork.key]
+        self.commission_contributors.pop(artwork.key, None)
+
+    def add_contributor(self, artwork_key, node_id: bytes):
+        """
+        Remembers a peer that contributed to a commission.
+
+        Params:
+        - artwork_key (bytes): The key of the commission.
+        - node_id (bytes): The node ID of the contributing peer.
+        """
+
+        self.commission_contributors.setdefault(artwork_key, set()).add(node_id)
 
     def remove_owned_artwork(self, artwork: Artwork):
         """
@@ -6,38 +6,102 @@ Peer class allows us to join the network, commission artwork, and generate fragm
 """
 import time
 import asyncio
-from datetime import timedelta
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+import functools
 import hashlib
 import ipaddress
-import pickle
+import os
 import logging
 import sys
+import numpy as np
 from PIL import Image
-from server.network import NotifyingServer as kademlia
-from commission.artfragment import ArtFragment
+from server.network import (
+    JOIN_MIN_CONTACTS,
+    NotifyingServer as kademlia,
+    ReplicationPolicy,
+    load_contacts,
+)
+from server.protocol import TRANSFER
+from server.ratelimit import RateLimit
+from server.storage import SqliteStorage
+from codec import codec
+from commission.artfragment import (
+    FRAGMENT_TYPES,
+    ArtFragment,
+    CompactArtFragment,
+    PrimitiveArtFragment,
+)
 from commission.artwork import Artwork
-from commission.artfragmentgenerator import generate_fragment
+from commission.artfragmentgenerator import (
+    generate_fragment,
+    generate_primitive_fragment,
+    generate_tile,
+    plan_fragment_tiles,
+)
+from peer.generation_budget import GenerationBudget
 from peer.ledger import Ledger
 from peer.inventory import Inventory
 from peer.wallet import Wallet
 from exchange.offer_response import OfferResponse
 from exchange.offer_announcement import OfferAnnouncement
 from drawing.drawing import Constraint
+from drawing.rasterizer import draw_primitives
 import utils
 
-
-# pylint: disable=too-many-instance-attributes
+GENERATION_EXECUTORS = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+
+PROCESSED_MESSAGES_CACHE_SIZE = 4096
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+NODE_ID_LENGTH = 20
+SHORT_LIVED_TTL = 3600
+SYNC_LEAD_TIME = 5
+# A compact fragment is merged through its bounding box if it paints at least this share of
+# it, and pixel by pixel otherwise, so a sparse fragment does not copy most of the canvas.
+MIN_BOX_FILL = 1 / 16
+# Fragments are mostly delivered straight to their originator, so when they are set instead a
+# few replicas do. Messages about one commission or exchange are of no use once it ends, so
+# they are never republished. Artworks keep the default of ksize replicas, republished.
+REPLICATION_POLICIES = {
+    **{
+        message_type: ReplicationPolicy(3, SHORT_LIVED_TTL, False)
+        for message_type in codec.FRAGMENT_MESSAGE_TYPES
+    },
+    codec.OFFER_ANNOUNCEMENT: ReplicationPolicy(None, SHORT_LIVED_TTL, False),
+    codec.OFFER_RESPONSE: ReplicationPolicy(None, SHORT_LIVED_TTL, False),
+}
+# Each contributor may send an originator fragments in bursts, but only at a steady rate
+# overall, so that one contributor cannot take up the time spent merging the others'. Large
+# fragments arrive in chunks, so starting a chunked transfer is limited the same way.
+RATE_LIMITS = {
+    **{
+        message_type: RateLimit(20, 200)
+        for message_type in codec.FRAGMENT_MESSAGE_TYPES
+    },
+    TRANSFER: RateLimit(20, 200),
+}
+
+
+# pylint: disable=too-many-instance-attributes, too-many-public-methods
 class Peer:
     """Class to manage peer functionality"""
 
     logger = logging.getLogger("Peer")
 
+    # pylint: disable=too-many-arguments,too-many-locals
     def __init__(
         self,
         port: int,
         key_filename: str,
         peer_network_address: str,
         kdm,
+        generation_executor: str = None,
+        max_concurrent_generations: int = None,
+        fragment_type: str = "pixels",
+        gossip_commissions: bool = False,
+        storage_path: str = None,
+        contacts_path: str = None,
     ) -> None:
         """
         Initialize the Peer class by joining the kademlia network.
@@ -46,20 +110,34 @@ class Peer:
         - port (int): The port number for the peer to listen on.
         - key_filename (str): The filename of the private key.
         - peer_network_address (str): String containing the IP address and port number of a peer
-          on the network separated by a colon.
+          on the network separated by a colon, or several of those separated by commas.
+        - generation_executor (str): "process" or "thread" to generate fragments in a pool
+          off the event loop, or None to generate them on the event loop.
+        - max_concurrent_generations (int): The maximum number of fragments generated at once.
+          Defaults to the number of CPUs.
+        - fragment_type (str): "pixels" to contribute CompactArtFragments, "tiles" to stream
+          them tile by tile, or "primitives" to contribute PrimitiveArtFragments.
+        - gossip_commissions (bool): Whether to also gossip commissions to the whole network,
+          rather than only storing them on the nodes closest to their key.
+        - storage_path (str): The sqlite database to keep stored values in across restarts, or
+          None to keep them in memory.
+        - contacts_path (str): The file to snapshot the routing table to regularly, and to warm
+          bootstrap from when the peer restarts, or None to always bootstrap from the network
+          address.
         """
+        self.seeds = []
         if peer_network_address is not None:
             try:
-                network_ip_address, network_port_num = peer_network_address.split(":")
-                self.network_ip_address = ipaddress.ip_address(network_ip_address)
-                self.network_port_num = int(network_port_num)
+                for address in peer_network_address.split(","):
+                    ip_address, port_num = address.strip().split(":")
+                    self.seeds.append((ipaddress.ip_address(ip_address), int(port_num)))
             except ValueError as exc:
                 raise ValueError(
                     "Invalid network address. Please provide a valid network address."
                 ) from exc
-        else:
-            self.network_port_num = None
-            self.network_ip_address = None
+        self.network_ip_address, self.network_port_num = (
+            self.seeds[0] if self.seeds else (None, None)
+        )
         self.port = port
         self.keys = {}
         with open(f"{key_filename}.pub", "r", encoding="utf-8") as public_key_file:
@@ -73,6 +151,20 @@ class Peer:
         self.inventory = Inventory()
         self.ledger = Ledger()
         self.wallet = Wallet()
+        self.generation_executor: Executor = (
+            GENERATION_EXECUTORS[generation_executor]()
+            if generation_executor is not None
+            else None
+        )
+        self.generation_slots = asyncio.Semaphore(
+            max_concurrent_generations or os.cpu_count() or 1
+        )
+        self.fragment_type = fragment_type
+        self.generation_budget = GenerationBudget()
+        self.processed_messages = utils.SeenCache(PROCESSED_MESSAGES_CACHE_SIZE)
+        self.gossip_commissions = gossip_commissions
+        self.storage_path = storage_path
+        self.contacts_path = contacts_path
 
     async def send_deadline_reached(self, commission: Artwork) -> None:
         """
@@ -83,7 +175,7 @@ class Peer:
         commission.ledger.add_owner(self.keys["public"])
         try:
             set_success = await self.node.set(
-                commission.get_key(), pickle.dumps(commission)
+                commission.get_key(), codec.encode(commission)
             )
             if set_success:
                 self.logger.info("Commission complete")
@@ -94,9 +186,10 @@ class Peer:
                 "pics/canvas13.png", "PNG"
             )
             self.inventory.remove_commission(commission)
+            self.node.discard_sync(commission.key)
         except TypeError:
             self.logger.info(commission)
-            self.logger.error("Commission type is not pickleable")
+            self.logger.error("Commission type is not encodable")
 
     async def setup_deadline_timer(self, commission: Artwork) -> None:
         """
@@ -104,21 +197,46 @@ class Peer:
         """
 
         deadline_seconds = commission.get_remaining_time()
+        utils.call_later()(
+            max(0, deadline_seconds - SYNC_LEAD_TIME),
+            asyncio.create_task,
+            self.sync_fragments(commission),
+        )
         utils.call_later()(
             deadline_seconds,
             asyncio.create_task,
             self.send_deadline_reached(commission),
         )
 
+    async def sync_fragments(self, commission: Artwork) -> None:
+        """
+        Reconcile the fragments of the commission with every peer that contributed to it,
+        shortly before its deadline, to get back fragments that were lost on the way.
+        """
+
+        contributors = self.inventory.commission_contributors.get(commission.key, ())
+        for node_id in contributors:
+            try:
+                delivering = await self.node.sync_with(node_id, commission.key)
+            except Exception:  # pylint: disable=broad-exception-caught
+                self.logger.exception("Could not sync fragments with %s", node_id.hex())
+                continue
+            if delivering:
+                self.logger.info("Recovering %d lost fragments", delivering)
+
     async def send_commission_request(self, commission: Artwork) -> None:
         """
         Publish the commission on kademlia, add it to the list, and schedule the deadline notice.
         """
 
         try:
-            set_success = await self.node.set(
-                commission.get_key(), pickle.dumps(commission)
-            )
+            encoded_commission = codec.encode(commission)
+            set_success = await self.node.set(commission.get_key(), encoded_commission)
+            if self.gossip_commissions:
+                gossip_success = await self.node.gossip(
+                    commission.get_key(), encoded_commission
+                )
+                set_success = set_success or gossip_success
             if set_success:
                 self.logger.info("Commission sent")
             else:
@@ -126,14 +244,16 @@ class Peer:
             await self.setup_deadline_timer(commission)
         except TypeError:
             self.logger.info(commission)
-            self.logger.error("Commission type is not pickleable")
+            self.logger.error("Commission type is not encodable")
 
     async def commission_art_piece(
         self, width=None, height=None, wait_time=None, palette_limit=None
     ) -> None:
         """
-        Get commission details from user input, create a commission, and send the request.
+        Get commission details from user input, create a commission, and send the request,
+        once the node is ready.
         """
+        await self.node.ready.wait()
 
         while True:
             try:
@@ -178,24 +298,20 @@ class Peer:
         announcement_key,
         offer_announcement: OfferAnnouncement,
     ):
-        """Handle the deadline for an exchange announcement"""
+        """
+        Handle the deadline for an exchange announcement.
+
+        The announcement is not set again: it is stored under the content key of its encoding,
+        and peers that already responded would respond once more to a new encoding.
+        """
 
         self.inventory.remove_pending_exchange(announcement_key)
         self.inventory.completed_exchanges.add(announcement_key)
 
         self.wallet.add_to_balance(offer_announcement.get_price())
-        self.logger.info("Exchange announcement deadline reached")
-
-        try:
-            set_success = await self.node.set(
-                announcement_key, pickle.dumps(offer_announcement)
-            )
-            if set_success:
-                self.logger.info("%s announced", announcement_type)
-            else:
-                self.logger.error("%s failed to announce", announcement_type)
-        except TypeError:
-            self.logger.error("%s type is not pickleable", announcement_type)
+        self.logger.info(
+            "Exchange announcement deadline reached for %s", announcement_type
+        )
 
     async def announce_exchange(
         self,
@@ -219,7 +335,14 @@ class Peer:
 
         offer_announcement = OfferAnnouncement(artwork, price, exchange_type)
 
-        announcement_key = utils.generate_random_sha1_hash()
+        try:
+            encoded_announcement = codec.encode(
+                offer_announcement, datetime.now() + wait_time
+            )
+        except TypeError:
+            self.logger.error("%s type is not encodable", exchange_type)
+            return
+        announcement_key = utils.generate_content_key(encoded_announcement)
         self.inventory.add_pending_exchange(announcement_key, offer_announcement)
 
         asyncio.get_event_loop().call_later(
@@ -230,16 +353,11 @@ class Peer:
             ),
         )
 
-        try:
-            set_success = await self.node.set(
-                announcement_key, pickle.dumps(offer_announcement)
-            )
-            if set_success:
-                self.logger.info("%s announced", exchange_type)
-            else:
-                self.logger.error("%s failed to announce", exchange_type)
-        except TypeError:
-            self.logger.error("%s type is not pickleable", exchange_type)
+        set_success = await self.node.set(announcement_key, encoded_announcement)
+        if set_success:
+            self.logger.info("%s announced", exchange_type)
+        else:
+            self.logger.error("%s failed to announce", exchange_type)
 
     async def send_exchange_response(
         self, exchange_key: bytes, announcement: OfferAnnouncement
@@ -281,19 +399,23 @@ class Peer:
                 exchange_key,
                 artwork_to_exchange,
                 announcement.get_price(),
+                announcement.get_exchange_type(),
                 self.keys["public"],
             )
             if announcement.get_exchange_type() == "trade"
             else OfferResponse(
-                exchange_key, None, announcement.get_price(), self.keys["public"]
+                exchange_key,
+                None,
+                announcement.get_price(),
+                announcement.get_exchange_type(),
+                self.keys["public"],
             )
         )
 
-        response_key = utils.generate_random_sha1_hash()
-
         try:
+            encoded_response = codec.encode(offer_response)
             set_success = await self.node.set(
-                response_key, pickle.dumps(offer_response)
+                utils.generate_content_key(encoded_response), encoded_response
             )
             if set_success:
                 self.logger.info("%s response sent", announcement.get_exchange_type())
@@ -304,7 +426,7 @@ class Peer:
 
         except TypeError:
             self.logger.error(
-                "%s response type is not pickleable", announcement.get_exchange_type()
+                "%s response type is not encodable", announcement.get_exchange_type()
             )
 
     async def handle_exchange_response(
@@ -343,26 +465,120 @@ class Peer:
             "%s rejected the exchange.", response.get_exchanger_public_key()
         )
 
-    async def contribute_to_artwork(self, message_object: Artwork):
+    async def generate_fragment(
+        self, artwork: Artwork
+    ) -> CompactArtFragment | PrimitiveArtFragment:
         """
-        Contribute to an artwork by generating a fragment and sending it to the network.
+        Generate a fragment for an artwork, in the generation executor if one is configured.
         """
-        fragment = generate_fragment(
-            message_object,
-            message_object.originator_long_id,
+        args = (
+            artwork,
+            artwork.originator_long_id,
             self.keys["public"],
             self.node.node.long_id,
         )
+        if self.fragment_type == "primitives":
+            generate = functools.partial(generate_primitive_fragment, *args)
+        else:
+            generate = functools.partial(
+                generate_fragment,
+                *args,
+                batched=True,
+                max_pixels=self.generation_budget.get_max_pixels(artwork),
+            )
+        return await self.run_generation(generate)
+
+    async def generate_fragment_tiles(
+        self, artwork: Artwork
+    ) -> AsyncIterator[CompactArtFragment]:
+        """
+        Generate a fragment for an artwork tile by tile, yielding each tile once it is ready.
+        """
+        palette, tiles = plan_fragment_tiles(
+            artwork,
+            artwork.originator_long_id,
+            self.node.node.long_id,
+            max_pixels=self.generation_budget.get_max_pixels(artwork),
+        )
+        for tile in tiles:
+            yield await self.run_generation(
+                functools.partial(
+                    generate_tile, artwork.get_key(), self.keys["public"], tile, palette
+                )
+            )
+
+    async def run_generation(self, generate: Callable):
+        """
+        Call generate in the generation executor if one is configured.
+
+        At most max_concurrent_generations calls run at once, further calls wait for a free
+        slot. The time taken by generated CompactArtFragments feeds the generation budget.
+        """
+        async with self.generation_slots:
+            start = time.perf_counter()
+            if self.generation_executor is None:
+                fragment = generate()
+            else:
+                fragment = await asyncio.get_running_loop().run_in_executor(
+                    self.generation_executor, generate
+                )
+            if isinstance(fragment, CompactArtFragment):
+                self.generation_budget.record(
+                    len(fragment), time.perf_counter() - start
+                )
+            return fragment
+
+    async def contribute_to_artwork(self, message_object: Artwork):
+        """
+        Contribute to an artwork by generating a fragment and sending it to the network, once
+        the node is ready, unless the time left to contribute runs out first.
+        """
+        time_budget = self.generation_budget.get_time_budget(message_object)
+        if time_budget <= 0:
+            self.logger.info("Not enough time left to contribute")
+            return
         try:
-            set_success = await self.node.set(
-                utils.generate_random_sha1_hash(), pickle.dumps(fragment)
+            await asyncio.wait_for(self.node.ready.wait(), time_budget)
+        except asyncio.TimeoutError:
+            self.logger.info("Not connected to the network in time to contribute")
+            return
+        if self.fragment_type == "tiles":
+            async for fragment in self.generate_fragment_tiles(message_object):
+                await self.send_fragment(fragment, message_object)
+        else:
+            await self.send_fragment(
+                await self.generate_fragment(message_object), message_object
+            )
+
+    async def send_fragment(
+        self,
+        fragment: CompactArtFragment | PrimitiveArtFragment,
+        artwork: Artwork = None,
+    ) -> None:
+        """
+        Send a fragment straight to the originator of its artwork if we know who that is,
+        or else set it on the network, marked as of no use after the artwork's deadline.
+        """
+        try:
+            encoded_fragment = codec.encode(
+                fragment, None if artwork is None else artwork.end_time
             )
+            key = utils.generate_content_key(encoded_fragment)
+            self.node.add_to_sync(fragment.artwork_id, encoded_fragment)
+            if artwork is not None and artwork.originator_long_id is not None:
+                set_success = await self.node.deliver(
+                    artwork.originator_long_id.to_bytes(NODE_ID_LENGTH, "big"),
+                    key,
+                    encoded_fragment,
+                )
+            else:
+                set_success = await self.node.set(key, encoded_fragment)
             if set_success:
                 self.logger.info("Fragment sent")
             else:
                 self.logger.error("Fragment failed to send")
         except TypeError:
-            self.logger.error("Fragment type is not pickleable")
+            self.logger.error("Fragment type is not encodable")
 
     async def data_stored_callback(self, key, value):
         """
@@ -372,9 +588,9 @@ class Peer:
             value (bytes): The value to store.
         """
 
-        self.logger.info("Data stored with key: %s", key)
-        self.logger.info("Data stored with value: %s", value)
-        message_object = pickle.loads(value)
+        message_object = self.read_message(key, value)
+        if message_object is None:
+            return
         if isinstance(message_object, Artwork):
             self.logger.info("Received commission request")
             if (
@@ -386,14 +602,23 @@ class Peer:
                     self.gui_callback()  # pylint: disable=not-callable
                 else:
                     await self.contribute_to_artwork(message_object)
-        elif isinstance(message_object, ArtFragment):
+        elif isinstance(message_object, FRAGMENT_TYPES):
             if message_object.artwork_id in self.inventory.commissions:
-                self.inventory.commissions[
+                canvas = self.inventory.commission_canvases[message_object.artwork_id]
+                try:
+                    codec.check_canvas_bounds(message_object, *canvas.size)
+                except ValueError:
+                    self.logger.error("Fragment does not fit the canvas")
+                    return
+                self.node.add_to_sync(message_object.artwork_id, value)
+                if isinstance(message_object.contributor_id, str):
+                    self.inventory.add_contributor(
+                        message_object.artwork_id,
+                        hashlib.sha1(message_object.contributor_id.encode()).digest(),
+                    )
+                self.inventory.commission_canvases[
                     message_object.artwork_id
-                ] = self.merge_canvas(
-                    message_object,
-                    self.inventory.commission_canvases[message_object.artwork_id],
-                )
+                ] = self.merge_canvas(message_object, canvas)
         elif isinstance(message_object, OfferAnnouncement):
             self.logger.info("Received exchange announcement")
             await self.send_exchange_response(key, message_object)
@@ -403,27 +628,119 @@ class Peer:
         else:
             self.logger.error("Invalid object received")
 
-    async def connect_to_network(self, wait_time=0):
-        """
-        Connect to the kademlia network.
+    def read_message(self, key, value):
         """
+        Decode a stored value, unless its header shows it is of no use or it was seen before.
 
-        self.node = self.kdm(
-            self.data_stored_callback,
-            node_id=hashlib.sha1(self.keys["public"].encode()).digest(),
+        Returns:
+            the decoded message, or None if the value was dropped.
+        """
+        try:
+            header = codec.read_header(value)
+        except ValueError:
+            self.logger.error("Invalid object received")
+            return None
+        self.logger.debug(
+            "Data stored with key: %s, type: %s, size: %s",
+            key,
+            header.message_type,
+            header.size,
         )
+        if not self.is_message_wanted(header):
+            return None
+        if not self.processed_messages.add(utils.generate_content_key(value)):
+            self.logger.info("Skipping already processed message")
+            return None
+        try:
+            return codec.decode(value)
+        except ValueError:
+            self.logger.error("Invalid object received")
+            return None
+
+    def is_message_wanted(self, header: codec.Header) -> bool:
+        """
+        Decide from its header alone whether a message is worth decoding.
+
+        Oversized and expired messages are of no use, and neither are fragments of artworks
+        that are not our commissions.
+        """
+        if header.size > MAX_MESSAGE_SIZE:
+            self.logger.warning("Dropping message of %s bytes", header.size)
+            return False
+        if header.deadline is not None and header.deadline < datetime.now():
+            self.logger.debug("Dropping expired message")
+            return False
+        if (
+            header.message_type in codec.FRAGMENT_MESSAGE_TYPES
+            and header.artwork_id not in self.inventory.commissions
+        ):
+            self.logger.debug("Dropping fragment of an artwork we did not commission")
+            return False
+        return True
+
+    async def connect_to_network(self, min_contacts=JOIN_MIN_CONTACTS) -> bool:
+        """
+        Connect to the kademlia network, warm from the routing table snapshot if there is one
+        of this peer, and wait until the routing table holds min_contacts contacts.
+
+        Returns:
+            bool: whether the peer is ready, or gave up retrying before it was.
+        """
+
+        node_id = hashlib.sha1(self.keys["public"].encode()).digest()
+        options = {
+            "replication_policies": REPLICATION_POLICIES,
+            "classify_value": codec.get_message_type,
+            "rate_limits": RATE_LIMITS,
+        }
+        if self.storage_path is not None:
+            options["storage"] = SqliteStorage(self.storage_path)
+        self.node = self.kdm(self.data_stored_callback, node_id=node_id, **options)
         await self.node.listen(self.port)
-        time.sleep(wait_time)
-        if self.network_ip_address is not None:
-            await self.node.bootstrap(
-                [(str(self.network_ip_address), self.network_port_num)]
-            )
+        contacts = []
+        snapshot = None
+        if self.contacts_path is not None:
+            snapshot = load_contacts(self.contacts_path)
+        if snapshot is not None and snapshot[0] == node_id:
+            self.logger.info("Bootstrapping from %d saved contacts", len(snapshot[1]))
+            contacts = snapshot[1]
+        seeds = [(str(ip_address), port_num) for ip_address, port_num in self.seeds]
+        ready = await self.node.join(seeds, contacts, min_contacts)
+        if not ready:
+            self.logger.warning("Could not reach %d contacts", min_contacts)
+        if self.contacts_path is not None:
+            self.node.save_contacts_regularly(self.contacts_path)
         self.logger.info("Running server on port %d", self.port)
+        return ready
 
-    def merge_canvas(self, fragment: ArtFragment, canvas) -> Image.Image:
+    def stop(self) -> None:
+        """
+        Stop the kademlia node if it was started, and shut down the generation executor, so
+        that no worker outlives the peer.
+        """
+        if self.node is not None:
+            self.node.stop()
+        if self.generation_executor is not None:
+            self.generation_executor.shutdown(cancel_futures=True)
+
+    def merge_canvas(
+        self, fragment: ArtFragment | CompactArtFragment | PrimitiveArtFragment, canvas
+    ) -> Image.Image:
         """
         Merge fragments received from a Contributor Artist Peer into a complete colored canvas
         """
+        if isinstance(fragment, PrimitiveArtFragment):
+            return draw_primitives(canvas, fragment.primitives)
+
+        if isinstance(fragment, CompactArtFragment) and len(fragment):
+            left, top = int(fragment.xs.min()), int(fragment.ys.min())
+            box = (left, top, int(fragment.xs.max()) + 1, int(fragment.ys.max()) + 1)
+            if len(fragment) >= (box[2] - left) * (box[3] - top) * MIN_BOX_FILL:
+                region = np.array(canvas.crop(box))
+                region[fragment.ys - top, fragment.xs - left] = fragment.colors()
+                canvas.paste(Image.fromarray(region, canvas.mode), box)
+                return canvas
+
         pixels = canvas.load()
 
         for pixel in fragment.pixels:
@@ -460,11 +777,17 @@ async def main():
     else:
         address = sys.argv[3]
     peer = Peer(port_num, key_filename, address, kademlia)
-    await peer.connect_to_network(15)
-    time.sleep(10)
-    await peer.commission_art_piece()
-    while True:
-        await asyncio.sleep(1)
+    try:
+        if await peer.connect_to_network():
+            await peer.commission_art_piece()
+        else:
+            logging.getLogger("Peer").error(
+                "Could not join the network, not commissioning"
+            )
+        while True:
+            await asyncio.sleep(1)
+    finally:
+        peer.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Module to coalesce the datagrams sent to the same destination into fewer, larger datagrams.
+
+rpcudp marks requests with a leading 0 byte and responses with a leading 1 byte. A batch is
+marked with a leading 2 byte, followed by each datagram it holds, prefixed with its length.
+"""
+
+import asyncio
+import logging
+import struct
+
+BATCH_PREFIX = b"\x02"
+LENGTH = struct.Struct("!H")
+BATCH_WINDOW = 0.002
+MAX_BATCH_SIZE = 8192
+MAX_DATAGRAM_SIZE = 65507
+
+
+def pack_batch(datagrams: list) -> bytes:
+    """
+    Pack datagrams into a single batch datagram.
+
+    Args:
+        datagrams (list): the datagrams to pack, each shorter than 64K.
+
+    Returns:
+        bytes: the batch datagram.
+    """
+    return BATCH_PREFIX + b"".join(
+        LENGTH.pack(len(datagram)) + datagram for datagram in datagrams
+    )
+
+
+def unpack_batch(batch: bytes) -> list:
+    """
+    Unpack the datagrams packed into a batch datagram by pack_batch.
+
+    Raises:
+        ValueError: if the batch is truncated or not a batch.
+    """
+    if batch[:1] != BATCH_PREFIX:
+        raise ValueError("Datagram is not a batch")
+    datagrams = []
+    offset = len(BATCH_PREFIX)
+    while offset < len(batch):
+        if offset + LENGTH.size > len(batch):
+            raise ValueError("Batch is truncated")
+        (length,) = LENGTH.unpack_from(batch, offset)
+        offset += LENGTH.size
+        if offset + length > len(batch):
+            raise ValueError("Batch is truncated")
+        datagrams.append(batch[offset : offset + length])
+        offset += length
+    return datagrams
+
+
+class BatchingTransport:
+    """
+    Class to wrap a datagram transport, holding back what is sent to each destination for a
+    short window and sending it as one batch.
+
+    Datagrams that would not fit a batch are sent straight away, after whatever is held back for
+    their destination, so datagrams to one destination keep their order.
+    """
+
+    logger = logging.getLogger("BatchingTransport")
+
+    def __init__(
+        self, transport, window: float = BATCH_WINDOW, max_size: int = MAX_BATCH_SIZE
+    ) -> None:
+        """
+        Initialize a new instance of BatchingTransport.
+
+        Args:
+            transport (DatagramTransport): The transport to send batches with.
+            window (float): Seconds to hold back datagrams for, waiting for more to batch.
+            max_size (int): The largest batch to send, in bytes.
+        """
+        if not 0 < max_size <= MAX_DATAGRAM_SIZE:
+            raise ValueError(f"Batch size must be between 1 and {MAX_DATAGRAM_SIZE}")
+        self.transport = transport
+        self.window = window
+        self.max_size = max_size
+        self.pending = {}
+        self.timers = {}
+        self.datagrams_sent = 0
+        self.packets_sent = 0
+
+    def sendto(self, data: bytes, addr=None) -> None:
+        """
+        Queue a datagram for its destination, sending what is queued once it is full.
+        """
+        size = LENGTH.size + len(data)
+        if len(BATCH_PREFIX) + size > self.max_size:
+            self.flush(addr)
+            self.send(data, addr, 1)
+            return
+        batch = self.pending.get(addr)
+        if batch is not None and batch[1] + size > self.max_size:
+            self.flush(addr)
+            batch = None
+        if batch is None:
+            batch = self.pending[addr] = [[], len(BATCH_PREFIX)]
+            self.timers[addr] = asyncio.get_event_loop().call_later(
+                self.window, self.flush, addr
+            )
+        batch[0].append(data)
+        batch[1] += size
+
+    def flush(self, addr=None) -> None:
+        """
+        Send whatever is queued for a destination, as is if it is a single datagram.
+        """
+        timer = self.timers.pop(addr, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(addr, None)
+        if batch is None:
+            return
+        datagrams = batch[0]
+        if len(datagrams) == 1:
+            self.send(datagrams[0], addr, 1)
+        else:
+            self.send(pack_batch(datagrams), addr, len(datagrams))
+
+    def send(self, data: bytes, addr, count: int) -> None:
+        """Send a datagram holding count datagrams."""
+        self.transport.sendto(data, addr)
+        self.datagrams_sent += count
+        self.packets_sent += 1
+
+    def close(self) -> None:
+        """Send everything queued, then close the transport."""
+        for addr in list(self.pending):
+            self.flush(addr)
+        self.transport.close()
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Module to split values too large for a single rpc into chunks and to put them back together.
+
+rpcudp refuses to send an rpc whose arguments take up more than 8K, so larger values are sent
+as a manifest followed by numbered chunks, and reassembled on the receiving node before they
+are stored.
+"""
+
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+from hashlib import sha1
+import logging
+import time
+
+CHUNK_SIZE = 7 * 1024
+MAX_INLINE_SIZE = 7 * 1024
+TRANSFER_TIMEOUT = 30.0
+MAX_VALUE_SIZE = 16 * 1024 * 1024
+MAX_BUFFERED_SIZE = 64 * 1024 * 1024
+
+Manifest = namedtuple("Manifest", ["key", "size", "count", "digest"])
+Manifest.__annotations__ = {"key": bytes, "size": int, "count": int, "digest": bytes}
+
+Reassembled = namedtuple("Reassembled", ["key", "value", "tag"])
+Reassembled.__annotations__ = {"key": bytes, "value": bytes, "tag": str}
+
+
+def split_value(value: bytes, chunk_size: int = CHUNK_SIZE) -> tuple[Manifest, list]:
+    """
+    Split a value into chunks and describe them in a manifest.
+
+    Args:
+        value: the value to split.
+        chunk_size: the largest number of bytes in a chunk.
+
+    Returns:
+        tuple: the manifest, without a key, and the list of chunks.
+    """
+    chunks = [
+        value[start : start + chunk_size] for start in range(0, len(value), chunk_size)
+    ]
+    return Manifest(None, len(value), len(chunks), sha1(value).digest()), chunks
+
+
+@dataclass
+class Transfer:
+    """
+    Chunks of one value received so far.
+    """
+
+    manifest: Manifest
+    started: float
+    tag: str = None
+    chunks: dict = field(default_factory=dict)
+    received: int = 0
+
+
+class Reassembler:
+    """
+    Class to collect the chunks of values and put the values back together.
+
+    Transfers that do not complete within the timeout are dropped, and the total size of
+    incomplete transfers is bounded by dropping the oldest ones first.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        timeout: float = TRANSFER_TIMEOUT,
+        max_value_size: int = MAX_VALUE_SIZE,
+        max_buffered_size: int = MAX_BUFFERED_SIZE,
+        clock=time.monotonic,
+    ) -> None:
+        """
+        Initialize a new instance of Reassembler.
+
+        Args:
+            timeout (float): seconds a transfer may take before it is dropped.
+            max_value_size (int): the largest value that will be accepted.
+            max_buffered_size (int): the largest total size of incomplete transfers.
+            clock (callable): returns the current time in seconds.
+        """
+        self.logger = logging.getLogger("Reassembler")
+        self.timeout = timeout
+        self.max_value_size = max_value_size
+        self.max_buffered_size = max_buffered_size
+        self.clock = clock
+        self.transfers = OrderedDict()
+        self.buffered_size = 0
+
+    def start(self, transfer_id, manifest: Manifest, tag: str = None) -> bool:
+        """
+        Start collecting the chunks described by a manifest.
+
+        Args:
+            transfer_id: identifies the transfer in later calls to add.
+            manifest (Manifest): the key, size, number of chunks and sha1 digest of the value.
+            tag (str): returned along with the value, to tell what the value is for.
+
+        Returns:
+            bool: whether the transfer was accepted.
+        """
+        self.expire()
+        if transfer_id in self.transfers:
+            return True
+        if not 0 < manifest.size <= min(self.max_value_size, self.max_buffered_size):
+            self.logger.warning("Rejecting transfer of %s bytes", manifest.size)
+            return False
+        if not 0 < manifest.count <= manifest.size:
+            self.logger.warning("Rejecting transfer of %s chunks", manifest.count)
+            return False
+        while self.buffered_size + manifest.size > self.max_buffered_size:
+            dropped_id = next(iter(self.transfers))
+            self.remove(dropped_id)
+            self.drop(dropped_id, "to make room")
+        self.transfers[transfer_id] = Transfer(manifest, self.clock(), tag)
+        self.buffered_size += manifest.size
+        return True
+
+    def add(self, transfer_id, index: int, chunk: bytes) -> tuple:
+        """
+        Add a chunk to a transfer.
+
+        Args:
+            transfer_id: the transfer the chunk belongs to.
+            index (int): the position of the chunk in the value.
+            chunk (bytes): the chunk.
+
+        Returns:
+            tuple: whether the chunk was accepted, and the Reassembled key, value and tag once
+                the last chunk of the transfer has arrived, else None.
+        """
+        self.expire()
+        transfer = self.transfers.get(transfer_id)
+        if (
+            transfer is None
+            or not isinstance(chunk, bytes)
+            or not 0 <= index < transfer.manifest.count
+        ):
+            return False, None
+        if index in transfer.chunks:
+            return True, None
+        if transfer.received + len(chunk) > transfer.manifest.size:
+            self.remove(transfer_id)
+            self.drop(transfer_id, "as it exceeds its size")
+            return False, None
+        transfer.chunks[index] = chunk
+        transfer.received += len(chunk)
+        if len(transfer.chunks) < transfer.manifest.count:
+            return True, None
+
+        self.remove(transfer_id)
+        value = b"".join(
+            transfer.chunks[position] for position in sorted(transfer.chunks)
+        )
+        if (
+            len(value) != transfer.manifest.size
+            or sha1(value).digest() != transfer.manifest.digest
+        ):
+            self.drop(transfer_id, "as it does not match its manifest")
+            return False, None
+        return True, Reassembled(transfer.manifest.key, value, transfer.tag)
+
+    def expire(self) -> None:
+        """Drop the transfers that did not complete in time."""
+        deadline = self.clock() - self.timeout
+        while self.transfers:
+            transfer_id, transfer = next(iter(self.transfers.items()))
+            if transfer.started > deadline:
+                break
+            self.remove(transfer_id)
+            self.drop(transfer_id, "after timing out")
+
+    def remove(self, transfer_id) -> None:
+        """Stop tracking a transfer."""
+        transfer = self.transfers.pop(transfer_id, None)
+        if transfer is not None:
+            self.buffered_size -= transfer.manifest.size
+
+    def drop(self, transfer_id, reason: str) -> None:
+        """Log that a transfer was dropped."""
+        self.logger.warning("Dropped transfer %s %s", transfer_id, reason)
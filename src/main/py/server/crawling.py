@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Module for lookups that prefer the contacts which answer fastest.
+
+kademlia's spider crawls always ask the alpha closest contacts they have not asked yet. These
+crawls ask the fastest of the contacts that are about as close, in the same bucket relative to
+the target, and ask more contacts at once when rpcs are being lost.
+"""
+
+from kademlia.crawling import NodeSpiderCrawl, SpiderCrawl, ValueSpiderCrawl
+from kademlia.utils import gather_dict
+
+
+def order_by_latency(nodes: list, target, latency) -> list:
+    """
+    Order nodes by how close they are to the target, to within a power of two, and then by
+    the time an rpc to them is expected to take.
+
+    Args:
+        nodes (list): The nodes to order.
+        target (Node): The node being looked up.
+        latency (LatencyTracker): The round trip times and timeouts of contacts.
+    """
+    return sorted(
+        nodes,
+        key=lambda node: (
+            target.distance_to(node).bit_length(),
+            latency.get_score(node.id),
+        ),
+    )
+
+
+# pylint: disable=too-few-public-methods,abstract-method
+class LatencyAwareCrawl(SpiderCrawl):
+    """
+    Base for spider crawls that pick the contacts to ask by latency as well as distance.
+
+    The protocol has to keep a LatencyTracker as its latency attribute.
+    """
+
+    async def _find(self, rpcmethod):
+        """
+        Ask the next contacts, and handle their answers as the spider crawl does.
+        """
+        count = self.protocol.latency.get_parallelism(self.alpha, self.ksize)
+        if self.nearest.get_ids() == self.last_ids_crawled:
+            count = len(self.nearest)
+        self.last_ids_crawled = self.nearest.get_ids()
+
+        peers = order_by_latency(
+            self.nearest.get_uncontacted(), self.node, self.protocol.latency
+        )
+        calls = {}
+        for peer in peers[:count]:
+            calls[peer.id] = rpcmethod(peer, self.node)
+            self.nearest.mark_contacted(peer)
+        found = await gather_dict(calls)
+        return await self._nodes_found(found)
+
+
+class LatencyAwareNodeSpiderCrawl(LatencyAwareCrawl, NodeSpiderCrawl):
+    """
+    Crawl to find the nodes closest to a key, asking the fastest contacts first.
+    """
+
+
+class LatencyAwareValueSpiderCrawl(LatencyAwareCrawl, ValueSpiderCrawl):
+    """
+    Crawl to find the value of a key, asking the fastest contacts first.
+    """
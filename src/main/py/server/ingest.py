@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Module to hand received values to the data stored callback through a bounded queue.
+
+A fixed number of workers take values off the queue, so a burst of stores cannot create an
+unbounded number of tasks. Once the queue is full, the overload policy decides what gives way.
+"""
+
+import asyncio
+import logging
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+REJECT = "reject"
+OVERLOAD_POLICIES = (DROP_OLDEST, DROP_NEWEST, REJECT)
+
+INGEST_QUEUE_SIZE = 1024
+INGEST_WORKERS = 4
+
+
+# pylint: disable=too-many-instance-attributes
+class IngestQueue:
+    """
+    Class to queue received values for a pool of workers that pass them to a callback.
+
+    Overload policies, once the queue is full:
+    - drop_oldest: drop the value that has waited longest to make room for the new one.
+    - drop_newest: drop the new value.
+    - reject: drop the new value and tell the sender, by not storing it.
+    """
+
+    logger = logging.getLogger("IngestQueue")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        callback,
+        max_size: int = INGEST_QUEUE_SIZE,
+        workers: int = INGEST_WORKERS,
+        policy: str = DROP_OLDEST,
+        dropped_callback=None,
+    ) -> None:
+        """
+        Initialize a new instance of IngestQueue.
+
+        Args:
+            callback (callable): Coroutine function called with each key and value.
+            max_size (int): The largest number of values waiting in the queue.
+            workers (int): The number of values passed to the callback at once.
+            policy (str): What to do when the queue is full, one of OVERLOAD_POLICIES.
+            dropped_callback (callable): Called with the key and value of each value dropped
+                or rejected, so it can be received again.
+        """
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy {policy}")
+        self.callback = callback
+        self.max_size = max_size
+        self.worker_count = workers
+        self.policy = policy
+        self.dropped_callback = dropped_callback
+        self.queue = None
+        self.workers = []
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def put(self, key, value) -> bool:
+        """
+        Queue a value for the callback, starting the workers on first use.
+
+        Returns:
+            bool: False if the value was rejected, True otherwise, even if it was dropped.
+        """
+        if self.queue is None:
+            self.start()
+        self.received += 1
+        if self.queue.full():
+            if self.policy == REJECT:
+                self.rejected += 1
+                self.drop(key, value)
+                return False
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                self.drop(key, value)
+                return True
+            self.drop(*self.queue.get_nowait())
+            self.queue.task_done()
+        self.queue.put_nowait((key, value))
+        return True
+
+    def drop(self, key, value) -> None:
+        """Tell dropped_callback about a value that will not be passed to the callback."""
+        if self.dropped_callback is not None:
+            self.dropped_callback(key, value)
+
+    def start(self) -> None:
+        """Create the queue and start the workers."""
+        self.queue = asyncio.Queue(self.max_size)
+        self.workers = [
+            asyncio.create_task(self.work()) for _ in range(self.worker_count)
+        ]
+
+    def stop(self) -> None:
+        """Stop the workers, dropping whatever is still queued."""
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+        self.queue = None
+
+    async def join(self) -> None:
+        """Wait until every queued value has been passed to the callback."""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def work(self) -> None:
+        """Pass queued values to the callback, one at a time, until cancelled."""
+        queue = self.queue
+        while True:
+            key, value = await queue.get()
+            try:
+                await self.callback(key, value)
+                self.processed += 1
+            except Exception:  # pylint: disable=broad-exception-caught
+                self.failed += 1
+                self.logger.exception("Data stored callback failed")
+            finally:
+                queue.task_done()
+
+    def get_depth(self) -> int:
+        """Returns the number of values waiting in the queue."""
+        return 0 if self.queue is None else self.queue.qsize()
+
+    def get_stats(self) -> dict:
+        """Returns the queue depth and the counters of what happened to received values."""
+        return {
+            "depth": self.get_depth(),
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Module to keep track of how quickly, and how reliably, contacts answer rpcs.
+
+Round trip times are smoothed the way TCP smooths them, and timeouts are tracked as a smoothed
+loss rate, both per contact and across all contacts.
+"""
+
+from collections import OrderedDict
+import math
+
+RTT_GAIN = 0.125
+LOSS_GAIN = 0.1
+INITIAL_RTT = 0.1
+RPC_TIMEOUT = 5.0
+MAX_LOSS = 0.9
+LATENCY_CACHE_SIZE = 4096
+
+
+class LatencyTracker:
+    """
+    Class to record the round trip time or timeout of each rpc, and to score contacts by the
+    time an rpc to them is expected to take.
+    """
+
+    def __init__(
+        self, maxsize: int = LATENCY_CACHE_SIZE, timeout: float = RPC_TIMEOUT
+    ) -> None:
+        """
+        Initialize a new instance of LatencyTracker.
+
+        Args:
+            maxsize (int): The number of contacts to remember, least recently heard of first
+                to be forgotten.
+            timeout (float): Seconds an rpc waits for a reply before it times out.
+        """
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.contacts = OrderedDict()
+        self.loss = 0.0
+
+    def record(self, node_id: bytes, rtt: float = None) -> None:
+        """
+        Record the round trip time of an rpc to a contact, or None if it timed out.
+        """
+        rtt_estimate, loss = self.contacts.pop(node_id, (None, 0.0))
+        if rtt is None:
+            loss += LOSS_GAIN * (1 - loss)
+            self.loss += LOSS_GAIN * (1 - self.loss)
+        else:
+            loss -= LOSS_GAIN * loss
+            self.loss -= LOSS_GAIN * self.loss
+            rtt_estimate = (
+                rtt
+                if rtt_estimate is None
+                else rtt_estimate + RTT_GAIN * (rtt - rtt_estimate)
+            )
+        self.contacts[node_id] = (rtt_estimate, loss)
+        if len(self.contacts) > self.maxsize:
+            self.contacts.popitem(last=False)
+
+    def get_rtt(self, node_id: bytes):
+        """
+        Returns the smoothed round trip time of a contact, or None if it never answered.
+        """
+        return self.contacts.get(node_id, (None, 0.0))[0]
+
+    def get_score(self, node_id: bytes) -> float:
+        """
+        Returns the time an rpc to a contact is expected to take, counting its timeouts.
+
+        Contacts that never answered are assumed to answer in INITIAL_RTT.
+        """
+        rtt_estimate, loss = self.contacts.get(node_id, (None, 0.0))
+        rtt_estimate = INITIAL_RTT if rtt_estimate is None else rtt_estimate
+        return (1 - loss) * rtt_estimate + loss * self.timeout
+
+    def get_parallelism(self, alpha: int, max_parallelism: int) -> int:
+        """
+        Returns the number of rpcs a lookup should send at once to get alpha replies, given
+        the loss rate observed across all contacts.
+        """
+        loss = min(self.loss, MAX_LOSS)
+        return max(alpha, min(max_parallelism, math.ceil(alpha / (1 - loss))))
@@ -1,10 +1,66 @@
 #!/usr/bin/env python3
 """ This module contains the NewServer class. """
 
+import asyncio
+from collections import namedtuple
+import logging
+import os
 from kademlia.network import Server
-from server.protocol import NotificationProtocol
+from kademlia.node import Node
+from kademlia.utils import digest
+import umsgpack
+from utils import SeenCache
+from server.batching import MAX_BATCH_SIZE
+from server.chunking import MAX_INLINE_SIZE
+from server.crawling import LatencyAwareNodeSpiderCrawl, LatencyAwareValueSpiderCrawl
+from server.ingest import DROP_OLDEST, INGEST_QUEUE_SIZE, INGEST_WORKERS, IngestQueue
+from server.protocol import (
+    GOSSIP_FANOUT,
+    GOSSIP_TTL,
+    SEEN_VALUES_CACHE_SIZE,
+    SEEN_VALUES_TTL,
+    NotificationProtocol,
+    get_seen_key,
+)
+from server.ratelimit import RATE_LIMITER_SIZE, RateLimiter
+from server.storage import MemoryStorage, SqliteStorage
+from server.streaming import (
+    BULK_THRESHOLD,
+    BulkStore,
+    read_pointer,
+    serve_bulk,
+)
+from server.sync import MerkleIndex
 
+CONTACTS_SAVE_INTERVAL = 60
+JOIN_MIN_CONTACTS = 1
+JOIN_ATTEMPTS = 5
+JOIN_BACKOFF = 0.5
+REPUBLISH_INTERVAL = 3600
+SYNC_REQUEST_KEYS = 128
 
+ReplicationPolicy = namedtuple("ReplicationPolicy", ["replicas", "ttl", "republish"])
+ReplicationPolicy.__annotations__ = {"replicas": int, "ttl": float, "republish": bool}
+DEFAULT_POLICY = ReplicationPolicy(None, None, True)
+
+
+def load_contacts(path: str):
+    """
+    Read a routing table snapshot written by NotifyingServer.save_contacts.
+
+    Returns:
+        tuple: the ID of the node that saved the snapshot and a list of (node ID, ip, port)
+            tuples for its contacts, or None if there is no readable snapshot.
+    """
+    try:
+        with open(path, "rb") as file:
+            snapshot = umsgpack.unpack(file)
+        return snapshot["id"], [tuple(contact) for contact in snapshot["contacts"]]
+    except (OSError, umsgpack.UnpackException, KeyError, TypeError):
+        return None
+
+
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
 class NotifyingServer(Server):
     """
     A custom server class that extends the functionality of the base Server class.
@@ -21,7 +77,32 @@ class NotifyingServer(Server):
 
     """
 
-    def __init__(self, data_stored_callback, ksize=20, alpha=3, node_id=None):
+    logger = logging.getLogger("NotifyingServer")
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(
+        self,
+        data_stored_callback,
+        ksize=20,
+        alpha=3,
+        node_id=None,
+        batch_window=None,
+        batch_size=MAX_BATCH_SIZE,
+        gossip_fanout=GOSSIP_FANOUT,
+        gossip_ttl=GOSSIP_TTL,
+        ingest_queue_size=INGEST_QUEUE_SIZE,
+        ingest_workers=INGEST_WORKERS,
+        ingest_policy=DROP_OLDEST,
+        storage=None,
+        replication_policies=None,
+        classify_value=None,
+        seen_cache_size=SEEN_VALUES_CACHE_SIZE,
+        seen_cache_ttl=SEEN_VALUES_TTL,
+        bulk_threshold=BULK_THRESHOLD,
+        rate_limits=None,
+        default_rate_limit=None,
+        rate_limiter_size=RATE_LIMITER_SIZE,
+    ):
         """
         Initializes a new instance of the NewServer class.
 
@@ -29,12 +110,76 @@ class NotifyingServer(Server):
             ksize (int): The size of the k-buckets in the Kademlia DHT.
             alpha (int): The concurrency parameter for network operations.
             store_callback (callable): A callback function called when data is stored.
+            batch_window (float): Seconds to hold back datagrams to the same destination to
+                send them as one batch, or None to send every datagram on its own.
+            batch_size (int): The largest batch to send, in bytes.
+            gossip_fanout (int): The number of nodes each node passes gossip on to.
+            gossip_ttl (int): The number of rounds gossip is passed on for.
+            ingest_queue_size (int): The largest number of received values waiting for
+                store_callback.
+            ingest_workers (int): The number of values passed to store_callback at once.
+            ingest_policy (str): "drop_oldest", "drop_newest" or "reject", what to do with
+                received values once the ingest queue is full.
+            storage (IStorage): Where to keep the values stored on this node, in memory with
+                MemoryStorage by default.
+            replication_policies (dict): The ReplicationPolicy for each kind of value, of which
+                replicas None stores on ksize nodes and ttl None keeps values for the storage's
+                ttl. Values of other kinds follow DEFAULT_POLICY.
+            classify_value (callable): Returns the kind of a value, a key of
+                replication_policies.
+            seen_cache_size (int): The number of values received recently to remember, so
+                they are passed to store_callback only once.
+            seen_cache_ttl (float): Seconds a value is remembered for after it was last
+                received, longer than REPUBLISH_INTERVAL to skip republished values.
+            bulk_threshold (int): The size in bytes from which values are sent as a pointer,
+                and pulled by the nodes that receive it over a stream.
+            rate_limits (dict): The RateLimit at which each node may store or deliver values
+                of each kind on this one, classified by classify_value.
+            default_rate_limit (RateLimit): The RateLimit for values of other kinds, or None
+                to allow them at any rate.
+            rate_limiter_size (int): The number of senders to keep rate limits for.
 
         """
         self.data_stored_callback = data_stored_callback
+        self.batching = (
+            None
+            if batch_window is None
+            else {"window": batch_window, "max_size": batch_size}
+        )
+        self.gossip_fanout = gossip_fanout
+        self.gossip_ttl = gossip_ttl
+        self.ingest = IngestQueue(
+            data_stored_callback,
+            ingest_queue_size,
+            ingest_workers,
+            ingest_policy,
+            dropped_callback=self.forget_value,
+        )
+        self.save_contacts_loop = None
+        self.seen_values = SeenCache(seen_cache_size, seen_cache_ttl)
+        self.merkle_index = MerkleIndex()
+        self.rate_limiter = RateLimiter(
+            rate_limits, default_rate_limit, rate_limiter_size
+        )
+        self.ready = asyncio.Event()
+        self.bulk_threshold = bulk_threshold
+        self.bulk_store = BulkStore()
+        self.bulk_server = None
+        self.bulk_port = None
         # Call the parent class's __init__ with the new protocol
 
+        self.replication_policies = replication_policies or {}
+        self.classify_value = classify_value
         super().__init__(ksize, alpha, node_id=node_id)
+        # Server falls back to ForgetfulStorage for any falsy storage, even an empty one.
+        self.storage = MemoryStorage() if storage is None else storage
+
+    def forget_value(self, _key, value) -> None:
+        """
+        Forget that a value dropped by the ingest queue was seen, so it is passed to
+        store_callback if it is received again.
+        """
+        self.seen_values.discard(get_seen_key(value))
 
     def _create_protocol(self):
         """
@@ -45,5 +190,403 @@ class NotifyingServer(Server):
 
         """
         return NotificationProtocol(
-            self.node, self.storage, self.ksize, self.data_stored_callback
+            self.node,
+            self.storage,
+            self.ksize,
+            self.data_stored_callback,
+            batching=self.batching,
+            gossip_fanout=self.gossip_fanout,
+            gossip_ttl=self.gossip_ttl,
+            ingest=self.ingest,
+            seen_values=self.seen_values,
+            merkle_index=self.merkle_index,
+            rate_limiter=self.rate_limiter,
+            classify_value=self.classify_value,
+            bulk_store=self.bulk_store,
+            bulk_threshold=self.bulk_threshold,
+        )
+
+    async def listen(self, port, interface="0.0.0.0"):
+        """
+        Start listening for rpcs on a UDP port, and for requests of bulk values on the TCP port
+        of the same number, or on any free TCP port if that one is taken.
+        """
+        await super().listen(port, interface)
+        udp_port = self.transport.get_extra_info("sockname")[1]
+        try:
+            self.bulk_server = await asyncio.start_server(
+                self.serve_bulk_stream, interface, udp_port
+            )
+        except OSError:
+            self.bulk_server = await asyncio.start_server(
+                self.serve_bulk_stream, interface, 0
+            )
+        self.bulk_port = self.bulk_server.sockets[0].getsockname()[1]
+        self.protocol.bulk_port = self.bulk_port
+
+    async def serve_bulk_stream(self, reader, writer) -> None:
+        """Serve the bulk values this node sent pointers to over a stream."""
+        await serve_bulk(self.bulk_store, reader, writer)
+
+    def stop(self):
+        """
+        Send any datagrams held back for batching, stop the ingest workers, saving contacts
+        and serving bulk values, then stop the server and close its storage.
+        """
+        if self.protocol is not None and self.batching is not None:
+            self.protocol.transport.close()
+        if self.bulk_server is not None:
+            self.bulk_server.close()
+        self.ingest.stop()
+        if self.save_contacts_loop is not None:
+            self.save_contacts_loop.cancel()
+        super().stop()
+        if isinstance(self.storage, SqliteStorage):
+            self.storage.close()
+
+    async def get(self, key):
+        """
+        Get the value of a key from this node, or else from the network, asking the fastest
+        of the closest contacts first.
+
+        Returns:
+            The value, or None if it was not found.
+        """
+        dkey = digest(key)
+        if self.storage.get(dkey) is not None:
+            return self.storage.get(dkey)
+        node = Node(dkey)
+        nearest = self.protocol.router.find_neighbors(node)
+        if not nearest:
+            self.logger.warning("There are no known neighbors to get key %s", key)
+            return None
+        spider = LatencyAwareValueSpiderCrawl(
+            self.protocol, node, nearest, self.ksize, self.alpha
+        )
+        return await self.resolve_bulk(await spider.find())
+
+    async def resolve_bulk(self, value):
+        """
+        Returns the value a pointer points to, pulled over a stream unless this node sent it,
+        or the value itself if it is not a pointer.
+        """
+        pointer = read_pointer(value)
+        if pointer is None:
+            return value
+        held = self.bulk_store.get(pointer.digest)
+        if held is not None:
+            return held
+        if not pointer.host:
+            return None
+        return await self.protocol.fetch_bulk_value(pointer)
+
+    async def set_digest(self, dkey, value):
+        """
+        Store a value on the nodes closest to its digested key, asking the fastest of the
+        closest contacts first while looking them up.
+
+        Returns:
+            bool: whether any node accepted the value, rather than rejecting it for exceeding
+                a rate limit or finding its ingest queue full.
+        """
+        node = Node(dkey)
+        nearest = self.protocol.router.find_neighbors(node)
+        if not nearest:
+            self.logger.warning(
+                "There are no known neighbors to set key %s", dkey.hex()
+            )
+            return False
+        spider = LatencyAwareNodeSpiderCrawl(
+            self.protocol, node, nearest, self.ksize, self.alpha
+        )
+        nodes = await spider.find()
+        nodes = nodes[: self.get_policy(value).replicas or self.ksize]
+        # Store here as well if this node is among the closest.
+        if self.node.distance_to(node) < max(
+            (n.distance_to(node) for n in nodes), default=0
+        ):
+            self.storage[dkey] = value
+        value = self.protocol.publish_bulk(value)
+        results = await asyncio.gather(
+            *(self.protocol.call_store(n, dkey, value) for n in nodes)
+        )
+        return any(result[0] and result[1] for result in results)
+
+    def get_policy(self, value) -> ReplicationPolicy:
+        """Returns the replication policy for the kind of a value."""
+        if self.classify_value is None:
+            return DEFAULT_POLICY
+        return self.replication_policies.get(self.classify_value(value), DEFAULT_POLICY)
+
+    async def _refresh_table(self):
+        """
+        Look up a random ID in each bucket that saw no lookups in the last hour, then expire
+        and republish stored values as their replication policies say.
+        """
+        lookups = []
+        for node_id in self.protocol.get_refresh_ids():
+            node = Node(node_id)
+            nearest = self.protocol.router.find_neighbors(node, self.alpha)
+            spider = LatencyAwareNodeSpiderCrawl(
+                self.protocol, node, nearest, self.ksize, self.alpha
+            )
+            lookups.append(spider.find())
+        await asyncio.gather(*lookups)
+        await self.republish()
+
+    async def republish(self) -> None:
+        """
+        Delete stored values older than the ttl of their replication policy, then set again
+        those stored more than REPUBLISH_INTERVAL ago whose policy asks for republishing.
+        """
+        ttls = {policy.ttl for policy in self.replication_policies.values()}
+        for ttl in sorted(ttls - {None}):
+            expired = [
+                dkey
+                for dkey, value in self.storage.iter_older_than(ttl)
+                if self.get_policy(value).ttl == ttl
+            ]
+            for dkey in expired:
+                del self.storage[dkey]
+        for dkey, value in self.storage.iter_older_than(REPUBLISH_INTERVAL):
+            if self.get_policy(value).republish:
+                await self.set_digest(dkey, value)
+
+    async def deliver(self, node_id: bytes, key, value) -> bool:
+        """
+        Deliver a value straight to one node, so that only that node handles it.
+
+        The node has to be in the routing table, as lookups never return the node looked up.
+        If it is not there, or it does not answer, the value is set on the network instead.
+
+        Args:
+            node_id (bytes): The ID of the node to deliver to.
+            key: The key of the value, digested like the key given to set.
+            value: The value.
+
+        Returns:
+            bool: whether the value was delivered or set.
+        """
+        dkey = digest(key)
+        node = self.find_contact(node_id)
+        if node is not None:
+            result = await self.protocol.call_deliver(node, dkey, value)
+            if result[0] and result[1]:
+                return True
+            self.logger.warning("Could not deliver to %s, setting instead", node)
+        return await self.set_digest(dkey, value)
+
+    def find_contact(self, node_id: bytes):
+        """
+        Find a node in the routing table by its ID.
+
+        Returns:
+            Node: the node, or None if it is not in the routing table.
+        """
+        router = self.protocol.router
+        index = router.get_bucket_for(Node(node_id))
+        if index is None:
+            return None
+        bucket = router.buckets[index]
+        return bucket.nodes.get(node_id) or bucket.replacement_nodes.get(node_id)
+
+    async def gossip(self, key, value) -> bool:
+        """
+        Spread a value to the whole network, rather than to the nodes closest to its key.
+
+        Each node passes the value on to gossip_fanout random nodes it knows, for gossip_ttl
+        rounds, and only the first time it sees the key. So the value reaches most of the
+        network within a number of rounds logarithmic in its size, while each node sends it
+        at most gossip_fanout times.
+
+        Args:
+            key: The key of the value, digested like the key given to set.
+            value: The value, small enough to fit a single rpc or published as a pointer.
+
+        Returns:
+            bool: whether any node received the value.
+        """
+        value = self.protocol.publish_bulk(value)
+        if isinstance(value, bytes) and len(value) > MAX_INLINE_SIZE:
+            self.logger.warning("Value of %s bytes is too large to gossip", len(value))
+            return False
+        dkey = digest(key)
+        self.protocol.gossip_seen.add(dkey)
+        calls = self.protocol.spread_gossip(dkey, value, self.gossip_ttl - 1)
+        results = await asyncio.gather(*calls)
+        return any(result[0] for result in results)
+
+    def save_contacts(self, path: str) -> None:
+        """
+        Save this node's ID and every contact in its routing table, to warm_bootstrap from after
+        a restart.
+
+        The snapshot is written to a temporary file first, so a node that dies while saving
+        leaves the previous snapshot intact.
+        """
+        contacts = [
+            (node.id, node.ip, node.port)
+            for bucket in self.protocol.router.buckets
+            for node in bucket.get_nodes()
+        ]
+        if not contacts:
+            self.logger.warning("No contacts in the routing table, not saving them")
+            return
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            umsgpack.pack({"id": self.node.id, "contacts": contacts}, file)
+        os.replace(temporary_path, path)
+
+    def save_contacts_regularly(
+        self, path: str, interval: float = CONTACTS_SAVE_INTERVAL
+    ) -> None:
+        """
+        Save the routing table snapshot now and every interval seconds until stopped.
+        """
+        self.save_contacts(path)
+        self.save_contacts_loop = asyncio.get_event_loop().call_later(
+            interval, self.save_contacts_regularly, path, interval
         )
+
+    # pylint: disable=too-many-arguments
+    async def join(
+        self,
+        seeds: list,
+        contacts: list = (),
+        min_contacts: int = JOIN_MIN_CONTACTS,
+        attempts: int = JOIN_ATTEMPTS,
+        backoff: float = JOIN_BACKOFF,
+    ) -> bool:
+        """
+        Join the network, and set ready once the routing table holds min_contacts contacts.
+
+        Each attempt warm bootstraps from the contacts of a routing table snapshot along with
+        the seeds if there are any contacts, or bootstraps from all seeds at once if there are
+        not, so contacts that were briefly unreachable are tried again. Between attempts, the
+        wait doubles from backoff seconds. A node with neither seeds nor contacts starts a new
+        network, and is ready straight away.
+
+        Args:
+            seeds (list): (ip, port) tuples of nodes to bootstrap from.
+            contacts (list): (node ID, ip, port) tuples from a routing table snapshot.
+            min_contacts (int): The number of contacts the node needs to be ready.
+            attempts (int): The number of times to bootstrap before giving up.
+            backoff (float): Seconds to wait after the first attempt, if it is not the last.
+
+        Returns:
+            bool: whether the node is ready.
+        """
+        if not seeds and not contacts:
+            self.ready.set()
+            return True
+        for attempt in range(attempts):
+            if contacts:
+                await self.warm_bootstrap(contacts, seeds)
+            else:
+                await self.bootstrap(seeds)
+            if self.count_contacts() < min_contacts and attempt < attempts - 1:
+                await asyncio.sleep(backoff * 2**attempt)
+            if self.count_contacts() >= min_contacts:
+                self.ready.set()
+                return True
+            self.logger.info("Joined with too few contacts, attempt %d", attempt + 1)
+        return False
+
+    def count_contacts(self) -> int:
+        """Returns the number of contacts in the routing table."""
+        return sum(len(bucket.nodes) for bucket in self.protocol.router.buckets)
+
+    async def warm_bootstrap(self, contacts: list, seeds: list) -> bool:
+        """
+        Bootstrap from the contacts of a routing table snapshot along with the seeds.
+
+        All of them are pinged at once, and each one that answers goes straight into the
+        routing table. This returns as soon as the first one answers, rather than after the
+        slowest ping and a full lookup of this node. That lookup, which fills in the rest of
+        the routing table, runs in the background.
+
+        Args:
+            contacts (list): (node ID, ip, port) tuples of the contacts in the snapshot.
+            seeds (list): (ip, port) tuples of nodes to bootstrap from.
+
+        Returns:
+            bool: whether any contact or seed answered.
+        """
+        addresses = list(
+            dict.fromkeys([(ip, port) for _, ip, port in contacts] + seeds)
+        )
+        pings = [
+            asyncio.ensure_future(self.add_bootstrap_node(address))
+            for address in addresses
+        ]
+        for ping in asyncio.as_completed(pings):
+            if await ping is not None:
+                self.protocol.run_in_background(self.finish_bootstrap(pings))
+                return True
+        return False
+
+    async def add_bootstrap_node(self, address):
+        """
+        Ping a node, adding it to the routing table if it answers.
+
+        Returns:
+            Node: the node, or None if it did not answer.
+        """
+        node = await self.bootstrap_node(address)
+        if node is not None:
+            self.protocol.router.add_contact(node)
+        return node
+
+    async def finish_bootstrap(self, pings: list) -> None:
+        """
+        Look up this node through every node that answered a ping, once all pings are done.
+        """
+        nodes = [node for node in await asyncio.gather(*pings) if node is not None]
+        spider = LatencyAwareNodeSpiderCrawl(
+            self.protocol, self.node, nodes, self.ksize, self.alpha
+        )
+        await spider.find()
+
+    def add_to_sync(self, group, value) -> bytes:
+        """
+        Hold a value of a group, such as a fragment of an artwork, to reconcile with others.
+
+        Returns:
+            bytes: the key of the value in the group, its sha1 digest.
+        """
+        return self.merkle_index.add(group, value)
+
+    def discard_sync(self, group) -> None:
+        """Stop holding the values of a group."""
+        self.merkle_index.discard(group)
+
+    async def sync_with(self, node_id: bytes, group):
+        """
+        Get a node to deliver the values of a group it holds and this node lacks.
+
+        Only the subtrees of the two nodes' Merkle trees that differ are compared, so the
+        summaries exchanged grow with the number of missing values.
+
+        Args:
+            node_id (bytes): The ID of the node to reconcile with, from the routing table.
+            group: The group, such as an artwork ID.
+
+        Returns:
+            int: the number of values the node is delivering, or None if it is not in the
+                routing table or did not answer.
+        """
+        node = self.find_contact(node_id)
+        if node is None:
+            return None
+        missing = await self.protocol.reconcile(node, group)
+        if missing is None:
+            return None
+        delivering = 0
+        for start in range(0, len(missing), SYNC_REQUEST_KEYS):
+            replied, count = await self.protocol.call_timed(
+                node, "sync_request", group, missing[start : start + SYNC_REQUEST_KEYS]
+            )
+            if not replied or not isinstance(count, int):
+                return None
+            delivering += count
+        return delivering
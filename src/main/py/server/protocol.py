@@ -2,15 +2,78 @@
 Module for Kademlia library rpc_store() callback
 """
 import asyncio
+import logging
+import os
+import random
+import time
+from kademlia.node import Node
 from kademlia.protocol import KademliaProtocol
+from server.batching import BATCH_PREFIX, BatchingTransport, unpack_batch
+from server.ingest import IngestQueue
+from server.latency import LatencyTracker
+from server.ratelimit import RateLimiter
+from server.streaming import (
+    BULK_THRESHOLD,
+    BulkPointer,
+    BulkStore,
+    encode_pointer,
+    fetch_bulk,
+    read_pointer,
+)
+from server.sync import MAX_SYNC_PREFIXES, MerkleIndex, is_valid_prefix
+from server.chunking import (
+    CHUNK_SIZE,
+    MAX_INLINE_SIZE,
+    MAX_VALUE_SIZE,
+    Manifest,
+    Reassembler,
+    split_value,
+)
+from utils import SeenCache, generate_content_key
 
+CHUNK_WINDOW = 16
+CHUNK_ATTEMPTS = 3
+GOSSIP_FANOUT = 4
+GOSSIP_TTL = 8
+GOSSIP_CACHE_SIZE = 4096
+SEEN_VALUES_CACHE_SIZE = 16384
+SEEN_VALUES_TTL = 7200
+# The kind chunked transfers are rate limited as when they start, before their value is known.
+TRANSFER = "transfer"
 
+
+def get_seen_key(value):
+    """Returns the key a received value is remembered by, to pass it on only once."""
+    return generate_content_key(value) if isinstance(value, bytes) else value
+
+
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
 class NotificationProtocol(KademliaProtocol):
     """
     Class for Kademlia library rpc_store() callback
     """
 
-    def __init__(self, source_node, storage, ksize, data_stored_callback) -> None:
+    logger = logging.getLogger("NotificationProtocol")
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(
+        self,
+        source_node,
+        storage,
+        ksize,
+        data_stored_callback,
+        reassembler=None,
+        batching=None,
+        gossip_fanout=GOSSIP_FANOUT,
+        gossip_ttl=GOSSIP_TTL,
+        ingest=None,
+        seen_values=None,
+        merkle_index=None,
+        rate_limiter=None,
+        classify_value=None,
+        bulk_store=None,
+        bulk_threshold=BULK_THRESHOLD,
+    ) -> None:
         """
         Initialize a new instance of NewProtocol.
 
@@ -19,10 +82,75 @@ class NotificationProtocol(KademliaProtocol):
             storage (Storage): The storage object.
             ksize (int): The k parameter for Kademlia.
             callback_function (function): The callback function to be called on rpc_store
+            reassembler (Reassembler): Collects the chunks of values too large for one rpc.
+            batching (dict): Keyword arguments for a BatchingTransport to send through, or
+                None to send every datagram on its own.
+            gossip_fanout (int): The number of nodes each node passes gossip on to.
+            gossip_ttl (int): The most rounds gossip received is passed on for.
+            ingest (IngestQueue): Queues received values for data_stored_callback, and calls
+                forget for the values it drops.
+            seen_values (SeenCache): The values passed to data_stored_callback recently, so
+                replicated and republished values are only passed on once.
+            merkle_index (MerkleIndex): The values to reconcile with other nodes, per group.
+            rate_limiter (RateLimiter): Limits the rate at which each node may store or
+                deliver values of each kind, and start chunked transfers of kind TRANSFER, no
+                limit by default.
+            classify_value (callable): Returns the kind of a value, a key of the rate
+                limiter's limits.
+            bulk_store (BulkStore): Holds the bulk values this node sends, to serve over
+                streams.
+            bulk_threshold (int): The size in bytes from which values are sent as a pointer,
+                once bulk_port is set to the port of the stream server.
         """
         self.data_stored_callback = data_stored_callback
+        self.ingest = (
+            IngestQueue(data_stored_callback, dropped_callback=self.forget)
+            if ingest is None
+            else ingest
+        )
+        self.reassembler = Reassembler() if reassembler is None else reassembler
+        self.batching = batching
+        self.gossip_fanout = gossip_fanout
+        self.gossip_ttl = gossip_ttl
+        self.gossip_seen = SeenCache(GOSSIP_CACHE_SIZE)
+        self.seen_values = (
+            SeenCache(SEEN_VALUES_CACHE_SIZE, SEEN_VALUES_TTL)
+            if seen_values is None
+            else seen_values
+        )
+        self.background_tasks = set()
+        self.latency = LatencyTracker()
+        self.merkle_index = MerkleIndex() if merkle_index is None else merkle_index
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.classify_value = classify_value
+        self.bulk_store = BulkStore() if bulk_store is None else bulk_store
+        self.bulk_threshold = bulk_threshold
+        self.bulk_port = None
         super().__init__(source_node, storage, ksize)
 
+    def connection_made(self, transport):
+        """
+        Keep the transport to send with, wrapped to batch datagrams if batching is enabled.
+        """
+        if self.batching is not None:
+            transport = BatchingTransport(transport, **self.batching)
+        super().connection_made(transport)
+
+    def datagram_received(self, data, addr):
+        """
+        Handle a datagram, or each datagram in it if it is a batch.
+        """
+        if data[:1] != BATCH_PREFIX:
+            super().datagram_received(data, addr)
+            return
+        try:
+            datagrams = unpack_batch(data)
+        except ValueError:
+            self.logger.warning("Received malformed batch from %s, ignoring", addr)
+            return
+        for datagram in datagrams:
+            super().datagram_received(datagram, addr)
+
     def rpc_store(self, sender, nodeid, key, value):
         """
         Override the rpc_store method from the parent class.
@@ -33,5 +161,467 @@ class NotificationProtocol(KademliaProtocol):
             key (bytes): The key to store.
             value (bytes): The value to store.
         """
-        super().rpc_store(sender, nodeid, key, value)
-        asyncio.create_task(self.data_stored_callback(key, value))
+        if not self.admit(nodeid, value):
+            self.logger.warning("Rejecting store from %s, rate limit exceeded", sender)
+            return False
+        pointer = read_pointer(self.complete_pointer(value, sender))
+        if pointer is not None:
+            self.welcome_if_new(Node(nodeid, sender[0], sender[1]))
+            self.run_in_background(self.receive_bulk(key, pointer, store=True))
+            return True
+        if not self.notify(key, value):
+            self.logger.warning("Rejecting store from %s, ingest queue is full", sender)
+            return False
+        return super().rpc_store(sender, nodeid, key, value)
+
+    def rpc_find_value(self, sender, nodeid, key):
+        """
+        Return the value of a key, as a pointer to serve over a stream if it is a bulk value,
+        or the nodes this node knows closest to the key.
+        """
+        result = super().rpc_find_value(sender, nodeid, key)
+        if isinstance(result, dict) and "value" in result:
+            result["value"] = self.publish_bulk(result["value"])
+        return result
+
+    def classify(self, value):
+        """
+        Returns the kind of a value, as given by classify_value, or the kind a pointer to a
+        bulk value claims for it.
+        """
+        pointer = read_pointer(value)
+        if pointer is not None:
+            return pointer.kind
+        if self.classify_value is None or not isinstance(value, bytes):
+            return None
+        return self.classify_value(value)
+
+    def admit(self, nodeid, value) -> bool:
+        """
+        Take a token from the sender's bucket for the kind of a value, classified from its
+        header alone, before anything else is done with the value.
+
+        Returns:
+            bool: whether the sender is within its rate limit.
+        """
+        return self.rate_limiter.allow(nodeid, self.classify(value))
+
+    def notify(self, key, value) -> bool:
+        """
+        Queue a value for data_stored_callback, unless it was seen recently.
+
+        Returns:
+            bool: False if the ingest queue rejected the value, True otherwise.
+        """
+        if not self.seen_values.add(get_seen_key(value)):
+            return True
+        return self.ingest.put(key, value)
+
+    def forget(self, _key, value) -> None:
+        """
+        Forget that a value was seen, as the ingest queue dropped it, so that receiving it
+        again, from a replica or through sync, passes it to data_stored_callback after all.
+        """
+        self.seen_values.discard(get_seen_key(value))
+
+    def publish_bulk(self, value):
+        """
+        Hold a value of at least bulk_threshold bytes to serve over streams.
+
+        Returns:
+            the pointer to send in place of the value, or the value itself if it is smaller.
+        """
+        if not isinstance(value, bytes) or len(value) < self.bulk_threshold:
+            return value
+        if self.bulk_port is None:
+            return value
+        pointer = BulkPointer(
+            self.bulk_store.add(value),
+            len(value),
+            "",
+            self.bulk_port,
+            self.classify(value),
+        )
+        return encode_pointer(pointer)
+
+    async def receive_bulk(self, key, pointer, store=False) -> None:
+        """
+        Pull the value a pointer points to over a stream, unless this node holds it already,
+        then queue it for data_stored_callback, and store it if it was sent with rpc_store.
+
+        The value is stored whole, so that this node serves it itself when asked for it or
+        when republishing it, rather than pointing back to the node that sent it.
+        """
+        value = self.storage.get(key) if store else None
+        if (
+            not isinstance(value, bytes)
+            or generate_content_key(value) != pointer.digest
+        ):
+            if not store and pointer.digest in self.seen_values:
+                return
+            value = await self.fetch_bulk_value(pointer)
+            if value is None:
+                return
+        if self.notify(key, value) and store:
+            self.storage[key] = value
+
+    async def fetch_bulk_value(self, pointer):
+        """
+        Pull the value a pointer points to over a stream.
+
+        Returns:
+            bytes: the value, or None if it could not be fetched, is too large, or is not of
+                the kind the pointer claims, when this node classifies values.
+        """
+        if not 0 < pointer.size <= MAX_VALUE_SIZE:
+            self.logger.warning("Ignoring bulk value of %s bytes", pointer.size)
+            return None
+        value = await fetch_bulk(pointer)
+        if (
+            value is not None
+            and self.classify_value is not None
+            and self.classify(value) != pointer.kind
+        ):
+            self.logger.warning("Ignoring bulk value not of the kind it claimed")
+            return None
+        return value
+
+    @staticmethod
+    def complete_pointer(value, sender):
+        """
+        Fill in the host of a pointer to a bulk value that was left for the receiver to fill
+        in, as the sender holds the value but does not know its own address.
+        """
+        pointer = read_pointer(value)
+        if pointer is None or pointer.host:
+            return value
+        return encode_pointer(pointer._replace(host=sender[0]))
+
+    def rpc_deliver(self, sender, nodeid, key, value):
+        """
+        Receive a value meant for this node alone, and pass it on without storing it.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            key (bytes): The key of the value.
+            value (bytes): The value.
+        """
+        self.welcome_if_new(Node(nodeid, sender[0], sender[1]))
+        if not self.admit(nodeid, value):
+            self.logger.warning(
+                "Rejecting delivery from %s, rate limit exceeded", sender
+            )
+            return False
+        pointer = read_pointer(self.complete_pointer(value, sender))
+        if pointer is not None:
+            self.run_in_background(self.receive_bulk(key, pointer))
+            return True
+        return self.notify(key, value)
+
+    def rpc_gossip(self, sender, nodeid, key, value, ttl):
+        """
+        Receive gossip, and pass it on to more nodes unless it was seen before or its time to
+        live ran out.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            key (bytes): The key of the value, which identifies the gossip.
+            value (bytes): The value.
+            ttl (int): The number of further rounds to pass the gossip on for.
+        """
+        source = Node(nodeid, sender[0], sender[1])
+        self.welcome_if_new(source)
+        if not isinstance(ttl, int) or isinstance(ttl, bool):
+            self.logger.warning("Rejecting gossip from %s, malformed ttl", sender)
+            return False
+        if not self.admit(nodeid, value):
+            self.logger.warning("Rejecting gossip from %s, rate limit exceeded", sender)
+            return False
+        if not self.gossip_seen.add(key):
+            return True
+        ttl = min(ttl, self.gossip_ttl - 1)
+        value = self.complete_pointer(value, sender)
+        pointer = read_pointer(value)
+        if pointer is not None:
+            self.run_in_background(self.receive_bulk(key, pointer))
+        else:
+            self.notify(key, value)
+        if ttl > 0:
+            for call in self.spread_gossip(key, value, ttl - 1, exclude=source):
+                self.run_in_background(call)
+        return True
+
+    def spread_gossip(self, key, value, ttl, exclude=None) -> list:
+        """
+        Pick up to gossip_fanout random nodes from the routing table to pass gossip on to.
+
+        Returns:
+            list: a call_gossip coroutine for each node picked.
+        """
+        contacts = [
+            node
+            for bucket in self.router.buckets
+            for node in bucket.get_nodes()
+            if exclude is None or node.id != exclude.id
+        ]
+        return [
+            self.call_gossip(node, key, value, ttl)
+            for node in random.sample(contacts, min(self.gossip_fanout, len(contacts)))
+        ]
+
+    async def call_gossip(self, node_to_ask, key, value, ttl):
+        """
+        Pass gossip on to a node.
+        """
+        return await self.call_timed(node_to_ask, "gossip", key, value, ttl)
+
+    async def call_find_node(self, node_to_ask, node_to_find):
+        """
+        Ask a node for the nodes it knows closest to another node.
+        """
+        return await self.call_timed(node_to_ask, "find_node", node_to_find.id)
+
+    async def call_find_value(self, node_to_ask, node_to_find):
+        """
+        Ask a node for the value of a key, or the nodes it knows closest to the key.
+        """
+        result = await self.call_timed(node_to_ask, "find_value", node_to_find.id)
+        if result[0] and isinstance(result[1], dict) and "value" in result[1]:
+            address = (node_to_ask.ip, node_to_ask.port)
+            result[1]["value"] = self.complete_pointer(result[1]["value"], address)
+        return result
+
+    async def call_ping(self, node_to_ask):
+        """
+        Ping a node.
+        """
+        return await self.call_timed(node_to_ask, "ping")
+
+    async def call_timed(self, node_to_ask, name, *args):
+        """
+        Call an rpc on a node, recording its round trip time, or that it timed out.
+        """
+        address = (node_to_ask.ip, node_to_ask.port)
+        started = time.monotonic()
+        result = await getattr(self, name)(address, self.source_node.id, *args)
+        self.latency.record(
+            node_to_ask.id, time.monotonic() - started if result[0] else None
+        )
+        return self.handle_call_response(result, node_to_ask)
+
+    def run_in_background(self, coroutine) -> asyncio.Task:
+        """
+        Run a coroutine as a task, keeping a reference to it until it is done.
+        """
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def rpc_sync_summary(self, sender, nodeid, group, prefix):
+        """
+        Summarise the values this node holds for a group under a prefix of their keys.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            group: The group, such as an artwork ID.
+            prefix (str): The hex digits the keys of the subtree start with.
+        """
+        self.welcome_if_new(Node(nodeid, sender[0], sender[1]))
+        if not is_valid_prefix(prefix):
+            return None
+        return self.merkle_index.summarize(group, prefix)
+
+    def rpc_sync_request(self, sender, nodeid, group, keys):
+        """
+        Deliver the values of a group the sender found it lacks, in the background.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            group: The group, such as an artwork ID.
+            keys (list): The keys of the values to deliver.
+
+        Returns:
+            int: the number of values that will be delivered.
+        """
+        node = Node(nodeid, sender[0], sender[1])
+        self.welcome_if_new(node)
+        values = [
+            (key, value)
+            for key, value in ((key, self.merkle_index.get(group, key)) for key in keys)
+            if value is not None
+        ]
+        self.run_in_background(self.deliver_values(node, values))
+        return len(values)
+
+    async def deliver_values(self, node_to_ask, values) -> None:
+        """Deliver values to a node one after the other."""
+        for key, value in values:
+            await self.call_deliver(node_to_ask, key, value)
+
+    async def reconcile(self, node_to_ask, group):
+        """
+        Compare the Merkle trees of a group on this node and another, descending only into
+        the subtrees that differ.
+
+        Returns:
+            list: the keys the other node holds for the group and this one lacks, or None if
+                the other node did not answer or answered with malformed summaries. At most
+                MAX_SYNC_PREFIXES subtrees are compared per level, the others are left for the
+                next reconciliation.
+        """
+        missing = []
+        prefixes = [""]
+        while prefixes:
+            results = await asyncio.gather(
+                *(
+                    self.call_timed(node_to_ask, "sync_summary", group, prefix)
+                    for prefix in prefixes
+                )
+            )
+            next_prefixes = []
+            for prefix, (replied, summary) in zip(prefixes, results):
+                if not replied:
+                    return None
+                try:
+                    keys, differing = self.merkle_index.find_missing(
+                        group, prefix, summary
+                    )
+                except ValueError:
+                    self.logger.warning("Malformed summary from %s", node_to_ask)
+                    return None
+                missing.extend(keys)
+                next_prefixes.extend(differing)
+            prefixes = next_prefixes[:MAX_SYNC_PREFIXES]
+        return missing
+
+    def rpc_store_manifest(self, sender, nodeid, transfer_id, key, size, count, digest):
+        """
+        Start receiving a value that is sent in chunks, to store once it is complete.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            transfer_id (bytes): Identifies the chunks that belong to the value.
+            key (bytes): The key to store the value under.
+            size (int): The size of the value.
+            count (int): The number of chunks.
+            digest (bytes): The sha1 digest of the value.
+        """
+        return self.start_transfer(
+            sender, nodeid, transfer_id, Manifest(key, size, count, digest), "store"
+        )
+
+    def rpc_deliver_manifest(
+        self, sender, nodeid, transfer_id, key, size, count, digest
+    ):
+        """
+        Start receiving a value that is sent in chunks, to deliver once it is complete.
+
+        Takes the same arguments as rpc_store_manifest.
+        """
+        return self.start_transfer(
+            sender, nodeid, transfer_id, Manifest(key, size, count, digest), "deliver"
+        )
+
+    def start_transfer(self, sender, nodeid, transfer_id, manifest, tag):
+        """
+        Start collecting the chunks of a value, tagged with the rpc to call once complete.
+        """
+        self.welcome_if_new(Node(nodeid, sender[0], sender[1]))
+        if not self.rate_limiter.allow(nodeid, TRANSFER):
+            self.logger.warning(
+                "Rejecting transfer from %s, rate limit exceeded", sender
+            )
+            return False
+        return self.reassembler.start((sender, transfer_id), manifest, tag)
+
+    def rpc_store_chunk(self, sender, nodeid, transfer_id, index, chunk):
+        """
+        Receive a chunk of a value, and store or deliver the value once all chunks arrived.
+
+        Args:
+            sender (Node): The sender node.
+            nodeid (bytes): The node ID.
+            transfer_id (bytes): Identifies the value the chunk belongs to.
+            index (int): The position of the chunk in the value.
+            chunk (bytes): The chunk.
+        """
+        accepted, reassembled = self.reassembler.add(
+            (sender, transfer_id), index, chunk
+        )
+        if reassembled is not None:
+            receive = (
+                self.rpc_deliver if reassembled.tag == "deliver" else self.rpc_store
+            )
+            receive(sender, nodeid, reassembled.key, reassembled.value)
+        return accepted
+
+    async def call_store(self, node_to_ask, key, value):
+        """
+        Store a value on a node, in chunks if it is too large for a single rpc.
+        """
+        return await self.call_with_value(node_to_ask, "store", key, value)
+
+    async def call_deliver(self, node_to_ask, key, value):
+        """
+        Deliver a value to a node, in chunks if it is too large for a single rpc.
+        """
+        return await self.call_with_value(node_to_ask, "deliver", key, value)
+
+    async def call_with_value(self, node_to_ask, name, key, value):
+        """
+        Call the store or deliver rpc on a node, switching to a manifest and chunks for values
+        too large for a single rpc, or sending a pointer for bulk values.
+        """
+        value = self.publish_bulk(value)
+        if not isinstance(value, bytes) or len(value) <= MAX_INLINE_SIZE:
+            return await self.call_timed(node_to_ask, name, key, value)
+
+        address = (node_to_ask.ip, node_to_ask.port)
+        transfer_id = os.urandom(8)
+        manifest, chunks = split_value(value, CHUNK_SIZE)
+        result = await getattr(self, f"{name}_manifest")(
+            address, self.source_node.id, transfer_id, key, *manifest[1:]
+        )
+        if result[0] and result[1]:
+            result = await self.send_chunks(address, transfer_id, chunks)
+        return self.handle_call_response(result, node_to_ask)
+
+    async def send_chunks(self, address, transfer_id, chunks):
+        """
+        Send the chunks of a value, a window at a time, retrying chunks that got no reply.
+
+        Returns:
+            tuple: whether the node replied and whether it accepted every chunk.
+        """
+        pending = list(range(len(chunks)))
+        for _ in range(CHUNK_ATTEMPTS):
+            unanswered = []
+            for start in range(0, len(pending), CHUNK_WINDOW):
+                window = pending[start : start + CHUNK_WINDOW]
+                results = await asyncio.gather(
+                    *(
+                        self.store_chunk(
+                            address,
+                            self.source_node.id,
+                            transfer_id,
+                            index,
+                            chunks[index],
+                        )
+                        for index in window
+                    )
+                )
+                if any(replied and not accepted for replied, accepted in results):
+                    return True, False
+                unanswered.extend(
+                    index for index, (replied, _) in zip(window, results) if not replied
+                )
+            if not unanswered:
+                return True, True
+            pending = unanswered
+        return False, None
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Module to limit the rate at which each node may store values on this one.
+
+Each sender gets a token bucket per kind of value, which refills at the rate of its RateLimit up
+to its burst. A store takes a token, and is rejected while the bucket is empty, so a node that
+floods this one is held to its share while the others are not slowed down.
+"""
+
+from collections import OrderedDict, namedtuple
+import time
+
+RATE_LIMITER_SIZE = 4096
+
+RateLimit = namedtuple("RateLimit", ["rate", "burst"])
+RateLimit.__annotations__ = {"rate": float, "burst": float}
+
+
+class RateLimiter:
+    """
+    Class to keep a token bucket per sender and kind of value, least recently used sender
+    first to be forgotten, and to count the values allowed and rejected of each kind.
+    """
+
+    def __init__(
+        self,
+        limits: dict = None,
+        default: RateLimit = None,
+        maxsize: int = RATE_LIMITER_SIZE,
+        clock=time.monotonic,
+    ) -> None:
+        """
+        Initialize a new instance of RateLimiter.
+
+        Args:
+            limits (dict): The RateLimit for each kind of value.
+            default (RateLimit): The RateLimit for values of other kinds, or None to allow
+                them at any rate.
+            maxsize (int): The number of senders to keep buckets for.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.limits = limits or {}
+        self.default = default
+        self.maxsize = maxsize
+        self.clock = clock
+        self.buckets = OrderedDict()
+        self.allowed = {}
+        self.rejected = {}
+
+    def allow(self, sender_id: bytes, kind=None) -> bool:
+        """
+        Take a token from a sender's bucket for a kind of value.
+
+        Returns:
+            bool: whether the sender may store the value.
+        """
+        limit = self.limits.get(kind, self.default)
+        if limit is None:
+            self.allowed[kind] = self.allowed.get(kind, 0) + 1
+            return True
+        now = self.clock()
+        tokens, updated = self.buckets.pop((sender_id, kind), (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        allowed = tokens >= 1
+        self.buckets[(sender_id, kind)] = (tokens - 1 if allowed else tokens, now)
+        if len(self.buckets) > self.maxsize:
+            self.buckets.popitem(last=False)
+        counters = self.allowed if allowed else self.rejected
+        counters[kind] = counters.get(kind, 0) + 1
+        return allowed
+
+    def get_stats(self) -> dict:
+        """Returns the number of senders tracked, and of values allowed and rejected by kind."""
+        return {
+            "senders": len({sender_id for sender_id, _ in self.buckets}),
+            "allowed": dict(self.allowed),
+            "rejected": dict(self.rejected),
+        }
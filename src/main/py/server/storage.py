@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Module for the storage backends of a node, which can delete values as well as store them.
+
+MemoryStorage keeps values in memory, as kademlia's ForgetfulStorage does. SqliteStorage keeps
+them in a sqlite database instead, where values survive a restart of the node, and only the
+keys being iterated over are held in memory, so a node can hold far more values than fit in RAM.
+"""
+
+import sqlite3
+import time
+from kademlia.storage import ForgetfulStorage, IStorage
+import umsgpack
+
+STORAGE_TTL = 604800
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS items"
+    " (key BLOB PRIMARY KEY, stored REAL NOT NULL, value BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS items_stored ON items (stored)",
+)
+
+
+class MemoryStorage(ForgetfulStorage):
+    """
+    Class to store values in memory, as kademlia does, with a way to delete them.
+    """
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+
+class SqliteStorage(IStorage):
+    """
+    Class to store values in a sqlite database, expiring them a ttl after they were last set.
+
+    Values are packed with umsgpack, so get returns the same type that was set. Times are wall
+    clock times, as they have to stay meaningful across restarts.
+    """
+
+    def __init__(
+        self, path: str = ":memory:", ttl: float = STORAGE_TTL, clock=time.time
+    ):
+        """
+        Initialize a new instance of SqliteStorage, creating the database if it does not exist.
+
+        Args:
+            path (str): The database file, or ":memory:" for a database that is not kept.
+            ttl (float): Seconds a value is kept for after it was last set, a week by default.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+        self.cull()
+
+    def __setitem__(self, key, value):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO items (key, stored, value) VALUES (?, ?, ?)",
+                (key, self.clock(), umsgpack.packb(value)),
+            )
+        self.cull()
+
+    def __delitem__(self, key):
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM items WHERE key = ?", (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def cull(self) -> None:
+        """Delete the values older than the ttl."""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM items WHERE stored <= ?", (self.clock() - self.ttl,)
+            )
+
+    def get(self, key, default=None):
+        row = self.connection.execute(
+            "SELECT value FROM items WHERE key = ? AND stored > ?",
+            (key, self.clock() - self.ttl),
+        ).fetchone()
+        return default if row is None else umsgpack.unpackb(row[0])
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __len__(self):
+        self.cull()
+        return self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def iter_older_than(self, seconds_old):
+        """
+        Iterate over the (key, value) tuples set more than seconds_old ago, oldest first.
+
+        Only the keys are read up front, through the index on the time values were set, so
+        values can be set again while iterating, as republishing does.
+        """
+        self.cull()
+        return self.iter_items(
+            "SELECT key FROM items WHERE stored <= ? ORDER BY stored",
+            (self.clock() - seconds_old,),
+        )
+
+    def __iter__(self):
+        self.cull()
+        return self.iter_items("SELECT key FROM items ORDER BY stored", ())
+
+    def iter_items(self, query: str, parameters: tuple):
+        """
+        Yield the key and value of each key a query selects, skipping keys deleted meanwhile.
+        """
+        keys = [row[0] for row in self.connection.execute(query, parameters)]
+        for key in keys:
+            value = self.get(key, self)
+            if value is not self:
+                yield key, value
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
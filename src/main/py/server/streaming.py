@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Module to move bulk values over asyncio streams, alongside the UDP rpcs.
+
+A node that sends a bulk value keeps it in a BulkStore for a while and sends a small pointer in
+its place: the value's sha1 digest, size and kind, and the address of the node's stream server.
+Nodes that receive the pointer pull the value over a stream, which TCP flow controls, and check it
+against the digest. Nodes asked to store it keep the value itself, and send pointers to their own
+copy from then on. So multi-megabyte values never take up the datagrams that lookups depend on.
+
+A request is the digest of the value. The reply is the size of the value, 0 if the node does not
+hold it, followed by the value.
+"""
+
+from collections import OrderedDict, namedtuple
+from hashlib import sha1
+import asyncio
+import logging
+import struct
+import time
+import umsgpack
+from server.chunking import MAX_INLINE_SIZE
+
+BULK_PREFIX = b"\xffBULK"
+BULK_THRESHOLD = MAX_INLINE_SIZE
+BULK_TTL = 3600
+MAX_BULK_STORE_SIZE = 256 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_TIMEOUT = 30
+SIZE = struct.Struct("!Q")
+
+BulkPointer = namedtuple("BulkPointer", ["digest", "size", "host", "port", "kind"])
+BulkPointer.__annotations__ = {
+    "digest": bytes,
+    "size": int,
+    "host": str,
+    "port": int,
+    "kind": object,
+}
+
+
+def encode_pointer(pointer: BulkPointer) -> bytes:
+    """Encode a pointer to a bulk value, to publish in its place."""
+    return BULK_PREFIX + umsgpack.packb(list(pointer))
+
+
+def read_pointer(value):
+    """
+    Read a pointer to a bulk value.
+
+    Returns:
+        BulkPointer: the pointer, or None if the value is not a valid pointer.
+    """
+    if not isinstance(value, bytes) or not value.startswith(BULK_PREFIX):
+        return None
+    try:
+        pointer = BulkPointer(*umsgpack.unpackb(value[len(BULK_PREFIX) :]))
+    except (umsgpack.UnpackException, TypeError):
+        return None
+    if (
+        not isinstance(pointer.digest, bytes)
+        or not isinstance(pointer.size, int)
+        or not isinstance(pointer.host, str)
+        or not isinstance(pointer.port, int)
+        or not isinstance(pointer.kind, (int, str, type(None)))
+    ):
+        return None
+    return pointer
+
+
+class BulkStore:
+    """
+    Class to hold the bulk values a node sent pointers to, for ttl seconds and up to max_size bytes,
+    dropping the oldest first.
+    """
+
+    def __init__(
+        self,
+        ttl: float = BULK_TTL,
+        max_size: int = MAX_BULK_STORE_SIZE,
+        clock=time.monotonic,
+    ) -> None:
+        """
+        Initialize a new instance of BulkStore.
+
+        Args:
+            ttl (float): Seconds a value is served for after it was published.
+            max_size (int): The largest total size of the values held.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.values = OrderedDict()
+        self.size = 0
+
+    def add(self, value: bytes) -> bytes:
+        """
+        Hold a value to serve.
+
+        Returns:
+            bytes: the sha1 digest the value is requested by.
+        """
+        digest = sha1(value).digest()
+        self.remove(digest)
+        self.values[digest] = (self.clock(), value)
+        self.size += len(value)
+        self.expire()
+        return digest
+
+    def get(self, digest: bytes):
+        """Returns the value with a digest, or None if it is not held."""
+        self.expire()
+        entry = self.values.get(digest)
+        return None if entry is None else entry[1]
+
+    def remove(self, digest: bytes) -> None:
+        """Stop holding a value."""
+        entry = self.values.pop(digest, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def expire(self) -> None:
+        """Drop the values past their ttl, and the oldest ones beyond max_size."""
+        deadline = self.clock() - self.ttl
+        while self.values:
+            digest, (published, _) = next(iter(self.values.items()))
+            if published > deadline and self.size <= self.max_size:
+                break
+            self.remove(digest)
+
+
+async def serve_bulk(store: BulkStore, reader, writer) -> None:
+    """
+    Serve the values requested on a stream, until the other end closes it.
+    """
+    try:
+        while True:
+            digest = await reader.readexactly(20)
+            value = store.get(digest) or b""
+            writer.write(SIZE.pack(len(value)))
+            for start in range(0, len(value), STREAM_CHUNK_SIZE):
+                writer.write(value[start : start + STREAM_CHUNK_SIZE])
+                await writer.drain()
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def fetch_bulk(pointer: BulkPointer, timeout: float = STREAM_TIMEOUT):
+    """
+    Pull the value a pointer points to over a stream.
+
+    Returns:
+        bytes: the value, or None if it could not be fetched or does not match the pointer.
+    """
+    logger = logging.getLogger("Streaming")
+    try:
+        return await asyncio.wait_for(fetch_value(pointer), timeout)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+        logger.warning("Could not fetch bulk value from %s: %s", pointer.host, exc)
+        return None
+
+
+async def fetch_value(pointer: BulkPointer):
+    """
+    Request a value over a new stream, reading it a chunk at a time.
+
+    Returns:
+        bytes: the value, or None if the node does not hold it or it does not match the pointer.
+    """
+    reader, writer = await asyncio.open_connection(pointer.host, pointer.port)
+    try:
+        writer.write(pointer.digest)
+        await writer.drain()
+        (size,) = SIZE.unpack(await reader.readexactly(SIZE.size))
+        if size != pointer.size:
+            return None
+        chunks = []
+        while size > 0:
+            chunk = await reader.readexactly(min(size, STREAM_CHUNK_SIZE))
+            chunks.append(chunk)
+            size -= len(chunk)
+        value = b"".join(chunks)
+        return value if sha1(value).digest() == pointer.digest else None
+    finally:
+        writer.close()
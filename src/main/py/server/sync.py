@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Module to summarise the values a node holds per group as Merkle trees, to reconcile with others.
+
+Each value is keyed by its sha1 digest, and the keys of a group form a trie over their hex
+digits. The hash of a subtree is the sha1 digest of the sorted keys under its prefix, so two
+nodes holding the same keys under a prefix agree on its hash. Reconciling descends only into
+the subtrees whose hashes differ, so the summaries exchanged grow with the number of missing
+values rather than with the number of values held.
+"""
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from hashlib import sha1
+
+HEX_DIGITS = "0123456789abcdef"
+KEY_DIGITS = 40
+MAX_LEAF_KEYS = 16
+MAX_SYNC_GROUPS = 64
+MAX_SYNC_PREFIXES = 256
+
+
+def is_valid_prefix(prefix) -> bool:
+    """Returns whether a prefix received from another node is hex digits of a key."""
+    return (
+        isinstance(prefix, str)
+        and len(prefix) <= KEY_DIGITS
+        and all(digit in HEX_DIGITS for digit in prefix)
+    )
+
+
+def is_valid_summary(summary) -> bool:
+    """Returns whether a summary received from another node has the shape summarize gives."""
+    if not isinstance(summary, dict) or len(summary) != 1:
+        return False
+    if isinstance(summary.get("keys"), list):
+        return all(
+            isinstance(key, bytes) and len(key) == KEY_DIGITS // 2
+            for key in summary["keys"]
+        )
+    if isinstance(summary.get("hashes"), list):
+        return len(summary["hashes"]) == len(HEX_DIGITS) and all(
+            isinstance(remote_hash, bytes) for remote_hash in summary["hashes"]
+        )
+    return False
+
+
+class MerkleIndex:
+    """
+    Class to hold values per group, least recently added to group first to be dropped, and to
+    summarise each subtree of a group's keys.
+    """
+
+    def __init__(self, max_groups: int = MAX_SYNC_GROUPS) -> None:
+        """
+        Initialize a new instance of MerkleIndex.
+
+        Args:
+            max_groups (int): The number of groups to hold values for.
+        """
+        self.max_groups = max_groups
+        self.groups = OrderedDict()
+
+    def add(self, group, value: bytes) -> bytes:
+        """
+        Add a value to a group.
+
+        Returns:
+            bytes: the key of the value, its sha1 digest.
+        """
+        key = sha1(value).digest()
+        keys, values = self.groups.pop(group, ([], {}))
+        self.groups[group] = (keys, values)
+        if len(self.groups) > self.max_groups:
+            self.groups.popitem(last=False)
+        if key not in values:
+            insort(keys, key.hex())
+            values[key] = value
+        return key
+
+    def discard(self, group) -> None:
+        """Drop every value of a group."""
+        self.groups.pop(group, None)
+
+    def get(self, group, key: bytes):
+        """Returns the value of a key in a group, or None if the group does not hold it."""
+        return self.groups.get(group, ([], {}))[1].get(key)
+
+    def get_keys(self, group, prefix: str = "") -> list:
+        """Returns the sorted hex keys of a group that start with a prefix."""
+        keys = self.groups.get(group, ([], {}))[0]
+        return keys[bisect_left(keys, prefix) : bisect_left(keys, prefix + "g")]
+
+    def get_hash(self, group, prefix: str = "") -> bytes:
+        """Returns the hash of the subtree of a group under a prefix, empty if it is empty."""
+        keys = self.get_keys(group, prefix)
+        return sha1("".join(keys).encode()).digest() if keys else b""
+
+    def summarize(self, group, prefix: str = "") -> dict:
+        """
+        Summarise the subtree of a group under a prefix.
+
+        Returns:
+            dict: the keys under the prefix as "keys" if there are at most MAX_LEAF_KEYS, else
+                the hash of the subtree under each next hex digit as "hashes".
+        """
+        keys = self.get_keys(group, prefix)
+        if len(keys) <= MAX_LEAF_KEYS:
+            return {"keys": [bytes.fromhex(key) for key in keys]}
+        return {
+            "hashes": [self.get_hash(group, prefix + digit) for digit in HEX_DIGITS]
+        }
+
+    def find_missing(self, group, prefix: str, summary: dict) -> tuple:
+        """
+        Compare another node's summary of a subtree with this one.
+
+        Returns:
+            tuple: the keys in the summary this group lacks, and the prefixes of the subtrees
+                whose hashes differ, to compare next, none beyond the length of a key.
+
+        Raises:
+            ValueError: if the summary does not have the shape summarize gives.
+        """
+        if not is_valid_summary(summary):
+            raise ValueError("Malformed summary")
+        if "keys" in summary:
+            return [key for key in summary["keys"] if self.get(group, key) is None], []
+        if len(prefix) >= KEY_DIGITS:
+            return [], []
+        prefixes = [
+            prefix + digit
+            for digit, remote_hash in zip(HEX_DIGITS, summary["hashes"])
+            if remote_hash and remote_hash != self.get_hash(group, prefix + digit)
+        ]
+        return [], prefixes
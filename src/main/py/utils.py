@@ -3,9 +3,11 @@
 Module to manage some utils used accross the project
 """
 
+from collections import OrderedDict
 import hashlib
 import random
 import string
+import time
 import asyncio
 
 
@@ -20,6 +22,76 @@ def generate_random_sha1_hash():
     return sha1_hash
 
 
+def generate_content_key(payload: bytes) -> bytes:
+    """
+    Generates the SHA-1 hash of a payload, so identical payloads are stored under the same key.
+    """
+    return hashlib.sha1(payload).digest()
+
+
+class SeenCache:
+    """
+    Remembers the most recently seen keys, forgetting the least recently seen ones beyond maxsize,
+    and, if there is a ttl, the ones not seen for ttl seconds.
+
+    Each key takes up around 200 bytes, so maxsize bounds the memory the cache uses.
+    """
+
+    def __init__(
+        self, maxsize: int = 4096, ttl: float = None, clock=time.monotonic
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, key) -> bool:
+        """
+        Mark a key as seen.
+
+        Returns:
+            bool: True if the key was not seen before, False if it was.
+        """
+        self.expire()
+        seen = key in self.keys
+        if seen:
+            self.keys.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.keys[key] = self.clock()
+        if len(self.keys) > self.maxsize:
+            self.keys.popitem(last=False)
+        return not seen
+
+    def discard(self, key) -> None:
+        """Forget a key, if it was seen."""
+        self.keys.pop(key, None)
+
+    def expire(self) -> None:
+        """Forget the keys not seen for ttl seconds."""
+        if self.ttl is None:
+            return
+        deadline = self.clock() - self.ttl
+        while self.keys and next(iter(self.keys.values())) <= deadline:
+            self.keys.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        """Returns the number of keys remembered, and of repeated and new keys seen."""
+        self.expire()
+        return {"size": len(self.keys), "hits": self.hits, "misses": self.misses}
+
+    def __contains__(self, key) -> bool:
+        self.expire()
+        return key in self.keys
+
+    def __len__(self) -> int:
+        self.expire()
+        return len(self.keys)
+
+
 def call_soon():
     """Returns the call_soon function from the asyncio event loop."""
     return asyncio.get_event_loop().call_soon
@@ -4,10 +4,17 @@
 Simple Test Module for the ArtFragment class
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import random
 import unittest
 from unittest.mock import Mock
 from datetime import timedelta
-from commission.artfragmentgenerator import generate_fragment
+from commission.artfragment import CompactArtFragment, PrimitiveArtFragment
+from commission.artfragmentgenerator import (
+    generate_fragment,
+    generate_primitive_fragment,
+)
 from commission.artwork import Artwork
 from drawing.drawing import Constraint, Pixel
 
@@ -30,6 +37,56 @@ class TestArtFragment(unittest.TestCase):
         for pixel in self.artfragment.pixels:
             self.assertIsInstance(pixel, Pixel)
 
+    def test_batched_initialization(self):
+        """Check that a batched fragment is compact and holds unique pixel coordinates"""
+        artfragment = generate_fragment(self.artwork, 2, "1", 1, batched=True)
+        self.assertIsInstance(artfragment, CompactArtFragment)
+        self.assertEqual(artfragment.contributor_id, "1")
+        self.assertEqual(len(artfragment.palette), 5)
+        pixels = list(artfragment.pixels)
+        self.assertEqual(len(pixels), len(artfragment))
+        for pixel in pixels:
+            self.assertIsInstance(pixel, Pixel)
+            self.assertIn(pixel.color, artfragment.palette)
+        coordinates = {pixel.coordinates for pixel in pixels}
+        self.assertEqual(len(coordinates), len(artfragment))
+
+    def test_compact_colors(self):
+        """Check that colors() matches the colors yielded by the pixel adapter"""
+        artfragment = generate_fragment(self.artwork, 2, "1", 1, batched=True)
+        colors = [tuple(color) for color in artfragment.colors().tolist()]
+        self.assertEqual(colors, [pixel.color for pixel in artfragment.pixels])
+
+    def test_compact_read_only(self):
+        """Check that the arrays backing a compact fragment cannot be modified"""
+        artfragment = generate_fragment(self.artwork, 2, "1", 1, batched=True)
+        with self.assertRaises(ValueError):
+            artfragment.xs[...] = 0
+
+    def test_concurrent_generation(self):
+        """Check that fragments generated in threads match those generated in sequence"""
+
+        def generate(seed):
+            fragment = generate_fragment(
+                self.artwork, 2, "1", 1, rng=random.Random(seed)
+            )
+            return fragment.pixels
+
+        expected = [generate(seed) for seed in range(8)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(generate, range(8))), expected)
+
+    def test_primitive_initialization(self):
+        """Check that a primitive fragment is small no matter how much it covers"""
+        artwork = Artwork(
+            1000, 1000, timedelta(seconds=0.5), Mock(), constraint=Constraint(5, "any")
+        )
+        artfragment = generate_primitive_fragment(artwork, 2, "1", 1)
+        self.assertIsInstance(artfragment, PrimitiveArtFragment)
+        self.assertEqual(artfragment.artwork_id, artwork.get_key())
+        self.assertGreater(len(artfragment.primitives), 0)
+        self.assertLess(len(pickle.dumps(artfragment)), 4096)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,16 +4,25 @@
 Simple Test Module for the ArtFragmentGenerator class
 """
 
+import random
 import unittest
 from unittest.mock import Mock
 from datetime import timedelta
 from commission.artfragmentgenerator import (
+    Subcanvas,
+    generate_fragment_tiles,
+    plan_fragment_tiles,
+    split_subcanvas,
     generate_subcanvas,
     generate_pixels,
+    generate_pixel_arrays,
+    generate_primitives,
     get_bounds,
+    get_distance_palette,
+    get_palette,
 )
 from commission.artwork import Artwork
-from drawing.drawing import Color, Constraint, Coordinates
+from drawing.drawing import Color, Constraint, Coordinates, Ellipse, Line, Polyline
 
 
 class TestArtFragmentGenerator(unittest.TestCase):
@@ -44,6 +53,18 @@ class TestArtFragmentGenerator(unittest.TestCase):
         self.assertLessEqual(subcanvas_width, width_bound)
         self.assertLessEqual(subcanvas_height, height_bound)
 
+    def test_generate_subcanvas_max_area(self):
+        """Test that generate_subcanvas scales subcanvases down to the maximum area"""
+        rng = random.Random(1)
+        for _ in range(100):
+            subcanvas = generate_subcanvas(1000, 1000, rng, max_area=500)
+            width, height = subcanvas.dimensions
+            self.assertLessEqual(width * height, 500)
+            self.assertGreaterEqual(width, 1)
+            self.assertGreaterEqual(height, 1)
+            self.assertLessEqual(subcanvas.coordinates.x + width, 1000)
+            self.assertLessEqual(subcanvas.coordinates.y + height, 1000)
+
     def test_get_bounds(self):
         """Test get_bounds method for bound adherence"""
         width = 1000
@@ -92,6 +113,161 @@ class TestArtFragmentGenerator(unittest.TestCase):
             self.assertLess(coordinates.x, artwork.width)
             self.assertLess(coordinates.y, artwork.height)
 
+    def test_generate_pixel_arrays(self):
+        """
+        Test the generate_pixel_arrays method for bound adherence and unique coordinates
+        """
+        artwork = self.artwork
+        subcanvas = generate_subcanvas(artwork.width, artwork.height)
+        constraint = Constraint(5, "any")
+
+        pixel_arrays = generate_pixel_arrays(1, 2, subcanvas, constraint)
+
+        x_coordinate, y_coordinate = subcanvas.coordinates
+        width, height = subcanvas.dimensions
+        self.assertEqual(len(pixel_arrays.palette), 5)
+        self.assertEqual(len(pixel_arrays.xs), len(pixel_arrays.ys))
+        self.assertEqual(len(pixel_arrays.xs), len(pixel_arrays.palette_indices))
+        self.assertLess(len(pixel_arrays.xs), width * height)
+        for x, y, index in zip(*pixel_arrays[:3]):
+            self.assertTrue(x_coordinate <= x < x_coordinate + width)
+            self.assertTrue(y_coordinate <= y < y_coordinate + height)
+            self.assertLess(index, len(pixel_arrays.palette))
+
+        coordinates = set(zip(pixel_arrays.xs.tolist(), pixel_arrays.ys.tolist()))
+        self.assertEqual(len(coordinates), len(pixel_arrays.xs))
+
+    def test_generate_subcanvas_seeded(self):
+        """
+        Test that generate_subcanvas only draws from the random number generator it is given
+        """
+        first = generate_subcanvas(1000, 1000, random.Random(7))
+        second = generate_subcanvas(1000, 1000, random.Random(7))
+        self.assertEqual(first, second)
+
+    def test_get_palette_isolated(self):
+        """
+        Test that get_palette does not reseed the global random number generator
+        """
+        random.seed(11)
+        expected = random.random()
+
+        random.seed(11)
+        get_distance_palette.cache_clear()
+        get_palette(1, 2, 5)
+        self.assertEqual(random.random(), expected)
+
+    def test_get_palette_cached(self):
+        """
+        Test that palettes are memoized per distance and palette limit
+        """
+        get_distance_palette.cache_clear()
+        palette = get_palette(1, 2, 5)
+        palette.clear()
+
+        self.assertEqual(get_palette(3, 0, 5.0), get_palette(1, 2, 5))
+        self.assertEqual(len(get_palette(1, 2, 5)), 5)
+        cache_info = get_distance_palette.cache_info()  # pylint: disable=no-value-for-parameter
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 3)
+
+    def test_generate_primitives_within_subcanvas(self):
+        """
+        Test that generate_primitives only places primitives within the subcanvas
+        """
+        subcanvas = generate_subcanvas(1000, 1000, random.Random(3))
+        x_coordinate, y_coordinate = subcanvas.coordinates
+        width, height = subcanvas.dimensions
+        palette = get_palette(1, 2, 5)
+
+        primitives = generate_primitives(
+            1, 2, subcanvas, Constraint(5, "any"), random.Random(5)
+        )
+
+        self.assertGreater(len(primitives), 0)
+        for primitive in primitives:
+            self.assertIn(primitive.color, palette)
+            if isinstance(primitive, Polyline):
+                points = primitive.points
+            elif isinstance(primitive, Line):
+                points = (primitive.start, primitive.end)
+            else:
+                points = (primitive.top_left, primitive.bottom_right)
+                self.assertLessEqual(points[0].x, points[1].x)
+                self.assertLessEqual(points[0].y, points[1].y)
+            for point in points:
+                self.assertTrue(x_coordinate <= point.x < x_coordinate + width)
+                self.assertTrue(y_coordinate <= point.y < y_coordinate + height)
+
+    def test_generate_primitives_line_type(self):
+        """
+        Test that generate_primitives honors the line type of the constraint
+        """
+        subcanvas = generate_subcanvas(100, 100, random.Random(3))
+        rng = random.Random(5)
+        for _ in range(20):
+            straight = generate_primitives(
+                1, 2, subcanvas, Constraint(5, "straight"), rng
+            )
+            curved = generate_primitives(1, 2, subcanvas, Constraint(5, "curved"), rng)
+            self.assertFalse(any(isinstance(p, Ellipse) for p in straight))
+            self.assertTrue(all(isinstance(p, Ellipse) for p in curved))
+
+    def test_split_subcanvas(self):
+        """
+        Test that split_subcanvas covers every coordinate of the subcanvas exactly once
+        """
+        subcanvas = Subcanvas(Coordinates(3, 5), (10, 7))
+
+        tiles = split_subcanvas(subcanvas, 4)
+
+        self.assertEqual(len(tiles), 6)
+        covered = [
+            (x, y)
+            for (tile_x, tile_y), (width, height) in tiles
+            for x in range(tile_x, tile_x + width)
+            for y in range(tile_y, tile_y + height)
+        ]
+        expected = {(x, y) for x in range(3, 13) for y in range(5, 12)}
+        self.assertEqual(len(covered), len(expected))
+        self.assertEqual(set(covered), expected)
+
+    def test_plan_fragment_tiles(self):
+        """
+        Test that plan_fragment_tiles never puts more pixels in a tile than it holds
+        """
+        artwork = Artwork(
+            300, 200, timedelta(seconds=0.5), Mock(), Constraint(5, "any")
+        )
+
+        palette, tiles = plan_fragment_tiles(artwork, 1, 2, 16, random.Random(1))
+
+        self.assertEqual(palette, get_palette(1, 2, 5))
+        for tile in tiles:
+            width, height = tile.subcanvas.dimensions
+            self.assertLessEqual(width, 16)
+            self.assertLessEqual(height, 16)
+            self.assertTrue(0 < tile.num_pixels <= width * height)
+
+    def test_generate_fragment_tiles(self):
+        """
+        Test that streamed tiles stay within their tile and never overlap each other
+        """
+        artwork = Artwork(
+            300, 200, timedelta(seconds=0.5), Mock(), Constraint(5, "any")
+        )
+
+        coordinates = set()
+        num_pixels = 0
+        for fragment in generate_fragment_tiles(artwork, 1, "1", 2, tile_size=16):
+            self.assertEqual(fragment.artwork_id, artwork.get_key())
+            self.assertLessEqual(int(fragment.xs.max() - fragment.xs.min()), 15)
+            self.assertLessEqual(int(fragment.ys.max() - fragment.ys.min()), 15)
+            coordinates.update(zip(fragment.xs.tolist(), fragment.ys.tolist()))
+            num_pixels += len(fragment)
+
+        self.assertEqual(len(coordinates), num_pixels)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the batching module
+"""
+
+import asyncio
+import hashlib
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from server.batching import BatchingTransport, pack_batch, unpack_batch
+from server.network import NotifyingServer
+
+
+class TestBatching(unittest.IsolatedAsyncioTestCase):
+    """Test class for batching module"""
+
+    def setUp(self):
+        """Wrap a mock transport"""
+        self.transport = MagicMock()
+        self.batching = BatchingTransport(self.transport, window=0.01, max_size=64)
+        self.address = ("127.0.0.1", 5000)
+
+    def sent(self):
+        """Get the datagrams the wrapped transport sent"""
+        return [call.args for call in self.transport.sendto.call_args_list]
+
+    def test_pack_batch(self):
+        """Test that batches unpack to the datagrams they were packed from"""
+        datagrams = [b"\x00request", b"", b"\x01response" * 100]
+        self.assertEqual(unpack_batch(pack_batch(datagrams)), datagrams)
+        for invalid in (b"\x00request", pack_batch(datagrams)[:-1], b"\x02\x00"):
+            with self.assertRaises(ValueError):
+                unpack_batch(invalid)
+
+    async def test_coalesce_within_window(self):
+        """Test that datagrams to one destination within the window go out as one batch"""
+        other_address = ("127.0.0.1", 5001)
+        self.batching.sendto(b"one", self.address)
+        self.batching.sendto(b"two", self.address)
+        self.batching.sendto(b"three", other_address)
+        self.transport.sendto.assert_not_called()
+
+        await asyncio.sleep(0.05)
+        self.assertCountEqual(
+            self.sent(),
+            [(pack_batch([b"one", b"two"]), self.address), (b"three", other_address)],
+        )
+        self.assertEqual(self.batching.datagrams_sent, 3)
+        self.assertEqual(self.batching.packets_sent, 2)
+
+    async def test_size_cap(self):
+        """Test that a full batch is sent at once and large datagrams keep their order"""
+        for _ in range(3):
+            self.batching.sendto(b"x" * 20, self.address)
+        self.assertEqual(self.sent(), [(pack_batch([b"x" * 20] * 2), self.address)])
+
+        self.batching.sendto(b"y" * 100, self.address)
+        self.assertEqual(
+            self.sent()[1:], [(b"x" * 20, self.address), (b"y" * 100, self.address)]
+        )
+        self.assertEqual(self.batching.pending, {})
+
+    async def test_close(self):
+        """Test that closing sends what is held back before closing the transport"""
+        self.batching.sendto(b"one", self.address)
+        self.batching.close()
+        self.assertEqual(self.sent(), [(b"one", self.address)])
+        self.transport.close.assert_called_once()
+        self.assertEqual(self.batching.get_extra_info, self.transport.get_extra_info)
+
+
+class TestBatchingServers(unittest.IsolatedAsyncioTestCase):
+    """Test class for servers that batch their datagrams"""
+
+    async def test_store(self):
+        """Test that batching servers still bootstrap and store, in fewer packets"""
+        stored = asyncio.Event()
+        callback = AsyncMock(side_effect=lambda *args: stored.set())
+        nodes = [
+            NotifyingServer(AsyncMock(), batch_window=0.005),
+            NotifyingServer(callback, batch_window=0.005),
+        ]
+        for node in nodes:
+            await node.listen(0, interface="127.0.0.1")
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        await nodes[1].bootstrap([("127.0.0.1", port)])
+
+        self.assertTrue(
+            all(
+                await asyncio.gather(*(nodes[0].set(f"key{i}", b"v") for i in range(5)))
+            )
+        )
+        await asyncio.wait_for(stored.wait(), 5)
+        callback.assert_any_call(hashlib.sha1(b"key0").digest(), b"v")
+
+        transport = nodes[0].protocol.transport
+        self.assertLess(transport.packets_sent, transport.datagrams_sent)
+        for node in nodes:
+            node.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the chunking module
+"""
+
+import asyncio
+import hashlib
+import os
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from server.chunking import MAX_INLINE_SIZE, MAX_VALUE_SIZE, Reassembler, split_value
+from server.network import NotifyingServer
+
+
+class TestChunking(unittest.TestCase):
+    """Test class for chunking module"""
+
+    def setUp(self):
+        """Create a value, its chunks and a reassembler"""
+        self.clock = MagicMock(return_value=0.0)
+        self.reassembler = Reassembler(
+            timeout=10, max_value_size=1000, max_buffered_size=1500, clock=self.clock
+        )
+        self.value = os.urandom(950)
+        manifest, self.chunks = split_value(self.value, 100)
+        self.manifest = manifest._replace(key=b"key")
+
+    def test_split_value(self):
+        """Test that a value is split into chunks described by its manifest"""
+        self.assertEqual(self.manifest.count, 10)
+        self.assertEqual(self.manifest.size, 950)
+        self.assertEqual(self.manifest.digest, hashlib.sha1(self.value).digest())
+        self.assertEqual(b"".join(self.chunks), self.value)
+        self.assertEqual(len(self.chunks[-1]), 50)
+
+    def test_reassemble_out_of_order(self):
+        """Test that chunks arriving in any order, some twice, reassemble the value"""
+        self.assertTrue(self.reassembler.start("transfer", self.manifest))
+        indices = [9, 3, 3, 0, 5, 1, 2, 8, 7, 6]
+        for index in indices:
+            self.assertEqual(
+                self.reassembler.add("transfer", index, self.chunks[index]),
+                (True, None),
+            )
+        self.assertEqual(
+            self.reassembler.add("transfer", 4, self.chunks[4]),
+            (True, (b"key", self.value, None)),
+        )
+        self.assertEqual(self.reassembler.buffered_size, 0)
+        self.assertEqual(
+            self.reassembler.add("transfer", 4, self.chunks[4]), (False, None)
+        )
+
+    def test_reject_corrupt(self):
+        """Test that chunks not matching the manifest are rejected"""
+        self.reassembler.start("transfer", self.manifest)
+        self.assertEqual(self.reassembler.add("transfer", 10, b"x"), (False, None))
+        for index, chunk in enumerate(self.chunks[:-1]):
+            self.reassembler.add("transfer", index, chunk)
+        self.assertEqual(self.reassembler.add("transfer", 9, b"y" * 50), (False, None))
+        self.assertEqual(self.reassembler.transfers, {})
+
+        self.assertFalse(
+            self.reassembler.start("large", self.manifest._replace(size=1001))
+        )
+        self.assertFalse(
+            self.reassembler.start("empty", self.manifest._replace(count=0))
+        )
+
+    def test_timeout(self):
+        """Test that incomplete transfers are dropped once they time out"""
+        self.reassembler.start("transfer", self.manifest)
+        self.reassembler.add("transfer", 0, self.chunks[0])
+        self.clock.return_value = 11
+        self.assertEqual(
+            self.reassembler.add("transfer", 1, self.chunks[1]), (False, None)
+        )
+        self.assertEqual(self.reassembler.buffered_size, 0)
+
+    def test_memory_bound(self):
+        """Test that the oldest incomplete transfer is dropped to make room"""
+        self.reassembler.start("first", self.manifest)
+        self.clock.return_value = 1
+        self.reassembler.start("second", self.manifest)
+        self.assertEqual(list(self.reassembler.transfers), ["second"])
+        self.assertEqual(self.reassembler.buffered_size, 950)
+
+
+class TestChunkedStore(unittest.IsolatedAsyncioTestCase):
+    """Test class for storing values too large for a single rpc"""
+
+    async def asyncSetUp(self):
+        """Start two connected servers"""
+        self.stored = asyncio.Event()
+        self.callback = AsyncMock(side_effect=lambda *args: self.stored.set())
+        self.node1 = NotifyingServer(AsyncMock(), bulk_threshold=MAX_VALUE_SIZE)
+        self.node2 = NotifyingServer(self.callback)
+        await self.node1.listen(0, interface="127.0.0.1")
+        await self.node2.listen(0, interface="127.0.0.1")
+        port = self.node1.transport.get_extra_info("sockname")[1]
+        await self.node2.bootstrap([("127.0.0.1", port)])
+
+    async def asyncTearDown(self):
+        """Stop the servers"""
+        self.node1.stop()
+        self.node2.stop()
+
+    async def test_store_large_value(self):
+        """Test that a value far larger than an rpc reaches the other node whole"""
+        value = os.urandom(20 * MAX_INLINE_SIZE + 123)
+        self.assertTrue(await self.node1.set("key", value))
+        await asyncio.wait_for(self.stored.wait(), 5)
+
+        key = hashlib.sha1(b"key").digest()
+        self.callback.assert_called_once_with(key, value)
+        self.assertEqual(self.node2.storage.get(key), value)
+        self.assertEqual(self.node2.protocol.reassembler.transfers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
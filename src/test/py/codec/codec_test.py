@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the codec module
+"""
+
+from datetime import datetime, timedelta
+import pickle
+import random
+import unittest
+import umsgpack
+from commission.artfragment import ArtFragment
+from commission.artfragmentgenerator import (
+    generate_fragment,
+    generate_primitive_fragment,
+)
+from commission.artwork import Artwork
+from codec import codec
+from drawing.drawing import Constraint
+from exchange.offer_announcement import OfferAnnouncement
+from exchange.offer_response import OfferResponse
+from peer.ledger import Ledger
+
+
+# pylint: disable=too-many-public-methods
+class TestCodec(unittest.TestCase):
+    """Test class for codec module"""
+
+    def setUp(self):
+        """Create one message of every type"""
+        ledger = Ledger()
+        ledger.add_owner("originator_public_key")
+        ledger.add_owner("owner_public_key")
+        self.artwork = Artwork(
+            300,
+            200,
+            timedelta(minutes=10),
+            ledger,
+            constraint=Constraint(5, "any"),
+            originator_public_key="originator_public_key",
+            originator_long_id=2**159 + 12345,
+        )
+        rng = random.Random(4)
+        self.art_fragment = generate_fragment(
+            self.artwork, 1, "contributor", 2, rng=rng
+        )
+        self.compact_art_fragment = generate_fragment(
+            self.artwork, 1, "contributor", 2, batched=True, rng=rng
+        )
+        self.primitive_art_fragment = generate_primitive_fragment(
+            self.artwork, 1, "contributor", 2, rng=rng
+        )
+        self.offer_announcement = OfferAnnouncement(
+            self.artwork, 10, "sale", "public_key"
+        )
+        self.offer_response = OfferResponse(
+            b"exchange_id", self.artwork, 10, "trade", "public_key"
+        )
+
+    def assert_artwork_equal(self, decoded: Artwork, artwork: Artwork):
+        """Assert that a decoded artwork has the attributes of the original"""
+        self.assertIsInstance(decoded, Artwork)
+        for attribute in vars(artwork):
+            if attribute == "ledger":
+                self.assertEqual(decoded.ledger.queue, artwork.ledger.queue)
+                self.assertEqual(decoded.ledger.top, artwork.ledger.top)
+                self.assertTrue(decoded.ledger.verify_integrity())
+            else:
+                self.assertEqual(
+                    getattr(decoded, attribute), getattr(artwork, attribute)
+                )
+
+    def test_artwork_round_trip(self):
+        """Test that an artwork survives encoding and decoding"""
+        decoded = codec.decode(codec.encode(self.artwork))
+        self.assert_artwork_equal(decoded, self.artwork)
+        self.assertGreater(decoded.get_remaining_time(), 0)
+
+        self.artwork.set_complete()
+        self.artwork.constraint = None
+        self.assert_artwork_equal(
+            codec.decode(codec.encode(self.artwork)), self.artwork
+        )
+
+    def test_art_fragment_round_trip(self):
+        """Test that an art fragment survives encoding and decoding"""
+        decoded = codec.decode(codec.encode(self.art_fragment))
+        self.assertIsInstance(decoded, ArtFragment)
+        self.assertEqual(decoded.artwork_id, self.art_fragment.artwork_id)
+        self.assertEqual(decoded.contributor_id, self.art_fragment.contributor_id)
+        self.assertEqual(set(decoded.pixels), set(self.art_fragment.pixels))
+
+    def test_compact_art_fragment_round_trip(self):
+        """Test that a compact art fragment survives encoding and decoding"""
+        fragment = self.compact_art_fragment
+        decoded = codec.decode(codec.encode(fragment))
+        self.assertEqual(decoded.artwork_id, fragment.artwork_id)
+        self.assertEqual(decoded.contributor_id, fragment.contributor_id)
+        self.assertEqual(decoded.palette, fragment.palette)
+        self.assertEqual(set(decoded.pixels), set(fragment.pixels))
+        self.assertEqual(len(decoded), len(fragment))
+
+    def test_primitive_art_fragment_round_trip(self):
+        """Test that a primitive art fragment survives encoding and decoding"""
+        decoded = codec.decode(codec.encode(self.primitive_art_fragment))
+        self.assertEqual(decoded, self.primitive_art_fragment)
+
+    def test_offer_announcement_round_trip(self):
+        """Test that an offer announcement survives encoding and decoding"""
+        decoded = codec.decode(codec.encode(self.offer_announcement))
+        self.assertIsInstance(decoded, OfferAnnouncement)
+        self.assert_artwork_equal(decoded.get_artwork(), self.artwork)
+        self.assertEqual(decoded.get_price(), 10)
+        self.assertEqual(decoded.get_exchange_type(), "sale")
+        self.assertEqual(decoded.get_originator_public_key(), "public_key")
+        self.assertFalse(decoded.deadline_reached)
+
+    def test_offer_response_round_trip(self):
+        """Test that an offer response survives encoding and decoding"""
+        decoded = codec.decode(codec.encode(self.offer_response))
+        self.assertIsInstance(decoded, OfferResponse)
+        self.assertEqual(decoded.get_exchange_id(), b"exchange_id")
+        self.assert_artwork_equal(decoded.get_artwork(), self.artwork)
+        self.assertEqual(decoded.get_price(), 10)
+        self.assertEqual(decoded.get_exchange_type(), "trade")
+        self.assertEqual(decoded.get_exchanger_public_key(), "public_key")
+
+        response = OfferResponse(b"exchange_id", None, 10, "sale", "public_key")
+        self.assertIsNone(codec.decode(codec.encode(response)).get_artwork())
+
+    def test_smaller_than_pickle(self):
+        """Test that every message type encodes smaller than it pickles"""
+        for message in (
+            self.artwork,
+            self.art_fragment,
+            self.compact_art_fragment,
+            self.primitive_art_fragment,
+            self.offer_announcement,
+            self.offer_response,
+        ):
+            with self.subTest(message_type=type(message).__name__):
+                self.assertLess(len(codec.encode(message)), len(pickle.dumps(message)))
+
+    def test_encode_unknown_type(self):
+        """Test that encoding anything but a message raises a TypeError"""
+        with self.assertRaises(TypeError):
+            codec.encode({"not": "a message"})
+
+    def test_decode_invalid(self):
+        """Test that invalid payloads are rejected with a ValueError"""
+        encoded = codec.encode(self.compact_art_fragment)
+        for payload in (
+            "value",
+            b"\x01",
+            pickle.dumps(self.artwork),
+            bytes([codec.VERSION + 1]) + encoded[1:],
+            encoded[:1] + bytes([255]) + encoded[2:],
+            encoded[: len(encoded) // 2],
+            codec.encode(self.artwork)[:2] + codec.encode(self.art_fragment)[2:],
+        ):
+            with self.assertRaises(ValueError):
+                codec.decode(payload)
+
+    def test_read_header(self):
+        """Test that the header describes a message without decoding its body"""
+        deadline = datetime.now() + timedelta(minutes=1)
+        encoded = codec.encode(self.compact_art_fragment, deadline)
+        header = codec.read_header(encoded)
+        self.assertEqual(header.version, codec.VERSION)
+        self.assertEqual(header.message_type, codec.COMPACT_ART_FRAGMENT)
+        self.assertEqual(header.artwork_id, self.artwork.get_key())
+        self.assertEqual(header.deadline, deadline)
+        self.assertEqual(header.size, len(encoded) - codec.HEADER.size)
+
+        header = codec.read_header(codec.encode(self.artwork))
+        self.assertEqual(header.message_type, codec.ARTWORK)
+        self.assertEqual(header.deadline, self.artwork.end_time)
+
+        self.artwork.set_complete()
+        self.assertIsNone(codec.read_header(codec.encode(self.artwork)).deadline)
+
+        response = OfferResponse(b"exchange_id", None, 10, "sale", "public_key")
+        header = codec.read_header(codec.encode(response))
+        self.assertIsNone(header.artwork_id)
+        self.assertIsNone(header.deadline)
+
+        with self.assertRaises(ValueError):
+            codec.read_header(encoded + b"trailing")
+
+    def test_get_message_type(self):
+        """Test that the type tag is read from the header, and None without a valid one"""
+        self.assertEqual(
+            codec.get_message_type(codec.encode(self.artwork)), codec.ARTWORK
+        )
+        self.assertIsNone(codec.get_message_type(b"not a message"))
+        self.assertIsNone(codec.get_message_type(42))
+
+    def test_deadline_out_of_range(self):
+        """Test that headers with deadlines datetime cannot represent are rejected"""
+        for deadline in (1e300, 1e18, float("inf")):
+            payload = codec.HEADER.pack(
+                codec.VERSION, codec.ARTWORK, codec.NO_ARTWORK_ID, deadline, 0
+            )
+            with self.assertRaises(ValueError):
+                codec.read_header(payload)
+            self.assertIsNone(codec.get_message_type(payload))
+
+    def test_decode_end_time_out_of_range(self):
+        """Test that an artwork ending at a time datetime cannot represent is rejected"""
+        body = codec.encode_artwork(self.artwork)
+        body[6] = 1e18
+        body = umsgpack.packb(body)
+        payload = (
+            codec.HEADER.pack(
+                codec.VERSION,
+                codec.ARTWORK,
+                codec.NO_ARTWORK_ID,
+                codec.NO_DEADLINE,
+                len(body),
+            )
+            + body
+        )
+        with self.assertRaises(ValueError):
+            codec.decode(payload)
+
+    def pack_message(self, message_type, body) -> bytes:
+        """Pack a message body behind a header, as encode does"""
+        body = umsgpack.packb(body)
+        return (
+            codec.HEADER.pack(
+                codec.VERSION,
+                message_type,
+                codec.NO_ARTWORK_ID,
+                codec.NO_DEADLINE,
+                len(body),
+            )
+            + body
+        )
+
+    def test_decode_invalid_primitives(self):
+        """Test that primitives with fields of the wrong type or range are rejected"""
+        color = [1, 2, 3, 255]
+        for primitive in (
+            [0, ["a", 0], [5, 5], color],
+            [0, [0, 0], [5, 5], [1, 2, 3, 256]],
+            [0, [0, 0], [5, 5], ["red", 2, 3, 4]],
+            [1, [0, 0], [codec.MAX_COORDINATE + 1, 5], color],
+            [2, [0, 0], [5, 5], color, "wide"],
+            [2, [0, 0], [5, 5], color, codec.MAX_LINE_WIDTH + 1],
+            [3, [[0, 0], [1]], color, 1],
+            [3, [[0, 0], [None, 1]], color, 1],
+        ):
+            payload = self.pack_message(
+                codec.PRIMITIVE_ART_FRAGMENT, [bytes(20), "contributor", [primitive]]
+            )
+            with self.assertRaises(ValueError):
+                codec.decode(payload)
+
+    def test_decode_pixels_out_of_range(self):
+        """Test that pixel fragments reaching beyond the largest canvas are rejected"""
+        body = codec.encode_compact_art_fragment(self.compact_art_fragment)
+        body[4] = codec.MAX_COORDINATE
+        with self.assertRaises(ValueError):
+            codec.decode(self.pack_message(codec.COMPACT_ART_FRAGMENT, body))
+        body = codec.encode_compact_art_fragment(self.compact_art_fragment)
+        body[2] = [[1, 2, 3, 1000]] * len(body[2])
+        with self.assertRaises(ValueError):
+            codec.decode(self.pack_message(codec.COMPACT_ART_FRAGMENT, body))
+
+    def test_decode_invalid_dimensions_and_prices(self):
+        """Test that artworks and offers with malformed sizes or prices are rejected"""
+        for index, value in (
+            (0, -1),
+            (0, 0),
+            (1, "10"),
+            (1, codec.MAX_COORDINATE + 1),
+            (0, True),
+        ):
+            body = codec.encode_artwork(self.artwork)
+            body[index] = value
+            with self.assertRaises(ValueError):
+                codec.decode(self.pack_message(codec.ARTWORK, body))
+        for price in (-1, 1.5, "10", None):
+            body = codec.encode_offer_announcement(self.offer_announcement)
+            body[1] = price
+            with self.assertRaises(ValueError):
+                codec.decode(self.pack_message(codec.OFFER_ANNOUNCEMENT, body))
+            body = codec.encode_offer_response(self.offer_response)
+            body[2] = price
+            with self.assertRaises(ValueError):
+                codec.decode(self.pack_message(codec.OFFER_RESPONSE, body))
+
+    def test_check_canvas_bounds(self):
+        """Test that fragments with pixels off the canvas are found"""
+        pixels = self.art_fragment.pixels
+        for fragment, xs, ys in (
+            (
+                self.art_fragment,
+                [pixel.coordinates.x for pixel in pixels],
+                [pixel.coordinates.y for pixel in pixels],
+            ),
+            (
+                self.compact_art_fragment,
+                self.compact_art_fragment.xs,
+                self.compact_art_fragment.ys,
+            ),
+        ):
+            codec.check_canvas_bounds(fragment, max(xs) + 1, max(ys) + 1)
+            with self.assertRaises(ValueError):
+                codec.check_canvas_bounds(fragment, max(xs), max(ys) + 1)
+        codec.check_canvas_bounds(self.primitive_art_fragment, 1, 1)
+
+    def test_decode_palette_index_out_of_range(self):
+        """Test that a compact fragment indexing past its palette is rejected"""
+        self.assertGreater(len(self.compact_art_fragment), 0)
+        body = codec.encode_compact_art_fragment(self.compact_art_fragment)
+        body[2] = body[2][:1]
+        body = umsgpack.packb(body)
+        payload = (
+            codec.HEADER.pack(
+                codec.VERSION,
+                codec.COMPACT_ART_FRAGMENT,
+                codec.NO_ARTWORK_ID,
+                codec.NO_DEADLINE,
+                len(body),
+            )
+            + body
+        )
+        with self.assertRaises(ValueError):
+            codec.decode(payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Test Module for the crawling module
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from kademlia.node import Node
+from server.crawling import LatencyAwareNodeSpiderCrawl, order_by_latency
+from server.latency import LatencyTracker
+
+
+def make_node(long_id: int) -> Node:
+    """Make a node with an ID from an integer"""
+    return Node(long_id.to_bytes(20, "big"), "127.0.0.1", 5000 + long_id)
+
+
+class TestCrawling(unittest.IsolatedAsyncioTestCase):
+    """Test class for crawling module"""
+
+    def setUp(self):
+        """Track latency of contacts at different distances from the target"""
+        self.target = make_node(0)
+        self.latency = LatencyTracker()
+        self.near_slow, self.near_fast = make_node(4), make_node(5)
+        self.far_fast = make_node(64)
+        self.latency.record(self.near_slow.id, 0.5)
+        self.latency.record(self.near_fast.id, 0.01)
+        self.latency.record(self.far_fast.id, 0.001)
+
+    def test_order_by_latency(self):
+        """Test that nodes are ordered by bucket first, and by latency within a bucket"""
+        nodes = [self.far_fast, self.near_slow, self.near_fast]
+        self.assertEqual(
+            order_by_latency(nodes, self.target, self.latency),
+            [self.near_fast, self.near_slow, self.far_fast],
+        )
+
+    async def test_crawl_asks_fastest_first(self):
+        """Test that a crawl asks the fastest of the closest contacts first"""
+        asked = []
+
+        async def call_find_node(peer, _):
+            asked.append(peer)
+            return True, []
+
+        protocol = MagicMock(latency=self.latency, call_find_node=call_find_node)
+        nodes = [self.far_fast, self.near_slow, self.near_fast]
+        spider = LatencyAwareNodeSpiderCrawl(protocol, self.target, nodes, 20, 1)
+        found = await spider.find()
+        self.assertEqual(asked, [self.near_fast, self.near_slow, self.far_fast])
+        self.assertEqual(len(found), 3)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+"""
+Simple Test Module for the GenerationBudget class
+"""
+
+from datetime import timedelta
+import unittest
+from unittest.mock import Mock
+from commission.artwork import Artwork
+from peer.generation_budget import GenerationBudget
+
+
+class TestGenerationBudget(unittest.TestCase):
+    """Test class for GenerationBudget class"""
+
+    def setUp(self):
+        """Create a GenerationBudget that assumes a throughput of 1000 pixels per second"""
+        self.budget = GenerationBudget(
+            pixels_per_second=1000, safety_factor=0.5, network_allowance=1.0
+        )
+
+    def test_record(self):
+        """Test that measurements move the throughput towards the measured one"""
+        self.budget.record(4000, 1.0)
+        self.assertAlmostEqual(self.budget.pixels_per_second, 0.3 * 4000 + 0.7 * 1000)
+
+        self.budget.record(0, 1.0)
+        self.budget.record(100, 0.0)
+        self.assertAlmostEqual(self.budget.pixels_per_second, 0.3 * 4000 + 0.7 * 1000)
+
+    def test_get_max_pixels(self):
+        """Test that the pixel budget fits in half the time left after sending"""
+        artwork = Artwork(10, 10, timedelta(seconds=11), Mock())
+        self.assertLessEqual(self.budget.get_time_budget(artwork), 5.0)
+        self.assertGreater(self.budget.get_time_budget(artwork), 4.9)
+        self.assertLessEqual(self.budget.get_max_pixels(artwork), 5000)
+        self.assertGreater(self.budget.get_max_pixels(artwork), 4900)
+
+    def test_deadline_passed(self):
+        """Test that there is no budget once the deadline is closer than sending takes"""
+        artwork = Artwork(10, 10, timedelta(seconds=0.5), Mock())
+        self.assertEqual(self.budget.get_time_budget(artwork), 0)
+        self.assertEqual(self.budget.get_max_pixels(artwork), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Test Module for the ingest module
+"""
+
+import asyncio
+import hashlib
+import unittest
+from unittest.mock import MagicMock
+from kademlia.node import Node
+from kademlia.storage import ForgetfulStorage
+from server.ingest import DROP_NEWEST, DROP_OLDEST, REJECT, IngestQueue
+from server.protocol import NotificationProtocol
+
+
+class TestIngestQueue(unittest.IsolatedAsyncioTestCase):
+    """Test class for ingest module"""
+
+    def setUp(self):
+        """Record what the callback is called with, blocking it until released"""
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def callback(self, key, value):
+        """Wait until released, then record the key and value"""
+        await self.release.wait()
+        self.calls.append((key, value))
+
+    async def fill(self, policy, dropped_callback=None):
+        """Fill a queue of two with one worker blocked on the first value"""
+        ingest = IngestQueue(
+            self.callback,
+            max_size=2,
+            workers=1,
+            policy=policy,
+            dropped_callback=dropped_callback,
+        )
+        self.addCleanup(ingest.stop)
+        self.assertTrue(ingest.put(b"first", b"1"))
+        await asyncio.sleep(0)
+        self.assertTrue(ingest.put(b"second", b"2"))
+        self.assertTrue(ingest.put(b"third", b"3"))
+        return ingest
+
+    async def test_processes_values(self):
+        """Test that every queued value is passed to the callback"""
+        self.release.set()
+        ingest = IngestQueue(self.callback, workers=2)
+        self.addCleanup(ingest.stop)
+        for index in range(10):
+            self.assertTrue(ingest.put(bytes([index]), b"value"))
+        await ingest.join()
+        self.assertEqual(len(self.calls), 10)
+        self.assertEqual(ingest.get_stats()["processed"], 10)
+        self.assertEqual(ingest.get_depth(), 0)
+
+    async def test_drop_oldest(self):
+        """Test that a full queue drops the value that waited longest"""
+        ingest = await self.fill(DROP_OLDEST)
+        self.assertTrue(ingest.put(b"fourth", b"4"))
+        self.release.set()
+        await ingest.join()
+        self.assertEqual(
+            [key for key, _ in self.calls], [b"first", b"third", b"fourth"]
+        )
+        self.assertEqual(ingest.dropped, 1)
+
+    async def test_drop_newest(self):
+        """Test that a full queue drops the new value"""
+        ingest = await self.fill(DROP_NEWEST)
+        self.assertTrue(ingest.put(b"fourth", b"4"))
+        self.release.set()
+        await ingest.join()
+        self.assertEqual(
+            [key for key, _ in self.calls], [b"first", b"second", b"third"]
+        )
+        self.assertEqual(ingest.dropped, 1)
+
+    async def test_reject(self):
+        """Test that a full queue rejects the new value"""
+        ingest = await self.fill(REJECT)
+        self.assertFalse(ingest.put(b"fourth", b"4"))
+        self.assertEqual(ingest.get_depth(), 2)
+        self.release.set()
+        await ingest.join()
+        stats = ingest.get_stats()
+        self.assertEqual((stats["received"], stats["rejected"]), (4, 1))
+        self.assertEqual(stats["dropped"], 0)
+
+    async def test_dropped_callback(self):
+        """Test that the values dropped or rejected are passed to dropped_callback"""
+        expected = {
+            DROP_OLDEST: (b"second", b"2"),
+            DROP_NEWEST: (b"fourth", b"4"),
+            REJECT: (b"fourth", b"4"),
+        }
+        for policy, dropped in expected.items():
+            self.release.clear()
+            dropped_callback = MagicMock()
+            ingest = await self.fill(policy, dropped_callback)
+            ingest.put(b"fourth", b"4")
+            dropped_callback.assert_called_once_with(*dropped)
+            self.release.set()
+            await ingest.join()
+
+    async def test_failed_callback(self):
+        """Test that a failing callback is counted and does not stop the worker"""
+
+        async def failing_callback(key, _):
+            if key == b"bad":
+                raise RuntimeError("callback failed")
+            self.calls.append(key)
+
+        ingest = IngestQueue(failing_callback, workers=1)
+        self.addCleanup(ingest.stop)
+        ingest.put(b"bad", b"")
+        ingest.put(b"good", b"")
+        with self.assertLogs("IngestQueue", "ERROR"):
+            await ingest.join()
+        self.assertEqual(self.calls, [b"good"])
+        self.assertEqual((ingest.failed, ingest.processed), (1, 1))
+
+    async def test_stop(self):
+        """Test that stopping cancels the workers"""
+        ingest = await self.fill(DROP_OLDEST)
+        workers = ingest.workers
+        ingest.stop()
+        await asyncio.sleep(0)
+        self.assertTrue(all(worker.cancelled() for worker in workers))
+        self.assertEqual(ingest.get_depth(), 0)
+
+    def test_unknown_policy(self):
+        """Test that an unknown overload policy is refused"""
+        with self.assertRaises(ValueError):
+            IngestQueue(self.callback, policy="unknown")
+
+    async def test_rpc_store_rejected(self):
+        """Test that rpc_store does not store a value the ingest queue rejects"""
+        ingest = await self.fill(REJECT)
+        storage = ForgetfulStorage()
+        protocol = NotificationProtocol(
+            Node(b"\x01" * 20), storage, 20, self.callback, ingest=ingest
+        )
+        protocol.router = MagicMock()
+        sender = ("127.0.0.1", 5000)
+        self.assertFalse(protocol.rpc_store(sender, b"\x02" * 20, b"key", b"value"))
+        self.assertIsNone(storage.get(b"key"))
+        self.release.set()
+        await ingest.join()
+        self.assertTrue(protocol.rpc_store(sender, b"\x02" * 20, b"key", b"value"))
+        self.assertEqual(storage.get(b"key"), b"value")
+
+    async def test_redelivered_after_drop(self):
+        """Test that a value the ingest queue dropped is passed on when received again"""
+        ingest = IngestQueue(self.callback, max_size=2, workers=1)
+        self.addCleanup(ingest.stop)
+        protocol = NotificationProtocol(
+            Node(b"\x01" * 20), ForgetfulStorage(), 20, self.callback, ingest=ingest
+        )
+        ingest.dropped_callback = protocol.forget
+        protocol.router = MagicMock()
+        sender = ("127.0.0.1", 5000)
+        for key in (b"1", b"2", b"3", b"4"):
+            self.assertTrue(protocol.rpc_deliver(sender, b"\x02" * 20, key, key))
+            await asyncio.sleep(0)
+        self.assertNotIn(hashlib.sha1(b"2").digest(), protocol.seen_values)
+        self.assertIn(hashlib.sha1(b"3").digest(), protocol.seen_values)
+        self.release.set()
+        await ingest.join()
+        self.assertTrue(protocol.rpc_deliver(sender, b"\x02" * 20, b"2", b"2"))
+        await ingest.join()
+        self.assertEqual([key for key, _ in self.calls], [b"1", b"3", b"4", b"2"])
@@ -0,0 +1,50 @@
+"""
+Test Module for the latency module
+"""
+
+import unittest
+from server.latency import INITIAL_RTT, LatencyTracker
+
+
+class TestLatencyTracker(unittest.TestCase):
+    """Test class for latency module"""
+
+    def setUp(self):
+        """Create a tracker for a few contacts"""
+        self.latency = LatencyTracker(maxsize=2, timeout=5.0)
+
+    def test_smoothed_rtt(self):
+        """Test that round trip times are smoothed, starting from the first one"""
+        self.assertIsNone(self.latency.get_rtt(b"a"))
+        self.assertEqual(self.latency.get_score(b"a"), INITIAL_RTT)
+        self.latency.record(b"a", 0.2)
+        self.assertAlmostEqual(self.latency.get_rtt(b"a"), 0.2)
+        self.latency.record(b"a", 1.0)
+        self.assertAlmostEqual(self.latency.get_rtt(b"a"), 0.3)
+
+    def test_timeouts_raise_score(self):
+        """Test that a contact that timed out scores worse than one that always answered"""
+        self.latency.record(b"a", 0.05)
+        self.latency.record(b"b", 0.05)
+        self.latency.record(b"b")
+        self.assertLess(self.latency.get_score(b"a"), self.latency.get_score(b"b"))
+        self.assertAlmostEqual(self.latency.get_rtt(b"b"), 0.05)
+
+    def test_parallelism(self):
+        """Test that lookups ask more contacts at once as rpcs are lost, up to a limit"""
+        self.assertEqual(self.latency.get_parallelism(3, 20), 3)
+        for _ in range(5):
+            self.latency.record(b"a")
+        parallelism = self.latency.get_parallelism(3, 20)
+        self.assertGreater(parallelism, 3)
+        for _ in range(100):
+            self.latency.record(b"a")
+        self.assertEqual(self.latency.get_parallelism(3, 20), 20)
+        self.assertEqual(self.latency.get_parallelism(3, 8), 8)
+
+    def test_forgets_least_recent(self):
+        """Test that only the most recently heard of contacts are remembered"""
+        for node_id in (b"a", b"b", b"c"):
+            self.latency.record(node_id, 0.01)
+        self.assertIsNone(self.latency.get_rtt(b"a"))
+        self.assertIsNotNone(self.latency.get_rtt(b"c"))
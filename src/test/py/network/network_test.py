@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the NotifyingServer class
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock
+from server.chunking import MAX_INLINE_SIZE
+from server.network import NotifyingServer, ReplicationPolicy, load_contacts
+from server.ratelimit import RateLimit, RateLimiter
+from server.storage import SqliteStorage
+
+
+class TestNotifyingServer(unittest.IsolatedAsyncioTestCase):
+    """Test class for NotifyingServer class"""
+
+    async def asyncSetUp(self):
+        """Start three connected servers"""
+        self.delivered = asyncio.Event()
+        self.callbacks = [AsyncMock() for _ in range(3)]
+        self.callbacks[1].side_effect = lambda *args: self.delivered.set()
+        self.nodes = [NotifyingServer(callback) for callback in self.callbacks]
+        for node in self.nodes:
+            await node.listen(0, interface="127.0.0.1")
+        port = self.nodes[0].transport.get_extra_info("sockname")[1]
+        for node in self.nodes[1:]:
+            await node.bootstrap([("127.0.0.1", port)])
+
+    async def asyncTearDown(self):
+        """Stop the servers"""
+        for node in self.nodes:
+            node.stop()
+
+    async def test_deliver(self):
+        """Test that delivered values reach only their node, however large they are"""
+        for value in (b"fragment", os.urandom(3 * MAX_INLINE_SIZE)):
+            self.delivered.clear()
+            self.callbacks[1].reset_mock()
+            self.assertTrue(
+                await self.nodes[0].deliver(self.nodes[1].node.id, "key", value)
+            )
+            await asyncio.wait_for(self.delivered.wait(), 5)
+
+            key = hashlib.sha1(b"key").digest()
+            self.callbacks[1].assert_called_once_with(key, value)
+            self.assertIsNone(self.nodes[1].storage.get(key))
+        self.callbacks[2].assert_not_called()
+
+    async def test_replicated_value_notifies_once(self):
+        """Test that a value stored again is stored but passed to the callback only once"""
+        self.assertTrue(await self.nodes[0].set("key", b"commission"))
+        await asyncio.wait_for(self.delivered.wait(), 5)
+        self.assertTrue(await self.nodes[0].set("key", b"commission"))
+        await asyncio.sleep(0.05)
+        self.callbacks[1].assert_called_once()
+        self.assertEqual(self.nodes[1].seen_values.get_stats()["hits"], 1)
+        self.assertEqual(
+            self.nodes[1].storage.get(hashlib.sha1(b"key").digest()), b"commission"
+        )
+
+    async def test_set_rejected(self):
+        """Test that a value every node rejected is not reported as stored"""
+        for node in self.nodes[1:]:
+            node.protocol.rate_limiter = RateLimiter({None: RateLimit(0, 0)})
+        self.assertFalse(await self.nodes[0].set("key", b"commission"))
+        self.nodes[2].protocol.rate_limiter = RateLimiter()
+        self.assertTrue(await self.nodes[0].set("key", b"commission"))
+
+    async def test_deliver_unknown_node(self):
+        """Test that a value for a node not in the routing table is set instead"""
+        self.assertIsNone(self.nodes[0].find_contact(bytes(20)))
+        self.assertTrue(await self.nodes[0].deliver(bytes(20), "key", b"fragment"))
+        await asyncio.wait_for(self.delivered.wait(), 5)
+
+        key = hashlib.sha1(b"key").digest()
+        self.assertEqual(self.nodes[1].storage.get(key), b"fragment")
+
+
+class TestGossip(unittest.IsolatedAsyncioTestCase):
+    """Test class for gossip between NotifyingServers"""
+
+    async def start_nodes(self, count, **kwargs):
+        """Start count servers bootstrapped off the first one"""
+        callbacks = [AsyncMock() for _ in range(count)]
+        nodes = [NotifyingServer(callback, **kwargs) for callback in callbacks]
+        for node in nodes:
+            await node.listen(0, interface="127.0.0.1")
+            self.addCleanup(node.stop)
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        for node in nodes[1:]:
+            await node.bootstrap([("127.0.0.1", port)])
+        return nodes, callbacks
+
+    async def test_gossip_reaches_everyone_once(self):
+        """Test that gossip reaches every node, each only once"""
+        nodes, callbacks = await self.start_nodes(6, gossip_fanout=5, gossip_ttl=3)
+        self.assertTrue(await nodes[0].gossip("commission", b"artwork"))
+        await asyncio.sleep(0.2)
+
+        key = hashlib.sha1(b"commission").digest()
+        callbacks[0].assert_not_called()
+        for callback in callbacks[1:]:
+            callback.assert_called_once_with(key, b"artwork")
+        self.assertTrue(all(node.storage.get(key) is None for node in nodes))
+
+    async def test_gossip_fanout_and_ttl(self):
+        """Test that gossip with a single round reaches only fanout nodes"""
+        nodes, callbacks = await self.start_nodes(6, gossip_fanout=2, gossip_ttl=1)
+        self.assertTrue(await nodes[0].gossip("commission", b"artwork"))
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(2, sum(callback.call_count for callback in callbacks))
+
+    async def test_gossip_too_large(self):
+        """
+        Test that values too large for a single rpc are gossiped as pointers, and not at all
+        by a node without a stream server
+        """
+        nodes, callbacks = await self.start_nodes(2)
+        self.assertTrue(await nodes[0].gossip("commission", bytes(MAX_INLINE_SIZE + 1)))
+        await asyncio.sleep(0.2)
+        callbacks[1].assert_called_once_with(
+            hashlib.sha1(b"commission").digest(), bytes(MAX_INLINE_SIZE + 1)
+        )
+        nodes[0].protocol.bulk_port = None
+        self.assertFalse(await nodes[0].gossip("artwork", bytes(MAX_INLINE_SIZE + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestWarmBootstrap(unittest.IsolatedAsyncioTestCase):
+    """Test class for restarting NotifyingServers from a routing table snapshot"""
+
+    async def start_node(self, node_id=None, port=0):
+        """Start a server, on a free port by default"""
+        node = NotifyingServer(AsyncMock(), node_id=node_id)
+        await node.listen(port, interface="127.0.0.1")
+        self.addCleanup(node.stop)
+        return node
+
+    def test_load_missing_contacts(self):
+        """Test that a missing or corrupt snapshot reads as no snapshot"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "contacts")
+            self.assertIsNone(load_contacts(path))
+            with open(path, "wb") as file:
+                file.write(b"\xc1")
+            self.assertIsNone(load_contacts(path))
+
+    async def test_warm_bootstrap(self):
+        """Test that a restarted server is back in contact as soon as a saved contact answers"""
+        nodes = [await self.start_node() for _ in range(4)]
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        for node in nodes[1:]:
+            await node.bootstrap([("127.0.0.1", port)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "contacts")
+            nodes[3].save_contacts(path)
+            node_id, contacts = load_contacts(path)
+            port = nodes[3].transport.get_extra_info("sockname")[1]
+            nodes[3].stop()
+            await asyncio.sleep(0)
+        self.assertEqual(node_id, nodes[3].node.id)
+        self.assertEqual(len(contacts), 3)
+
+        restarted = await self.start_node(node_id, port)
+        dead_seed = ("127.0.0.1", 9)
+        started = time.monotonic()
+        self.assertTrue(await restarted.warm_bootstrap(contacts, [dead_seed]))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(restarted.protocol.router.find_neighbors(restarted.node))
+        self.assertTrue(await restarted.set("key", b"value"))
+
+    async def test_warm_bootstrap_no_answer(self):
+        """Test that warm bootstrap reports when no contact or seed answered"""
+        node = await self.start_node()
+        node.protocol._wait_timeout = 0.1  # pylint: disable=protected-access
+        self.assertFalse(
+            await node.warm_bootstrap([(bytes(20), "127.0.0.1", 9)], [("127.0.0.1", 9)])
+        )
+
+    async def test_join(self):
+        """Test that a joining server is ready once it has enough contacts"""
+        nodes = [await self.start_node() for _ in range(3)]
+        self.assertTrue(await nodes[0].join([]))
+        self.assertTrue(nodes[0].ready.is_set())
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        self.assertTrue(await nodes[1].join([("127.0.0.1", port)]))
+        self.assertTrue(await nodes[2].join([("127.0.0.1", port)], min_contacts=2))
+        self.assertGreaterEqual(nodes[2].count_contacts(), 2)
+        await asyncio.wait_for(nodes[2].ready.wait(), 1)
+
+    async def test_join_gives_up(self):
+        """Test that a server that cannot reach enough contacts retries, then gives up"""
+        nodes = [await self.start_node() for _ in range(2)]
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        self.assertFalse(
+            await nodes[1].join(
+                [("127.0.0.1", port)], min_contacts=2, attempts=2, backoff=0.01
+            )
+        )
+        self.assertEqual(nodes[1].count_contacts(), 1)
+        self.assertFalse(nodes[1].ready.is_set())
+        # No backoff after the last attempt.
+        self.assertFalse(
+            await asyncio.wait_for(
+                nodes[1].join(
+                    [("127.0.0.1", port)], min_contacts=2, attempts=1, backoff=10
+                ),
+                1,
+            )
+        )
+
+    async def test_join_retries_contacts(self):
+        """Test that a server without seeds retries its saved contacts until one answers"""
+        contact = await self.start_node()
+        port = contact.transport.get_extra_info("sockname")[1]
+        contacts = [(contact.node.id, "127.0.0.1", port)]
+        contact.stop()
+        await asyncio.sleep(0)
+
+        node = await self.start_node()
+        node.protocol._wait_timeout = 0.1  # pylint: disable=protected-access
+        joining = asyncio.ensure_future(
+            node.join([], contacts, attempts=3, backoff=0.3)
+        )
+        await asyncio.sleep(0.15)
+        await self.start_node(contact.node.id, port)
+        self.assertTrue(await asyncio.wait_for(joining, 2))
+        self.assertTrue(node.ready.is_set())
+
+    async def test_lookups_record_latency(self):
+        """Test that lookups record the round trip times of the contacts they ask"""
+        nodes = [await self.start_node() for _ in range(3)]
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        for node in nodes[1:]:
+            await node.join([("127.0.0.1", port)])
+        self.assertTrue(await nodes[2].set("key", b"value"))
+        self.assertEqual(await nodes[1].get("key"), b"value")
+        for node in nodes[:2]:
+            self.assertIsNotNone(nodes[2].protocol.latency.get_rtt(node.node.id))
+
+
+class TestReplicationPolicy(unittest.IsolatedAsyncioTestCase):
+    """Test class for replicating values by their kind"""
+
+    POLICIES = {
+        b"f": ReplicationPolicy(1, 60, False),
+        b"a": ReplicationPolicy(None, None, True),
+    }
+
+    async def start_nodes(self, count):
+        """Start count servers classifying values by their first byte"""
+        nodes = [
+            NotifyingServer(
+                AsyncMock(),
+                replication_policies=self.POLICIES,
+                classify_value=lambda value: value[:1],
+            )
+            for _ in range(count)
+        ]
+        for node in nodes:
+            await node.listen(0, interface="127.0.0.1")
+            self.addCleanup(node.stop)
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        for node in nodes[1:]:
+            await node.join([("127.0.0.1", port)])
+        return nodes
+
+    async def test_replicas(self):
+        """Test that values are stored on as many nodes as their policy says"""
+        nodes = await self.start_nodes(5)
+        for value, most, least in ((b"fragment", 2, 1), (b"artwork", 5, 5)):
+            key = hashlib.sha1(value).digest()
+            self.assertTrue(await nodes[0].set(value, value))
+            stored = sum(node.storage.get(key) is not None for node in nodes)
+            self.assertLessEqual(stored, most)
+            self.assertGreaterEqual(stored, least)
+
+    async def test_republish(self):
+        """Test that values expire and are republished as their policy says"""
+        now = [10000.0]
+        node = NotifyingServer(
+            AsyncMock(),
+            storage=SqliteStorage(clock=lambda: now[0]),
+            replication_policies=self.POLICIES,
+            classify_value=lambda value: value[:1],
+        )
+        node.set_digest = AsyncMock()
+        await node.listen(0, interface="127.0.0.1")
+        self.addCleanup(node.stop)
+        for key in (b"fragment", b"artwork", b"other"):
+            node.storage[key] = key
+        now[0] += 30
+        node.storage[b"new fragment"] = b"fragment"
+
+        now[0] += 40
+        await node.republish()
+        self.assertIsNone(node.storage.get(b"fragment"))
+        self.assertIsNotNone(node.storage.get(b"new fragment"))
+        node.set_digest.assert_not_called()
+
+        now[0] += 3600
+        await node.republish()
+        self.assertIsNone(node.storage.get(b"new fragment"))
+        republished = [call.args[0] for call in node.set_digest.call_args_list]
+        self.assertEqual(sorted(republished), [b"artwork", b"other"])
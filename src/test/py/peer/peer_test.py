@@ -5,18 +5,32 @@ Test Module for the Peer class
 
 import asyncio
 from collections import namedtuple, deque
-from datetime import timedelta
+from datetime import datetime, timedelta
+import hashlib
 import logging
-import pickle
+import random
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock, AsyncMock
+import numpy as np
+from PIL import Image
+from codec import codec
+from commission.artfragment import (
+    ArtFragment,
+    CompactArtFragment,
+    PrimitiveArtFragment,
+)
+from commission.artfragmentgenerator import generate_fragment, plan_fragment_tiles
 from commission.artwork import Artwork
+from drawing.drawing import Color, Constraint, Coordinates, Pixel, Rectangle
 from peer.peer import Peer
 from peer.ledger import Ledger
 from peer.inventory import Inventory
 from peer.wallet import Wallet
 from exchange.offer_announcement import OfferAnnouncement
 from exchange.offer_response import OfferResponse
+import utils
 
 
 class MockNode:
@@ -38,12 +52,43 @@ class MockNode:
             return self.data_store[key]
         raise KeyError(f"No value found for key: {key}")
 
+    def stop(self):
+        """Stops the node."""
+
+    async def deliver(self, node_id, key, value):
+        """Delivers a value to a single node."""
+        self.data_store[key] = (node_id, value)
+
+    async def gossip(self, key, value):
+        """Spreads a value to the whole network."""
+        self.data_store[key] = value
+
     async def bootstrap(self, peers):
         """Bootstrap the node with a peer."""
         if len(peers) > 0:
             return True
         return False
 
+    async def join(self, seeds, contacts, min_contacts):
+        """Join the network from seeds and saved contacts."""
+        return len(seeds) + len(contacts) >= min_contacts
+
+    def save_contacts_regularly(self, path):
+        """Save the routing table regularly."""
+        self.data_store[path] = "contacts"
+
+    def add_to_sync(self, group, value):
+        """Hold a value of a group to reconcile."""
+        self.data_store.setdefault(group, []).append(value)
+
+    def discard_sync(self, group):
+        """Stop holding the values of a group."""
+        self.data_store.pop(group, None)
+
+    async def sync_with(self, node_id, group):
+        """Reconcile the values of a group with a node."""
+        return len(self.data_store.get(group, ())) if node_id else None
+
     async def listen(self, port):
         """Listen on the port."""
         if port > 0:
@@ -71,8 +116,11 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
             spec=MockNode,
             node=namedtuple(
                 "MockChildNode", ["long_id"], defaults=(int(hex(12345), 16),) * 1
-            ),
+            )(),
         )
+        self.mock_node.ready = asyncio.Event()
+        self.mock_node.ready.set()
+        self.mock_node.stop = MagicMock()
         self.mock_kdm.return_value = self.mock_node
         self.peer = Peer(
             5001,
@@ -130,8 +178,41 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
         """
         Test case for connecting to the network.
         """
-        await self.peer.connect_to_network()
-        self.peer.node.bootstrap.assert_called_once()
+        self.mock_node.join.return_value = True
+        self.assertTrue(await self.peer.connect_to_network())
+        self.mock_node.join.assert_called_once_with([("127.0.0.1", 5000)], [], 1)
+        self.mock_node.save_contacts_regularly.assert_not_called()
+
+    async def test_connect_to_network_from_contacts(self):
+        """
+        Test that a peer with a routing table snapshot of its own bootstraps from it, and
+        keeps saving it.
+        """
+        self.peer.contacts_path = "contacts"
+        node_id = hashlib.sha1(self.peer.keys["public"].encode()).digest()
+        contacts = [(bytes(20), "127.0.0.1", 5002)]
+        with patch("peer.peer.load_contacts", return_value=(node_id, contacts)):
+            await self.peer.connect_to_network(min_contacts=2)
+        self.mock_node.join.assert_called_once_with([("127.0.0.1", 5000)], contacts, 2)
+        self.mock_node.save_contacts_regularly.assert_called_once_with("contacts")
+
+        self.mock_node.reset_mock()
+        with patch("peer.peer.load_contacts", return_value=(bytes(20), contacts)):
+            await self.peer.connect_to_network()
+        self.mock_node.join.assert_called_once_with([("127.0.0.1", 5000)], [], 1)
+
+    def test_multiple_seeds(self):
+        """Test that a peer takes several comma separated network addresses"""
+        peer = Peer(
+            5001,
+            "src/test/py/resources/peer_test",
+            "127.0.0.1:5000, 127.0.0.2:5001",
+            self.mock_kdm,
+        )
+        self.assertEqual(len(peer.seeds), 2)
+        self.assertEqual(peer.network_port_num, 5000)
+        with self.assertRaises(ValueError):
+            Peer(5001, "src/test/py/resources/peer_test", "127.0.0.1", self.mock_kdm)
 
     @patch("builtins.input", side_effect=["10", "20", "5", "10"])
     async def test_commission_art_piece(self, mock_input):
@@ -151,7 +232,7 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
             self.test_logger.debug(mock_input)
             commission = await self.peer.commission_art_piece()
             self.mock_node.set.assert_called_with(
-                commission.get_key(), pickle.dumps(commission)
+                commission.get_key(), codec.encode(commission)
             )
             self.assertEqual(commission.width, 10)
             self.assertEqual(commission.height, 20)
@@ -159,6 +240,24 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
             self.assertLessEqual(commission.wait_time, timedelta(seconds=10))
             await self.deadline_task
 
+    async def test_send_commission_request_gossip(self):
+        """
+        Test that commissions are gossiped as well as set when gossip is enabled.
+        """
+
+        self.peer.gossip_commissions = True
+        with patch.object(self.peer, "setup_deadline_timer"):
+            await self.peer.send_commission_request(self.artwork2)
+
+        encoded_commission = codec.encode(self.artwork2)
+        self.mock_node.set.assert_called_once_with(
+            self.artwork2.get_key(), encoded_commission
+        )
+        self.mock_node.gossip.assert_called_once_with(
+            self.artwork2.get_key(), encoded_commission
+        )
+        self.peer.logger.info.assert_any_call("Commission sent")
+
     def test_add_owner(self):
         """
         Test the add_owner method of Ledger
@@ -235,11 +334,10 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
         self.assertNotIn(self.announcement_key, self.peer.inventory.pending_exchanges)
         self.assertIn(self.announcement_key, self.peer.inventory.completed_exchanges)
         self.assertEqual(10, self.peer.wallet.get_balance())
-        self.peer.logger.info.assert_any_call("Exchange announcement deadline reached")
-        self.peer.node.set.assert_called_once_with(
-            self.announcement_key, pickle.dumps(self.offer_announcement_sale)
+        self.peer.logger.info.assert_any_call(
+            "Exchange announcement deadline reached for %s", self.sale_type
         )
-        self.peer.logger.info.assert_any_call("%s announced", self.sale_type)
+        self.peer.node.set.assert_not_called()
 
     async def test_announce_exchange(self):
         """
@@ -364,6 +462,344 @@ class TestPeer(unittest.IsolatedAsyncioTestCase):
         )
         self.peer.logger.info("Exchange unsuccessful")
 
+    def test_merge_canvas_compact_fragment(self):
+        """
+        Test that merging a compact fragment paints the same canvas as its pixels do.
+        """
+
+        artwork = Artwork(
+            10, 10, timedelta(minutes=10), self.peer.ledger, Constraint(5, "any")
+        )
+        fragment = generate_fragment(artwork, 1, "public_key", 2, batched=True)
+
+        merged = self.peer.merge_canvas(fragment, Image.new("RGBA", (10, 10)))
+
+        expected = Image.new("RGBA", (10, 10))
+        pixels = expected.load()
+        for pixel in fragment.pixels:
+            pixels[pixel.coordinates.x, pixel.coordinates.y] = pixel.color
+        self.assertEqual(list(merged.getdata()), list(expected.getdata()))
+
+    def test_merge_canvas_compact_fragment_box(self):
+        """
+        Test that merging a compact fragment only writes its bounding box, or its pixels alone
+        when it is sparse.
+        """
+        canvas = Image.new("RGBA", (1000, 1000))
+        palette = (Color(1, 2, 3, 255), Color(4, 5, 6, 255))
+
+        def compact(xs, ys):
+            return CompactArtFragment(
+                "artwork_id",
+                "public_key",
+                np.array(xs, dtype=np.uint16),
+                np.array(ys, dtype=np.uint16),
+                palette,
+                np.array([0, 1], dtype=np.uint8),
+            )
+
+        with patch.object(canvas, "paste", wraps=canvas.paste) as paste:
+            self.peer.merge_canvas(compact([2, 4], [3, 5]), canvas)
+            paste.assert_called_once()
+            self.assertEqual(paste.call_args.args[1], (2, 3, 5, 6))
+            paste.reset_mock()
+            self.peer.merge_canvas(compact([0, 999], [0, 999]), canvas)
+            paste.assert_not_called()
+
+        self.assertEqual(canvas.getpixel((2, 3)), (1, 2, 3, 255))
+        self.assertEqual(canvas.getpixel((4, 5)), (4, 5, 6, 255))
+        self.assertEqual(canvas.getpixel((3, 4)), (0, 0, 0, 0))
+        self.assertEqual(canvas.getpixel((999, 999)), (4, 5, 6, 255))
+
+    def test_merge_canvas_primitive_fragment(self):
+        """
+        Test that merging a primitive fragment rasterizes its primitives onto the canvas.
+        """
+
+        rectangle = Rectangle(Coordinates(1, 2), Coordinates(3, 4), Color(9, 8, 7))
+        fragment = PrimitiveArtFragment(self.artwork1.key, "public_key", (rectangle,))
+
+        merged = self.peer.merge_canvas(fragment, Image.new("RGBA", (10, 10)))
+
+        pixels = merged.load()
+        self.assertEqual(pixels[1, 2], Color(9, 8, 7))
+        self.assertEqual(pixels[3, 4], Color(9, 8, 7))
+        self.assertEqual(pixels[0, 0], (0, 0, 0, 0))
+
+    def test_stop(self):
+        """
+        Test that stopping a peer stops its node and shuts down its generation executor.
+        """
+
+        peer = Peer(
+            5002,
+            "src/test/py/resources/peer_test",
+            "127.0.0.1:5000",
+            self.mock_kdm,
+            generation_executor="thread",
+        )
+        peer.stop()
+        peer.node = self.mock_node
+        peer.stop()
+
+        self.mock_node.stop.assert_called_once()
+        with self.assertRaises(RuntimeError):
+            peer.generation_executor.submit(print)
+
+    async def test_contribute_to_artwork_thread_executor(self):
+        """
+        Test that fragments are generated off the event loop thread and then sent.
+        """
+
+        peer = Peer(
+            5002,
+            "src/test/py/resources/peer_test",
+            "127.0.0.1:5000",
+            self.mock_kdm,
+            generation_executor="thread",
+        )
+        self.addCleanup(peer.stop)
+        peer.node = self.mock_node
+        generating_threads = []
+
+        def generate(*args, **kwargs):
+            generating_threads.append(threading.get_ident())
+            return generate_fragment(*args, **kwargs)
+
+        with patch("peer.peer.generate_fragment", side_effect=generate):
+            await peer.contribute_to_artwork(self.artwork1)
+
+        self.assertNotIn(threading.get_ident(), generating_threads)
+        self.assertEqual(1, len(generating_threads))
+        self.mock_node.set.assert_called_once()
+
+    async def test_contribute_to_artwork_tiles(self):
+        """
+        Test that a tiled contribution sends every tile as its own fragment.
+        """
+
+        peer = Peer(
+            5002,
+            "src/test/py/resources/peer_test",
+            "127.0.0.1:5000",
+            self.mock_kdm,
+            fragment_type="tiles",
+        )
+        peer.node = self.mock_node
+        peer.node.node = MagicMock(long_id=2)
+        artwork = Artwork(
+            300,
+            300,
+            timedelta(minutes=10),
+            self.peer.ledger,
+            Constraint(5, "any"),
+            originator_long_id=1,
+        )
+        _, tiles = plan_fragment_tiles(artwork, 1, 2, rng=random.Random(2))
+
+        with patch(
+            "peer.peer.plan_fragment_tiles",
+            side_effect=lambda *args, **kwargs: plan_fragment_tiles(
+                *args, **kwargs, rng=random.Random(2)
+            ),
+        ):
+            await peer.contribute_to_artwork(artwork)
+
+        self.mock_node.set.assert_not_called()
+        self.assertEqual(len(tiles), self.mock_node.deliver.call_count)
+        for tile, call in zip(tiles, self.mock_node.deliver.call_args_list):
+            self.assertEqual(call.args[0], (1).to_bytes(20, "big"))
+            fragment = codec.decode(call.args[2])
+            self.assertEqual(fragment.artwork_id, artwork.get_key())
+            self.assertEqual(len(fragment), tile.num_pixels)
+
+    async def test_contribute_to_artwork_deadline(self):
+        """
+        Test that no fragment is generated for a commission that is about to end.
+        """
+
+        artwork = Artwork(10, 10, timedelta(seconds=0.5), self.peer.ledger)
+        self.peer.node = self.mock_node
+
+        await self.peer.contribute_to_artwork(artwork)
+
+        self.mock_node.set.assert_not_called()
+        self.peer.logger.info.assert_any_call("Not enough time left to contribute")
+
+    async def test_contribute_to_artwork_not_ready(self):
+        """
+        Test that no fragment is generated if the node does not become ready in time.
+        """
+        self.mock_node.ready.clear()
+        with patch.object(
+            self.peer.generation_budget, "get_time_budget", return_value=0.01
+        ):
+            await self.peer.contribute_to_artwork(self.artwork1)
+
+        self.mock_node.set.assert_not_called()
+        self.mock_node.deliver.assert_not_called()
+        self.peer.logger.info.assert_any_call(
+            "Not connected to the network in time to contribute"
+        )
+
+    async def test_commission_art_piece_waits_until_ready(self):
+        """
+        Test that a commission is only sent once the node is ready.
+        """
+        self.mock_node.ready.clear()
+        task = asyncio.create_task(self.peer.commission_art_piece(10, 20, 10, 5))
+        await asyncio.sleep(0.01)
+        self.assertFalse(task.done())
+        self.mock_node.set.assert_not_called()
+        self.mock_node.gossip.assert_not_called()
+        task.cancel()
+
+    async def test_generate_fragment_bounded(self):
+        """
+        Test that no more than max_concurrent_generations fragments are generated at once.
+        """
+
+        peer = Peer(
+            5002,
+            "src/test/py/resources/peer_test",
+            "127.0.0.1:5000",
+            self.mock_kdm,
+            generation_executor="thread",
+            max_concurrent_generations=2,
+        )
+        self.addCleanup(peer.stop)
+        peer.node = self.mock_node
+        lock = threading.Lock()
+        in_flight = [0, 0]
+
+        def generate(*_args, **_kwargs):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+        with patch("peer.peer.generate_fragment", side_effect=generate):
+            await asyncio.gather(
+                *(peer.generate_fragment(self.artwork1) for _ in range(6))
+            )
+
+        self.assertEqual(2, in_flight[1])
+
+    async def test_send_fragment_content_key(self):
+        """
+        Test that a fragment is stored under the hash of its encoding.
+        """
+
+        fragment = PrimitiveArtFragment(self.artwork1.get_key(), "contributor", ())
+        await self.peer.send_fragment(fragment)
+        await self.peer.send_fragment(fragment)
+
+        encoded_fragment = codec.encode(fragment)
+        self.assertEqual(2, self.mock_node.set.call_count)
+        self.mock_node.set.assert_called_with(
+            utils.generate_content_key(encoded_fragment), encoded_fragment
+        )
+
+    async def test_data_stored_callback_duplicate(self):
+        """
+        Test that a message stored twice, under any key, is only handled once.
+        """
+
+        encoded_announcement = codec.encode(self.offer_announcement_sale)
+        with patch.object(self.peer, "send_exchange_response") as send_response:
+            await self.peer.data_stored_callback(b"key", encoded_announcement)
+            await self.peer.data_stored_callback(b"other_key", encoded_announcement)
+
+        send_response.assert_called_once()
+        self.peer.logger.info.assert_any_call("Skipping already processed message")
+
+    async def test_data_stored_callback_drops_by_header(self):
+        """
+        Test that fragments of other artworks and expired messages are dropped undecoded.
+        """
+
+        fragment = PrimitiveArtFragment(self.artwork2.get_key(), "contributor", ())
+        expired = OfferAnnouncement(self.artwork1, 10, "sale", "public_key")
+        with patch("peer.peer.codec.decode") as decode:
+            await self.peer.data_stored_callback(b"key", codec.encode(fragment))
+            await self.peer.data_stored_callback(
+                b"key", codec.encode(expired, datetime.now() - timedelta(seconds=1))
+            )
+        decode.assert_not_called()
+        self.assertEqual(0, len(self.peer.processed_messages))
+
+        self.peer.inventory.add_commission(self.artwork2)
+        self.peer.inventory.commission_canvases[self.artwork2.get_key()] = Image.new(
+            "RGBA", (10, 10)
+        )
+        with patch.object(self.peer, "merge_canvas") as merge_canvas:
+            await self.peer.data_stored_callback(b"key", codec.encode(fragment))
+        merge_canvas.assert_called_once()
+
+    async def test_data_stored_callback_invalid(self):
+        """
+        Test that values without a valid header are rejected.
+        """
+
+        await self.peer.data_stored_callback(b"key", b"not a message")
+        self.peer.logger.error.assert_called_with("Invalid object received")
+
+    async def test_fragment_off_canvas(self):
+        """
+        Test that a fragment with pixels off the commission's canvas is not merged.
+        """
+        self.peer.inventory.add_commission(self.artwork2)
+        canvas = Image.new("RGBA", (10, 10))
+        self.peer.inventory.commission_canvases[self.artwork2.get_key()] = canvas
+        fragment = ArtFragment(
+            self.artwork2.get_key(),
+            "contributor",
+            frozenset({Pixel(Coordinates(50, 5), Color(1, 2, 3, 255))}),
+        )
+        await self.peer.data_stored_callback(b"key", codec.encode(fragment))
+        self.peer.logger.error.assert_called_with("Fragment does not fit the canvas")
+        self.mock_node.add_to_sync.assert_not_called()
+        self.assertIs(
+            self.peer.inventory.commission_canvases[self.artwork2.get_key()], canvas
+        )
+
+    async def test_sync_fragments(self):
+        """
+        Test that fragments of a commission are held for reconciling, and that the commission
+        is reconciled with every peer that contributed to it.
+        """
+
+        self.peer.inventory.add_commission(self.artwork2)
+        self.peer.inventory.commission_canvases[self.artwork2.get_key()] = Image.new(
+            "RGBA", (10, 10)
+        )
+        encoded = codec.encode(
+            PrimitiveArtFragment(self.artwork2.get_key(), "contributor", ())
+        )
+        await self.peer.data_stored_callback(b"key", encoded)
+        self.mock_node.add_to_sync.assert_called_once_with(
+            self.artwork2.get_key(), encoded
+        )
+
+        await self.peer.sync_fragments(self.artwork2)
+        self.mock_node.sync_with.assert_called_once_with(
+            hashlib.sha1(b"contributor").digest(), self.artwork2.get_key()
+        )
+
+        self.mock_node.sync_with.reset_mock()
+        self.peer.inventory.add_contributor(self.artwork2.get_key(), b"other")
+        self.mock_node.sync_with.side_effect = [KeyError("keys"), 1]
+        await self.peer.sync_fragments(self.artwork2)
+        self.assertEqual(self.mock_node.sync_with.call_count, 2)
+        self.peer.logger.info.assert_any_call("Recovering %d lost fragments", 1)
+
+        self.peer.inventory.remove_commission(self.artwork2)
+        self.mock_node.sync_with.reset_mock()
+        await self.peer.sync_fragments(self.artwork2)
+        self.mock_node.sync_with.assert_not_called()
+
     # def test_commission_with_palette_limit:
 
 
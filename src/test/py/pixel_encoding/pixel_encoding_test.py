@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the pixel_encoding module
+"""
+
+import unittest
+import zlib
+import numpy as np
+from codec import pixel_encoding
+from codec.pixel_encoding import PackedPixels, pack_pixels, unpack_pixels
+
+
+class TestPixelEncoding(unittest.TestCase):
+    """Test class for pixel_encoding module"""
+
+    def setUp(self):
+        """Sample sparse pixels from a subcanvas, like generate_pixel_arrays does"""
+        rng = np.random.default_rng(3)
+        linear = rng.choice(200 * 100, size=3000, replace=False)
+        self.xs = (linear % 200 + 40).astype(np.uint16)
+        self.ys = (linear // 200 + 70).astype(np.uint16)
+        self.palette_indices = rng.integers(0, 5, size=3000, dtype=np.uint8)
+
+    def assert_round_trip(self, packed, xs, ys, palette_indices):
+        """Assert that packed pixels unpack to the given pixels, in any order"""
+        unpacked = unpack_pixels(packed, int(palette_indices.max(initial=0)) + 1)
+        self.assertEqual(
+            sorted(zip(*(array.tolist() for array in unpacked))),
+            sorted(zip(xs.tolist(), ys.tolist(), palette_indices.tolist())),
+        )
+
+    def test_every_packing_round_trips(self):
+        """Test that each scheme, with and without zlib, unpacks to the same pixels"""
+        packings = list(
+            pixel_encoding.generate_packings(self.xs, self.ys, self.palette_indices, 5)
+        )
+        self.assertEqual(
+            {pixel_encoding.get_scheme_name(packed.flags) for packed in packings},
+            {"delta", "delta+zlib", "runs", "runs+zlib", "bitmap", "bitmap+zlib"},
+        )
+        for packed in packings:
+            with self.subTest(scheme=pixel_encoding.get_scheme_name(packed.flags)):
+                self.assert_round_trip(packed, self.xs, self.ys, self.palette_indices)
+
+    def test_smallest_packing_wins(self):
+        """Test that pack_pixels picks the smallest packing and beats raw arrays"""
+        packed = pack_pixels(self.xs, self.ys, self.palette_indices, 5)
+        self.assertEqual(
+            pixel_encoding.get_packed_size(packed),
+            min(
+                map(
+                    pixel_encoding.get_packed_size,
+                    pixel_encoding.generate_packings(
+                        self.xs, self.ys, self.palette_indices, 5
+                    ),
+                )
+            ),
+        )
+        raw_size = self.xs.nbytes + self.ys.nbytes + self.palette_indices.nbytes
+        self.assertLess(pixel_encoding.get_packed_size(packed), raw_size / 3)
+
+    def test_dense_rectangle_uses_runs(self):
+        """Test that a filled rectangle of one color packs to a handful of bytes"""
+        ys, xs = np.mgrid[10:60, 20:120]
+        xs, ys = xs.ravel(), ys.ravel()
+        palette_indices = np.zeros(len(xs), dtype=np.uint8)
+        packed = pack_pixels(xs, ys, palette_indices, 1)
+        self.assertLess(pixel_encoding.get_packed_size(packed), 32)
+        self.assert_round_trip(packed, xs, ys, palette_indices)
+
+    def test_shared_coordinates_use_deltas(self):
+        """Test that pixels sharing coordinates survive, packed as deltas"""
+        xs = np.array([3, 3, 4, 9])
+        ys = np.array([1, 1, 1, 2])
+        palette_indices = np.array([0, 1, 2, 1])
+        packings = list(pixel_encoding.generate_packings(xs, ys, palette_indices, 3))
+        self.assertTrue(
+            all(
+                packed.flags & pixel_encoding.SCHEME_MASK == pixel_encoding.DELTA
+                for packed in packings
+            )
+        )
+        self.assert_round_trip(
+            pack_pixels(xs, ys, palette_indices, 3), xs, ys, palette_indices
+        )
+
+    def test_empty(self):
+        """Test that no pixels pack and unpack"""
+        empty = np.zeros(0, dtype=np.uint8)
+        packed = pack_pixels(empty, empty, empty, 1)
+        self.assertEqual(packed.count, 0)
+        self.assertTrue(all(len(array) == 0 for array in unpack_pixels(packed, 1)))
+
+    def test_index_bits(self):
+        """Test that palette indices pack into as few bits as the palette needs"""
+        rng = np.random.default_rng(5)
+        for palette_size, bits in (
+            (1, 1),
+            (2, 1),
+            (3, 2),
+            (16, 4),
+            (200, 8),
+            (300, 16),
+        ):
+            with self.subTest(palette_size=palette_size):
+                self.assertEqual(pixel_encoding.get_index_bits(palette_size), bits)
+                indices = rng.integers(0, palette_size, size=37)
+                packed = pixel_encoding.pack_indices(indices, bits)
+                self.assertEqual(len(packed), -(-37 * bits // 8))
+                self.assertEqual(
+                    pixel_encoding.unpack_indices(packed, bits, 37).tolist(),
+                    indices.tolist(),
+                )
+
+    def test_invalid_packings(self):
+        """Test that inconsistent packed pixels are rejected with a ValueError"""
+        packed = pack_pixels(self.xs, self.ys, self.palette_indices, 5)
+        delta = next(
+            pixel_encoding.generate_packings(self.xs, self.ys, self.palette_indices, 5)
+        )
+        for invalid, palette_size in (
+            (packed, 2),
+            (packed._replace(flags=pixel_encoding.SCHEME_MASK), 5),
+            (packed._replace(count=packed.count + 1), 5),
+            (delta._replace(width=1, height=1), 5),
+            (delta._replace(flags=delta.flags | pixel_encoding.ZLIB), 5),
+            (
+                delta._replace(
+                    flags=delta.flags | pixel_encoding.ZLIB,
+                    coordinates=zlib.compress(bytes(10**6)),
+                ),
+                5,
+            ),
+            (PackedPixels(pixel_encoding.BITMAP, 0, 0, 10**6, 10**6, 1, b"", b""), 1),
+        ):
+            with self.assertRaises(ValueError):
+                unpack_pixels(invalid, palette_size)
+
+    def test_wrapping_deltas(self):
+        """Test that deltas wrapping around out of bounds between in-bounds ends are rejected"""
+        deltas = np.array([1, 2**63, 2**63], dtype="<u8").tobytes()
+        flags = pixel_encoding.DELTA | 3 << pixel_encoding.LINEAR_TYPE_SHIFT
+        with self.assertRaises(ValueError):
+            unpack_pixels(PackedPixels(flags, 0, 0, 10, 10, 3, deltas, b"\x00"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
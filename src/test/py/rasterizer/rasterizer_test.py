@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Simple Test Module for the rasterizer module
+"""
+
+import unittest
+from PIL import Image, ImageDraw
+from drawing.drawing import Color, Coordinates, Ellipse, Line, Polyline, Rectangle
+from drawing.rasterizer import draw_primitives
+
+
+class TestRasterizer(unittest.TestCase):
+    """Test class for rasterizer module"""
+
+    def setUp(self):
+        """Create an empty canvas and a color to draw with"""
+        self.canvas = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+        self.color = Color(1, 2, 3)
+
+    def painted(self):
+        """Returns the set of coordinates of the canvas that were painted"""
+        pixels = self.canvas.load()
+        return {
+            (x, y)
+            for x in range(self.canvas.width)
+            for y in range(self.canvas.height)
+            if pixels[x, y] == self.color
+        }
+
+    def test_draw_rectangle(self):
+        """Test that a rectangle fills its bounds, inclusive of both corners"""
+        rectangle = Rectangle(Coordinates(2, 3), Coordinates(4, 7), self.color)
+        draw_primitives(self.canvas, [rectangle])
+        expected = {(x, y) for x in range(2, 5) for y in range(3, 8)}
+        self.assertEqual(self.painted(), expected)
+
+    def test_draw_ellipse(self):
+        """Test that an ellipse stays within its bounding box"""
+        ellipse = Ellipse(Coordinates(1, 1), Coordinates(8, 6), self.color)
+        draw_primitives(self.canvas, [ellipse])
+        painted = self.painted()
+        self.assertIn((4, 3), painted)
+        self.assertNotIn((1, 1), painted)
+        for x, y in painted:
+            self.assertTrue(1 <= x <= 8 and 1 <= y <= 6)
+
+    def test_draw_line(self):
+        """Test that a line paints its end points"""
+        line = Line(Coordinates(0, 0), Coordinates(9, 0), self.color, 1)
+        draw_primitives(self.canvas, [line])
+        self.assertEqual(self.painted(), {(x, 0) for x in range(10)})
+
+    def test_draw_polyline(self):
+        """Test that a polyline paints every segment"""
+        polyline = Polyline(
+            (Coordinates(0, 0), Coordinates(0, 5), Coordinates(5, 5)), self.color, 1
+        )
+        draw_primitives(self.canvas, [polyline])
+        expected = {(0, y) for y in range(6)} | {(x, 5) for x in range(6)}
+        self.assertEqual(self.painted(), expected)
+
+    def test_draw_polyline_square_joint(self):
+        """Test that a wide polyline is drawn with square rather than rounded joints"""
+        canvas = Image.new("RGBA", (40, 40), (0, 0, 0, 0))
+        polyline = Polyline(
+            (Coordinates(5, 20), Coordinates(20, 5), Coordinates(35, 20)), self.color, 9
+        )
+        expected = Image.new("RGBA", (40, 40), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(expected)
+        draw.line([(5, 20), (20, 5), (35, 20)], fill=tuple(self.color), width=9)
+        draw_primitives(canvas, [polyline])
+        self.assertEqual(canvas.tobytes(), expected.tobytes())
+
+    def test_draw_unknown(self):
+        """Test that drawing something other than a primitive raises a TypeError"""
+        with self.assertRaises(TypeError):
+            draw_primitives(self.canvas, [Coordinates(0, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
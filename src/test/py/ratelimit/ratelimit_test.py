@@ -0,0 +1,136 @@
+"""
+Test Module for the ratelimit module
+"""
+
+import os
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from kademlia.node import Node
+from server.protocol import TRANSFER, NotificationProtocol
+from server.ratelimit import RateLimit, RateLimiter
+from server.storage import MemoryStorage
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test class for RateLimiter class"""
+
+    def setUp(self):
+        """Create a limiter with a clock the tests control"""
+        self.now = 0
+        self.limiter = RateLimiter(
+            {"fragment": RateLimit(1, 2)}, maxsize=2, clock=lambda: self.now
+        )
+
+    def test_burst_and_refill(self):
+        """Test that a sender may store a burst, then only at the rate"""
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertFalse(self.limiter.allow(b"a", "fragment"))
+        self.now = 1
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertFalse(self.limiter.allow(b"a", "fragment"))
+        self.now = 10
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertFalse(self.limiter.allow(b"a", "fragment"))
+
+    def test_senders_and_kinds_apart(self):
+        """Test that each sender has its own bucket, and other kinds are not limited"""
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertTrue(self.limiter.allow(b"a", "fragment"))
+        self.assertTrue(self.limiter.allow(b"b", "fragment"))
+        for _ in range(10):
+            self.assertTrue(self.limiter.allow(b"a", "artwork"))
+
+    def test_default(self):
+        """Test that values of other kinds follow the default limit"""
+        limiter = RateLimiter(default=RateLimit(0, 1))
+        self.assertTrue(limiter.allow(b"a", "artwork"))
+        self.assertFalse(limiter.allow(b"a", "artwork"))
+        self.assertTrue(limiter.allow(b"a", None))
+
+    def test_stats(self):
+        """Test that values allowed and rejected are counted by kind"""
+        for _ in range(3):
+            self.limiter.allow(b"a", "fragment")
+        self.limiter.allow(b"b", "artwork")
+        self.assertEqual(
+            self.limiter.get_stats(),
+            {
+                "senders": 1,
+                "allowed": {"fragment": 2, "artwork": 1},
+                "rejected": {"fragment": 1},
+            },
+        )
+
+    def test_maxsize(self):
+        """Test that the least recently used senders are forgotten"""
+        for sender in (b"a", b"b", b"c"):
+            self.limiter.allow(sender, "fragment")
+        self.assertEqual(self.limiter.get_stats()["senders"], 2)
+        self.assertNotIn((b"a", "fragment"), self.limiter.buckets)
+
+
+class TestRateLimitedProtocol(unittest.IsolatedAsyncioTestCase):
+    """Test class for rate limiting the values stored on a NotificationProtocol"""
+
+    async def asyncSetUp(self):
+        """Create a protocol limiting values of kind 1 and transfers to one per sender"""
+        self.ingest = MagicMock()
+        self.ingest.put.return_value = True
+        self.protocol = NotificationProtocol(
+            Node(os.urandom(20)),
+            MemoryStorage(),
+            20,
+            AsyncMock(),
+            gossip_ttl=3,
+            ingest=self.ingest,
+            rate_limiter=RateLimiter({1: RateLimit(0, 1), TRANSFER: RateLimit(0, 1)}),
+            classify_value=lambda value: value[0],
+        )
+        self.protocol.connection_made(MagicMock())
+        self.sender = ("127.0.0.1", 8468)
+        self.node_id = os.urandom(20)
+
+    async def test_rpc_store(self):
+        """Test that stores beyond a sender's limit are neither stored nor passed on"""
+        protocol, sender, node_id = self.protocol, self.sender, self.node_id
+        self.assertTrue(protocol.rpc_store(sender, node_id, b"a", b"\x01a"))
+        self.assertFalse(protocol.rpc_store(sender, node_id, b"b", b"\x01b"))
+        self.assertFalse(protocol.rpc_deliver(sender, node_id, b"c", b"\x01c"))
+        self.assertTrue(protocol.rpc_store(sender, node_id, b"d", b"\x02d"))
+        self.assertTrue(protocol.rpc_store(sender, os.urandom(20), b"e", b"\x01e"))
+
+        self.assertIsNone(protocol.storage.get(b"b"))
+        self.assertEqual(self.ingest.put.call_count, 3)
+        self.assertEqual(protocol.rate_limiter.get_stats()["rejected"], {1: 2})
+
+    async def test_rpc_gossip(self):
+        """Test that gossip counts against the same limit as stores"""
+        protocol, sender, node_id = self.protocol, self.sender, self.node_id
+        self.assertTrue(protocol.rpc_store(sender, node_id, b"a", b"\x01a"))
+        self.assertFalse(protocol.rpc_gossip(sender, node_id, b"b", b"\x01b", 0))
+        self.assertEqual(self.ingest.put.call_count, 1)
+
+    async def test_rpc_gossip_ttl(self):
+        """Test that gossip with a malformed ttl is rejected, and a large one is capped"""
+        protocol, sender, node_id = self.protocol, self.sender, self.node_id
+        self.assertFalse(protocol.rpc_gossip(sender, node_id, b"a", b"\x02a", "1"))
+        self.assertFalse(protocol.rpc_gossip(sender, node_id, b"a", b"\x02a", None))
+        protocol.spread_gossip = MagicMock(return_value=[])
+        self.assertTrue(protocol.rpc_gossip(sender, node_id, b"a", b"\x02a", 1000))
+        self.assertEqual(protocol.spread_gossip.call_args.args[2], 1)
+
+    async def test_manifest(self):
+        """Test that starting a chunked transfer counts against the sender's limit"""
+        protocol, sender, node_id = self.protocol, self.sender, self.node_id
+        manifest = (b"key", 100, 1, bytes(20))
+        self.assertTrue(protocol.rpc_store_manifest(sender, node_id, b"1", *manifest))
+        self.assertFalse(
+            protocol.rpc_deliver_manifest(sender, node_id, b"2", *manifest)
+        )
+        self.assertEqual(len(protocol.reassembler.transfers), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
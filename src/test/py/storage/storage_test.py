@@ -0,0 +1,109 @@
+"""
+Test Module for the storage module
+"""
+
+import os
+import tempfile
+import unittest
+from server.network import NotifyingServer
+from server.storage import MemoryStorage, SqliteStorage
+
+
+class TestSqliteStorage(unittest.TestCase):
+    """Test class for storage module"""
+
+    def setUp(self):
+        """Create a storage with a clock the tests control"""
+        self.now = 1000.0
+        self.storage = SqliteStorage(ttl=100, clock=lambda: self.now)
+        self.addCleanup(self.storage.close)
+
+    def test_set_and_get(self):
+        """Test that values come back with the type they were set with"""
+        self.storage[b"bytes"] = b"\x00\x01"
+        self.storage[b"text"] = "text"
+        self.storage[b"number"] = 42
+        self.assertEqual(self.storage[b"bytes"], b"\x00\x01")
+        self.assertEqual(self.storage.get(b"text"), "text")
+        self.assertEqual(self.storage.get(b"number"), 42)
+        self.assertIsNone(self.storage.get(b"missing"))
+        with self.assertRaises(KeyError):
+            _ = self.storage[b"missing"]
+
+    def test_delete(self):
+        """Test that deleted values are gone, and deleting a missing one raises KeyError"""
+        for storage in (self.storage, MemoryStorage()):
+            storage[b"key"] = b"value"
+            del storage[b"key"]
+            self.assertIsNone(storage.get(b"key"))
+            with self.assertRaises(KeyError):
+                del storage[b"key"]
+
+    def test_expiry(self):
+        """Test that values expire a ttl after they were last set"""
+        self.storage[b"old"] = b"old"
+        self.now += 60
+        self.storage[b"new"] = b"new"
+        self.now += 50
+        self.assertIsNone(self.storage.get(b"old"))
+        self.assertEqual(self.storage.get(b"new"), b"new")
+        self.assertEqual(list(self.storage), [(b"new", b"new")])
+        self.assertEqual(len(self.storage), 1)
+
+    def test_iter_older_than(self):
+        """Test that iter_older_than yields the values set long enough ago, oldest first"""
+        for key in (b"first", b"second", b"third"):
+            self.storage[key] = key
+            self.now += 10
+        self.storage[b"first"] = b"again"
+        self.assertEqual(
+            list(self.storage.iter_older_than(5)),
+            [(b"second", b"second"), (b"third", b"third")],
+        )
+        self.assertEqual(
+            list(self.storage.iter_older_than(0))[-1], (b"first", b"again")
+        )
+
+    def test_set_while_iterating(self):
+        """Test that values can be set again while iterating, as republishing does"""
+        for key in (b"first", b"second"):
+            self.storage[key] = key
+        self.now += 10
+        for key, value in self.storage.iter_older_than(5):
+            self.storage[key] = value
+        self.assertEqual(list(self.storage.iter_older_than(5)), [])
+        self.assertEqual(len(self.storage), 2)
+
+    def test_survives_restart(self):
+        """Test that values in a database file are there after reopening it"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "storage.db")
+            storage = SqliteStorage(path)
+            storage[b"key"] = b"value"
+            storage.close()
+            storage = SqliteStorage(path)
+            self.assertEqual(storage.get(b"key"), b"value")
+            storage.close()
+
+
+class TestServerStorage(unittest.IsolatedAsyncioTestCase):
+    """Test class for NotifyingServer with SqliteStorage"""
+
+    async def test_server_stores_in_storage(self):
+        """Test that a server keeps the values set on it in the storage it is given"""
+
+        async def callback(*_):
+            pass
+
+        storage = SqliteStorage()
+        server = NotifyingServer(callback, storage=storage)
+        await server.listen(0, interface="127.0.0.1")
+        port = server.transport.get_extra_info("sockname")[1]
+        other = NotifyingServer(callback)
+        await other.listen(0, interface="127.0.0.1")
+        await other.bootstrap([("127.0.0.1", port)])
+        self.assertTrue(await other.set("key", b"value"))
+        self.assertEqual(len(storage), 1)
+        self.assertEqual(await server.get("key"), b"value")
+        other.stop()
+        server.stop()
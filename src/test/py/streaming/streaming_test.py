@@ -0,0 +1,196 @@
+"""
+Test Module for the streaming module
+"""
+
+import asyncio
+from hashlib import sha1
+import os
+import time
+import unittest
+from unittest.mock import AsyncMock
+from server.network import NotifyingServer
+from server.streaming import (
+    BULK_TTL,
+    BulkPointer,
+    BulkStore,
+    encode_pointer,
+    fetch_bulk,
+    read_pointer,
+    serve_bulk,
+)
+
+
+class TestBulkPointer(unittest.TestCase):
+    """Test class for pointers to bulk values"""
+
+    def test_round_trip(self):
+        """Test that an encoded pointer reads back the same"""
+        pointer = BulkPointer(sha1(b"value").digest(), 5, "127.0.0.1", 8468, 1)
+        self.assertEqual(read_pointer(encode_pointer(pointer)), pointer)
+
+    def test_not_a_pointer(self):
+        """Test that other values are not read as pointers"""
+        self.assertIsNone(read_pointer(b"value"))
+        self.assertIsNone(read_pointer("value"))
+        self.assertIsNone(
+            read_pointer(encode_pointer(BulkPointer(b"", 5, "", 1, None))[:-1])
+        )
+        self.assertIsNone(read_pointer(encode_pointer(BulkPointer("", 5, "", 1, None))))
+
+
+class TestBulkStore(unittest.TestCase):
+    """Test class for BulkStore class"""
+
+    def setUp(self):
+        """Create a store with a clock the tests control"""
+        self.now = 0
+        self.store = BulkStore(ttl=10, max_size=10, clock=lambda: self.now)
+
+    def test_add(self):
+        """Test that values are held by their digest"""
+        digest = self.store.add(b"value")
+        self.assertEqual(digest, sha1(b"value").digest())
+        self.assertEqual(self.store.get(digest), b"value")
+        self.store.remove(digest)
+        self.assertIsNone(self.store.get(digest))
+        self.assertEqual(self.store.size, 0)
+
+    def test_ttl(self):
+        """Test that values are dropped a ttl after they were added"""
+        digest = self.store.add(b"value")
+        self.now = 10
+        self.assertIsNone(self.store.get(digest))
+
+    def test_max_size(self):
+        """Test that the oldest values are dropped beyond max_size"""
+        oldest = self.store.add(b"first")
+        newest = self.store.add(b"second")
+        self.assertIsNone(self.store.get(oldest))
+        self.assertEqual(self.store.get(newest), b"second")
+        self.assertEqual(self.store.size, 6)
+
+
+class TestStreams(unittest.IsolatedAsyncioTestCase):
+    """Test class for serving and fetching bulk values"""
+
+    async def asyncSetUp(self):
+        """Serve a store on a free port"""
+        self.store = BulkStore()
+        self.server = await asyncio.start_server(
+            lambda reader, writer: serve_bulk(self.store, reader, writer),
+            "127.0.0.1",
+            0,
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        """Stop serving"""
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_fetch(self):
+        """Test that a value is fetched whole"""
+        value = os.urandom(300 * 1024)
+        digest = self.store.add(value)
+        pointer = BulkPointer(digest, len(value), "127.0.0.1", self.port, None)
+        self.assertEqual(await fetch_bulk(pointer), value)
+
+    async def test_fetch_missing(self):
+        """Test that values the node does not hold, or that do not match, are not fetched"""
+        digest = sha1(b"value").digest()
+        self.assertIsNone(
+            await fetch_bulk(BulkPointer(digest, 5, "127.0.0.1", self.port, None))
+        )
+        self.store.add(b"value")
+        self.assertIsNone(
+            await fetch_bulk(BulkPointer(digest, 4, "127.0.0.1", self.port, None))
+        )
+
+    async def test_fetch_unreachable(self):
+        """Test that a value is not fetched from a node that is not listening"""
+        self.server.close()
+        await self.server.wait_closed()
+        pointer = BulkPointer(sha1(b"value").digest(), 5, "127.0.0.1", self.port, None)
+        self.assertIsNone(await fetch_bulk(pointer))
+
+
+class TestBulkValues(unittest.IsolatedAsyncioTestCase):
+    """Test class for setting bulk values between NotifyingServers"""
+
+    async def start_node(self, port=None, **kwargs):
+        """Start a server, bootstrapped off the one on port if there is one"""
+        callback = AsyncMock()
+        node = NotifyingServer(callback, **kwargs)
+        await node.listen(0, interface="127.0.0.1")
+        self.addCleanup(node.stop)
+        if port is not None:
+            await node.bootstrap([("127.0.0.1", port)])
+        return node, callback
+
+    async def asyncSetUp(self):
+        """Start two servers, the second bootstrapped off the first"""
+        self.first, self.first_callback = await self.start_node(
+            classify_value=lambda value: value[0]
+        )
+        self.port = self.first.transport.get_extra_info("sockname")[1]
+        self.second, _ = await self.start_node(
+            self.port, classify_value=lambda value: value[0]
+        )
+
+    async def test_set(self):
+        """Test that a bulk value is pulled over a stream, and stored whole"""
+        value = os.urandom(1024 * 1024)
+        self.assertTrue(await self.second.set("artwork", value))
+        await asyncio.sleep(0.2)
+
+        key = sha1(b"artwork").digest()
+        self.first_callback.assert_called_once_with(key, value)
+        self.assertEqual(self.first.storage.get(key), value)
+        self.assertEqual(await self.first.get("artwork"), value)
+
+    async def test_get_after_bulk_ttl(self):
+        """Test that a bulk value is still served once its sender stopped holding it"""
+        value = os.urandom(1024 * 1024)
+        self.assertTrue(await self.second.set("artwork", value))
+        await asyncio.sleep(0.2)
+        now = time.monotonic() + BULK_TTL + 1
+        for node in (self.first, self.second):
+            node.bulk_store.clock = lambda: now
+            node.bulk_store.expire()
+        self.assertEqual(self.second.bulk_store.values, {})
+
+        third, _ = await self.start_node(self.port)
+        await asyncio.sleep(0.2)
+        self.assertEqual(await third.get("artwork"), value)
+
+    async def test_pointer_kind(self):
+        """Test that a pointer carries the kind of its value"""
+        value = bytes([7]) + os.urandom(1024 * 1024)
+        self.second.protocol.classify_value = lambda value: value[0]
+        pointer = read_pointer(self.second.protocol.publish_bulk(value))
+        self.assertEqual(pointer.kind, 7)
+        self.assertEqual(self.second.protocol.classify(encode_pointer(pointer)), 7)
+
+    async def test_get_datagram_sized_value(self):
+        """Test that a value too large for a single datagram is served through a pointer"""
+        value = os.urandom(64 * 1024 - 1)
+        self.assertTrue(await self.second.set("artwork", value))
+        await asyncio.sleep(0.2)
+        key = sha1(b"artwork").digest()
+        self.assertEqual(self.first.storage.get(key), value)
+
+        third, _ = await self.start_node(self.port)
+        await asyncio.sleep(0.2)
+        self.assertEqual(await third.get("artwork"), value)
+
+    async def test_small_values_inline(self):
+        """Test that values below the threshold are sent as they are"""
+        self.assertEqual(self.second.protocol.publish_bulk(b"value"), b"value")
+        self.assertTrue(await self.second.set("artwork", b"value"))
+        await asyncio.sleep(0.1)
+        key = sha1(b"artwork").digest()
+        self.assertEqual(self.first.storage.get(key), b"value")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Test Module for the sync module
+"""
+
+import asyncio
+from hashlib import sha1
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+from server.network import NotifyingServer
+from server.sync import KEY_DIGITS, MAX_LEAF_KEYS, MerkleIndex
+
+
+class TestMerkleIndex(unittest.TestCase):
+    """Test class for sync module"""
+
+    def setUp(self):
+        """Fill two indexes with the same values, but one"""
+        self.values = [os.urandom(32) for _ in range(200)]
+        self.full = MerkleIndex()
+        self.partial = MerkleIndex()
+        for value in self.values:
+            self.full.add(b"artwork", value)
+        for value in reversed(self.values[1:]):
+            self.partial.add(b"artwork", value)
+
+    def test_add(self):
+        """Test that values are keyed by their digest, and added once"""
+        key = self.full.add(b"artwork", self.values[0])
+        self.assertEqual(key, sha1(self.values[0]).digest())
+        self.assertEqual(self.full.get(b"artwork", key), self.values[0])
+        self.assertEqual(len(self.full.get_keys(b"artwork")), 200)
+        self.assertIsNone(self.full.get(b"other", key))
+
+    def test_hashes(self):
+        """Test that subtrees holding the same keys hash the same, whatever the order"""
+        missing = sha1(self.values[0]).hexdigest()
+        self.assertNotEqual(
+            self.full.get_hash(b"artwork"), self.partial.get_hash(b"artwork")
+        )
+        self.assertNotEqual(
+            self.full.get_hash(b"artwork", missing[0]),
+            self.partial.get_hash(b"artwork", missing[0]),
+        )
+        other = next(digit for digit in "0123456789abcdef" if digit != missing[0])
+        self.assertEqual(
+            self.full.get_hash(b"artwork", other),
+            self.partial.get_hash(b"artwork", other),
+        )
+        self.partial.add(b"artwork", self.values[0])
+        self.assertEqual(
+            self.full.get_hash(b"artwork"), self.partial.get_hash(b"artwork")
+        )
+        self.assertEqual(self.full.get_hash(b"empty"), b"")
+
+    def test_reconcile(self):
+        """Test that descending into differing subtrees finds exactly the missing key"""
+        missing, prefixes, rounds = [], [""], 0
+        while prefixes:
+            rounds += 1
+            next_prefixes = []
+            for prefix in prefixes:
+                summary = self.full.summarize(b"artwork", prefix)
+                keys, differing = self.partial.find_missing(b"artwork", prefix, summary)
+                missing.extend(keys)
+                next_prefixes.extend(differing)
+            self.assertLessEqual(len(next_prefixes), 1)
+            prefixes = next_prefixes
+        self.assertEqual(missing, [sha1(self.values[0]).digest()])
+        self.assertLessEqual(rounds, 3)
+
+    def test_malformed_summary(self):
+        """Test that summaries not shaped as summarize gives are rejected"""
+        for summary in (
+            None,
+            {},
+            {"keys": [1]},
+            {"keys": [b"short"]},
+            {"hashes": [b""] * 15},
+            {"hashes": [None] * 16},
+            {"keys": [], "hashes": [b""] * 16},
+        ):
+            with self.assertRaises(ValueError):
+                self.full.find_missing(b"artwork", "", summary)
+
+    def test_no_descent_past_key_length(self):
+        """Test that subtrees are not compared below the length of a key"""
+        summary = {"hashes": [b"differs"] * 16}
+        self.assertEqual(len(self.full.find_missing(b"artwork", "a", summary)[1]), 16)
+        self.assertEqual(
+            self.full.find_missing(b"artwork", "a" * KEY_DIGITS, summary), ([], [])
+        )
+
+    def test_summarize_leaf(self):
+        """Test that small subtrees are summarised by their keys"""
+        index = MerkleIndex()
+        for value in self.values[:MAX_LEAF_KEYS]:
+            index.add(b"artwork", value)
+        summary = index.summarize(b"artwork")
+        self.assertEqual(len(summary["keys"]), MAX_LEAF_KEYS)
+        self.assertEqual(len(self.full.summarize(b"artwork")["hashes"]), 16)
+
+    def test_max_groups(self):
+        """Test that the group least recently added to is dropped first"""
+        index = MerkleIndex(max_groups=2)
+        for group in (b"a", b"b", b"a", b"c"):
+            index.add(group, group)
+        self.assertIsNone(index.get(b"b", sha1(b"b").digest()))
+        self.assertIsNotNone(index.get(b"a", sha1(b"a").digest()))
+        index.discard(b"a")
+        self.assertIsNone(index.get(b"a", sha1(b"a").digest()))
+
+
+class TestSyncWith(unittest.IsolatedAsyncioTestCase):
+    """Test class for reconciling values between NotifyingServers"""
+
+    async def test_sync_with(self):
+        """Test that a node gets delivered only the values it lacks"""
+        received = []
+        done = asyncio.Event()
+
+        async def callback(_, value):
+            received.append(value)
+            if len(received) == 3:
+                done.set()
+
+        nodes = [NotifyingServer(AsyncMock()), NotifyingServer(callback)]
+        for node in nodes:
+            await node.listen(0, interface="127.0.0.1")
+            self.addCleanup(node.stop)
+        port = nodes[0].transport.get_extra_info("sockname")[1]
+        await nodes[1].join([("127.0.0.1", port)])
+
+        values = [os.urandom(64) for _ in range(300)]
+        for value in values:
+            nodes[0].add_to_sync(b"artwork", value)
+        for value in values[3:]:
+            nodes[1].add_to_sync(b"artwork", value)
+
+        self.assertEqual(await nodes[1].sync_with(nodes[0].node.id, b"artwork"), 3)
+        await asyncio.wait_for(done.wait(), 5)
+        self.assertEqual(sorted(received), sorted(values[:3]))
+        self.assertEqual(await nodes[1].sync_with(nodes[0].node.id, b"other"), 0)
+        self.assertIsNone(await nodes[1].sync_with(bytes(20), b"artwork"))
+
+    async def test_reconcile_bounded(self):
+        """Test that a node answering with hashes that always differ cannot make it go deep"""
+        node = NotifyingServer(AsyncMock())
+        await node.listen(0, interface="127.0.0.1")
+        self.addCleanup(node.stop)
+        calls = []
+
+        async def call_timed(_node, _name, _group, prefix):
+            calls.append(prefix)
+            return True, {"hashes": [b"differs"] * 16}
+
+        node.protocol.call_timed = call_timed
+        with patch("server.protocol.MAX_SYNC_PREFIXES", 4):
+            self.assertEqual(await node.protocol.reconcile(None, b"artwork"), [])
+        self.assertLessEqual(len(calls), 1 + KEY_DIGITS * 4)
+        self.assertLessEqual(max(len(prefix) for prefix in calls), KEY_DIGITS)
+
+    async def test_reconcile_malformed(self):
+        """Test that a malformed summary ends reconciling without raising"""
+        node = NotifyingServer(AsyncMock())
+        await node.listen(0, interface="127.0.0.1")
+        self.addCleanup(node.stop)
+        for summary in ({"keys": [42]}, {"other": []}, None):
+            node.protocol.call_timed = AsyncMock(return_value=(True, summary))
+            self.assertIsNone(await node.protocol.reconcile(None, b"artwork"))
+        self.assertIsNone(
+            node.protocol.rpc_sync_summary(("127.0.0.1", 1), bytes(20), b"a", 7)
+        )
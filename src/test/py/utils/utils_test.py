@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Test Module for the utils module
+"""
+
+import hashlib
+import unittest
+import utils
+
+
+class TestUtils(unittest.TestCase):
+    """Test class for utils module"""
+
+    def test_generate_content_key(self):
+        """Test that content keys are the SHA-1 hash of the payload"""
+        self.assertEqual(
+            utils.generate_content_key(b"payload"), hashlib.sha1(b"payload").digest()
+        )
+        self.assertEqual(
+            utils.generate_content_key(b"payload"),
+            utils.generate_content_key(b"payload"),
+        )
+        self.assertNotEqual(
+            utils.generate_content_key(b"payload"), utils.generate_content_key(b"other")
+        )
+
+    def test_seen_cache(self):
+        """Test that the cache reports repeats and forgets the least recently seen key"""
+        seen = utils.SeenCache(2)
+        self.assertTrue(seen.add("a"))
+        self.assertTrue(seen.add("b"))
+        self.assertFalse(seen.add("a"))
+        self.assertTrue(seen.add("c"))
+
+        self.assertEqual(2, len(seen))
+        self.assertIn("a", seen)
+        self.assertIn("c", seen)
+        self.assertNotIn("b", seen)
+        self.assertTrue(seen.add("b"))
+
+    def test_seen_cache_ttl(self):
+        """Test that the cache forgets keys not seen for ttl seconds, and counts repeats"""
+        now = [0.0]
+        seen = utils.SeenCache(10, ttl=5, clock=lambda: now[0])
+        self.assertTrue(seen.add("a"))
+        now[0] = 3
+        self.assertTrue(seen.add("b"))
+        self.assertFalse(seen.add("a"))
+        now[0] = 7
+        self.assertIn("a", seen)
+        now[0] = 8
+        self.assertNotIn("a", seen)
+        self.assertNotIn("b", seen)
+        self.assertTrue(seen.add("a"))
+        seen.discard("a")
+        self.assertTrue(seen.add("a"))
+        self.assertEqual(seen.get_stats(), {"size": 1, "hits": 1, "misses": 4})
+
+
+if __name__ == "__main__":
+    unittest.main()